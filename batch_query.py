@@ -0,0 +1,170 @@
+"""
+多数の時刻に対する次の電車をまとめて求めるバッチAPI
+
+時刻表の発車時刻を NumPy の配列にしておき、全ての問い合わせ時刻を
+searchsorted で一度に処理する (問い合わせごとの Python のループはない)
+結果は TimetableIndex.next_k を1件ずつ呼んだ場合と同じになる
+
+NumPy が必要 (このモジュールを使うときだけ読み込む)
+"""
+import numpy as np
+
+from delay_index import as_delay_index
+from timetable_index import SECONDS_PER_DAY, SERVICE_DAY_START_HOUR, format_service_seconds
+
+
+# ----------------------------------------------------------------------------
+# 時刻の変換
+# ----------------------------------------------------------------------------
+def to_service_seconds(times):
+    """
+    時刻の配列を (運行日の日付[datetime64[D]], 運行日0時からの経過秒[float64]) に変換する
+    times は datetime のシーケンスまたは datetime64 の配列 (タイムゾーンなし)
+    """
+    times = np.asarray(times, dtype="datetime64[us]")
+    # 4時より前は前日の運行日として扱う
+    service_date = (times - np.timedelta64(SERVICE_DAY_START_HOUR, "h")).astype("datetime64[D]")
+    seconds = (times - service_date) / np.timedelta64(1, "s")
+    return service_date, seconds
+
+
+# ----------------------------------------------------------------------------
+# バッチ用の時刻表
+# ----------------------------------------------------------------------------
+class BatchTimetable:
+    """
+    TimetableIndex の発車時刻を NumPy の列にしたもの
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.size = len(index)
+        self.seconds = np.asarray(index.minutes, dtype=np.int64) * 60
+
+    def delay_vector(self, delays=None):
+        """
+        遅延情報 (辞書 / DelayIndex) を時刻表の並び順の遅延秒数の配列に変換する
+        """
+        delays = as_delay_index(delays)
+        return np.fromiter(
+            (delays.lookup(entry.get("train_number")) for entry in self.index.entries),
+            dtype=np.int64, count=self.size,
+        )
+
+    def next_k(self, times, delays=None, k=3):
+        """
+        全ての問い合わせ時刻について、実際の発車時刻順に次のk本を求めて BatchResult で返す
+
+        delays は辞書 / DelayIndex、または時刻表の並び順の遅延秒数の配列 (遅延ベクトル)
+        """
+        service_date, now = to_service_seconds(times)
+        if isinstance(delays, np.ndarray):
+            delay = delays.astype(np.int64)
+            max_delay = max(0, int(delay.max(initial=0)))
+        else:
+            delays = as_delay_index(delays)
+            delay = self.delay_vector(delays)
+            max_delay = delays.max_delay
+
+        size = self.size
+        count = np.zeros(len(now), dtype=np.int64)
+        positions = np.full((len(now), max(k, 0)), -1, dtype=np.int64)
+        cycles = np.zeros_like(positions)
+        if k <= 0 or size == 0 or len(now) == 0:
+            return BatchResult(self, service_date, delay, positions, cycles, count)
+
+        # 当日分と翌運行日分を並べ、実際の発車時刻で安定ソートしておく
+        # (同時刻の場合は next_k の走査順と同じく 日 → 時刻表の位置 の順になる)
+        scheduled = np.concatenate((self.seconds, self.seconds + SECONDS_PER_DAY))
+        actual = scheduled + np.concatenate((delay, delay))
+        order = np.argsort(actual, kind="stable")
+        sorted_actual = actual[order]
+        sorted_position = order % size
+        sorted_cycle = order // size
+
+        # next_k と同じく、遅延を考慮して走査を始める位置より前の列車だけが翌日に回り込む
+        start = np.searchsorted(self.seconds, now - max_delay, side="left")
+        first = np.searchsorted(sorted_actual, now, side="right")
+
+        rows = np.arange(len(now))
+        width = k
+        while len(rows):
+            window = first[rows, None] + np.arange(width)
+            in_range = window < 2 * size
+            window = np.minimum(window, 2 * size - 1)
+            valid = in_range & ((sorted_cycle[window] == 0) |
+                                (sorted_position[window] < start[rows, None]))
+            found = valid.sum(axis=1)
+            done = (found >= k) | ~in_range[:, -1]
+
+            done_rows = rows[done]
+            picked = np.argsort(~valid[done], axis=1, kind="stable")[:, :k]
+            picked_index = np.take_along_axis(window[done], picked, axis=1)
+            picked_valid = np.take_along_axis(valid[done], picked, axis=1)
+            positions[done_rows] = np.where(picked_valid, sorted_position[picked_index], -1)
+            cycles[done_rows] = np.where(picked_valid, sorted_cycle[picked_index], 0)
+            count[done_rows] = np.minimum(found[done], k)
+
+            # 翌日分の列車が窓を埋めてしまった問い合わせだけ窓を広げてやり直す
+            rows = rows[~done]
+            width *= 2
+        return BatchResult(self, service_date, delay, positions, cycles, count)
+
+
+class BatchResult:
+    """
+    next_k の結果を (問い合わせ数, k) の配列で保持する
+
+    positions: 時刻表 (TimetableIndex.entries) 上の位置 (該当なしは -1)
+    scheduled / actual: 運行日0時からの予定・実際の発車秒
+    """
+
+    def __init__(self, table, service_date, delay, positions, cycles, count):
+        self.table = table
+        self.service_date = service_date
+        self.positions = positions
+        self.count = count
+        safe = np.maximum(positions, 0)
+        self.delay = np.where(positions >= 0, delay[safe] if len(delay) else 0, 0)
+        self.scheduled = np.where(
+            positions >= 0,
+            (table.seconds[safe] if table.size else 0) + cycles * SECONDS_PER_DAY, 0)
+        self.actual = self.scheduled + self.delay
+
+    def __len__(self):
+        return len(self.count)
+
+    def entries(self, i):
+        """
+        i 番目の問い合わせの結果を find_next_trains と同じ辞書のリストで返す
+        """
+        results = []
+        for j in range(self.count[i]):
+            entry_copy = self.table.index.entries[self.positions[i, j]].copy()
+            entry_copy['scheduled_time'] = format_service_seconds(self.scheduled[i, j])
+            entry_copy['actual_time'] = format_service_seconds(self.actual[i, j])
+            entry_copy['delay_minutes'] = int(self.delay[i, j]) // 60
+            results.append(entry_copy)
+        return results
+
+    def to_lists(self):
+        """
+        全ての問い合わせの結果を辞書のリストのリストで返す
+        """
+        return [self.entries(i) for i in range(len(self))]
+
+
+_batch_tables = {}
+
+
+def next_trains_batch(times, delays=None, k=3, index=None):
+    """
+    複数の時刻について次の電車k本をまとめて求める (既定は八王子駅・平日・上り)
+    """
+    if index is None:
+        from find_next_trains_hachioji import HACHIOJI_INDEX
+        index = HACHIOJI_INDEX
+    table = _batch_tables.get(id(index))
+    if table is None or table.index is not index:
+        table = _batch_tables[id(index)] = BatchTimetable(index)
+    return table.next_k(times, delays, k)
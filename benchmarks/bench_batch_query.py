@@ -0,0 +1,52 @@
+"""
+バッチAPI (next_trains_batch) のベンチマーク
+
+1日分に散らばった 10,000 件の時刻について、TimetableIndex.next_k を
+ループで呼ぶ場合と next_trains_batch で一度に求める場合を比較する
+
+    python benchmarks/bench_batch_query.py
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from batch_query import next_trains_batch
+from delay_index import DelayIndex
+from find_next_trains_hachioji import HACHIOJI_INDEX, HACHIOJI_TIMETABLE_UP_WEEKDAY
+
+QUERIES = 10_000
+
+
+def main():
+    rng = random.Random(0)
+    base = datetime(2025, 1, 27)
+    times = [base + timedelta(seconds=rng.randrange(24 * 60 * 60)) for _ in range(QUERIES)]
+    delays = DelayIndex({entry["train_number"]: rng.choice((0, 60, 180, 300))
+                         for entry in rng.sample(HACHIOJI_TIMETABLE_UP_WEEKDAY, 40)})
+    times64 = np.array(times, dtype="datetime64[us]")
+
+    started = time.perf_counter()
+    looped = [HACHIOJI_INDEX.next_k(now, 3, delays) for now in times]
+    looped_seconds = time.perf_counter() - started
+
+    next_trains_batch(times64[:10], delays)  # 列の準備を計測から除く
+    started = time.perf_counter()
+    batch = next_trains_batch(times64, delays)
+    batch_seconds = time.perf_counter() - started
+
+    identical = batch.to_lists() == looped
+    print(f"{QUERIES} 件の問い合わせ")
+    print(f"  ループ   : {looped_seconds * 1000:8.1f} ms")
+    print(f"  バッチ   : {batch_seconds * 1000:8.1f} ms ({looped_seconds / batch_seconds:.0f}倍)")
+    print(f"  結果一致 : {identical}")
+    sys.exit(0 if identical else 1)
+
+
+if __name__ == "__main__":
+    main()
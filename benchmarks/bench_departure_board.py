@@ -0,0 +1,194 @@
+"""
+分ごとの発車標 (departure_board) の検証とベンチマーク
+
+  - 全ての分 (0〜4時の前日の運行日への繰り込みを含む) と分の途中の秒について、
+    DepartureBoards.lookup が find_next_trains と同じ結果を返すか
+  - 遅延をランダムに変えながら update() で差分更新した表が、作り直した表と一致するか
+    (数万秒の遅延で k本目が翌運行日に回り込む場合を含む)
+  - 別のスレッドが update() している最中の lookup() が、更新前か更新後の
+    どちらか一方の遅延情報での結果を返すか (古い分と新しい分が混ざらないか)
+  - 全体の構築と差分更新にかかる時間、表のメモリ量
+を確かめる
+
+    python benchmarks/bench_departure_board.py
+"""
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from delay_index import DelayIndex
+from departure_board import DepartureBoards
+from find_next_trains_hachioji import (HACHIOJI_INDEX, HACHIOJI_TIMETABLE_UP_WEEKDAY,
+                                       find_next_trains)
+from train_state import AffectedEntries, TrainStateStore
+
+ROUNDS = 50
+DAY = datetime(2025, 1, 27)
+
+
+def check_all_minutes(boards, delays, rng):
+    """
+    1日の全ての分 (4:00〜翌3:59) の先頭と途中の秒で find_next_trains と比べ、不一致の数を返す
+    """
+    mismatches = 0
+    for minute in range(4 * 60, 28 * 60):
+        for second in (0, rng.randrange(1, 60)):
+            now = DAY + timedelta(minutes=minute, seconds=second)
+            if boards.lookup(now) != find_next_trains(now, HACHIOJI_TIMETABLE_UP_WEEKDAY, delays):
+                mismatches += 1
+    return mismatches
+
+
+def random_delays(rng, trains, whole_minutes=True):
+    delays = {}
+    for train_number in rng.sample(trains, rng.randrange(0, 15)):
+        delays[train_number] = rng.choice((0, 60, 120, 300, 600, 1800, 5400, -60))
+        if not whole_minutes and rng.random() < 0.3:
+            delays[train_number] += rng.randrange(1, 60)
+    return DelayIndex(delays)
+
+
+def check_large_delays(rng, trains, rounds=12):
+    """
+    数万秒の遅延 (深夜の k本目が翌運行日に回り込む) を少しずつ加えながら update() し、
+    作り直した表・find_next_trains と一致しなかった回数を返す
+    """
+    boards = DepartureBoards(HACHIOJI_INDEX, DelayIndex())
+    delays = {}
+    mismatches = 0
+    for round_number in range(rounds):
+        for train_number in rng.sample(trains, rng.randrange(1, 4)):
+            delays[train_number] = rng.choice((0, 60, rng.randrange(-600, 100_000),
+                                               rng.randrange(10_000, 80_000) // 60 * 60))
+        delay_index = DelayIndex(dict(delays))
+        boards.update(delay_index)
+        fresh = DepartureBoards(HACHIOJI_INDEX, delay_index)
+        if boards.boards != fresh.boards or boards.kth_actual != fresh.kth_actual:
+            mismatches += 1
+        if round_number % 4 == 3:
+            mismatches += check_all_minutes(boards, delay_index, random.Random(round_number))
+    return mismatches
+
+
+def check_concurrent_updates(rng, trains, rounds=200):
+    """
+    2つの遅延情報を交互に update() し続ける間に別のスレッドで lookup() し、
+    どちらの遅延情報での結果とも一致しなかった回数を返す
+    """
+    delay_sets = [random_delays(rng, trains, whole_minutes=False) for _ in range(2)]
+    times = [DAY + timedelta(seconds=rng.randrange(4 * 3600, 28 * 3600)) for _ in range(200)]
+    expected = [[HACHIOJI_INDEX.next_k(now, 3, delays) for now in times] for delays in delay_sets]
+    boards = DepartureBoards(HACHIOJI_INDEX, delay_sets[0])
+    done = threading.Event()
+    mismatches = 0
+
+    def update():
+        for round_number in range(rounds):
+            boards.update(delay_sets[(round_number + 1) % 2])
+        done.set()
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    try:
+        thread = threading.Thread(target=update)
+        thread.start()
+        while not done.is_set():
+            for i, now in enumerate(times):
+                if boards.lookup(now) not in (expected[0][i], expected[1][i]):
+                    mismatches += 1
+        thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    return mismatches
+
+
+def main():
+    rng = random.Random(0)
+    trains = [entry["train_number"] for entry in HACHIOJI_TIMETABLE_UP_WEEKDAY]
+    mismatches = 0
+
+    # 全体の構築
+    started = time.perf_counter()
+    boards = DepartureBoards(HACHIOJI_INDEX, DelayIndex())
+    build_seconds = time.perf_counter() - started
+    mismatches += check_all_minutes(boards, DelayIndex(), rng)
+
+    # 0〜4時は前日の運行日の終電・翌朝の始発に続く
+    for hour, minute in ((0, 0), (0, 30), (1, 15), (3, 59), (4, 0)):
+        now = datetime(2025, 1, 28, hour, minute)
+        if boards.lookup(now) != find_next_trains(now, HACHIOJI_TIMETABLE_UP_WEEKDAY, {}):
+            mismatches += 1
+
+    # 差分更新 (TrainStateStore の変更から影響する位置だけを比べる)
+    store = TrainStateStore()
+    affected = AffectedEntries(HACHIOJI_INDEX)
+    update_seconds = 0.0
+    rebuilt = 0
+    for round_number in range(ROUNDS):
+        delays = random_delays(rng, trains, whole_minutes=round_number % 5 != 4)
+        changes = store.apply(delays)
+        started = time.perf_counter()
+        rebuilt += boards.update(store.delays, affected.positions(changes))
+        update_seconds += time.perf_counter() - started
+
+        fresh = DepartureBoards(HACHIOJI_INDEX, store.delays)
+        if boards.boards != fresh.boards or boards.kth_actual != fresh.kth_actual:
+            mismatches += 1
+        if round_number % 10 == 0:
+            mismatches += check_all_minutes(boards, store.delays, rng)
+
+    # 1本の遅延が1分だけ変わる (30秒ごとの取得で最もよくある変化)
+    single_seconds = 0.0
+    single_rebuilt = 0
+    for _ in range(ROUNDS):
+        delays = dict(store.delays)
+        train_number = rng.choice(trains)
+        delays[train_number] = delays.get(train_number, 0) + 60
+        changes = store.apply(delays)
+        started = time.perf_counter()
+        single_rebuilt += boards.update(store.delays, affected.positions(changes))
+        single_seconds += time.perf_counter() - started
+    fresh = DepartureBoards(HACHIOJI_INDEX, store.delays)
+    if boards.boards != fresh.boards:
+        mismatches += 1
+
+    # 数万秒の遅延
+    # (この乱数の種では、深夜の k本目が単調でなくなる遅延の組み合わせが含まれる)
+    large_mismatches = check_large_delays(random.Random(5), trains)
+    mismatches += large_mismatches
+
+    # 更新中の問い合わせ
+    concurrent_mismatches = check_concurrent_updates(rng, trains)
+    mismatches += concurrent_mismatches
+
+    # 問い合わせの時間
+    times = [DAY + timedelta(seconds=rng.randrange(4 * 3600, 28 * 3600)) for _ in range(10_000)]
+    started = time.perf_counter()
+    for now in times:
+        boards.lookup(now)
+    lookup_seconds = (time.perf_counter() - started) / len(times)
+    started = time.perf_counter()
+    for now in times:
+        HACHIOJI_INDEX.next_k(now, 3, boards.delays)
+    next_k_seconds = (time.perf_counter() - started) / len(times)
+
+    print(f"表のメモリ量         : {boards.memory_bytes() / 1024:8.1f} KiB (1,440分 x {boards.k}本)")
+    print(f"全体の構築           : {build_seconds * 1000:8.2f} ms")
+    print(f"差分更新 (平均)      : {update_seconds / ROUNDS * 1000:8.2f} ms, "
+          f"{rebuilt / ROUNDS:.0f} 分を再計算 (最大15本・最大90分の変化)")
+    print(f"差分更新 (1本1分)    : {single_seconds / ROUNDS * 1000:8.2f} ms, "
+          f"{single_rebuilt / ROUNDS:.0f} 分を再計算")
+    print(f"lookup / next_k      : {lookup_seconds * 1e6:8.2f} µs / {next_k_seconds * 1e6:.2f} µs")
+    print(f"数万秒の遅延         : 不一致 {large_mismatches}")
+    print(f"更新中の問い合わせ   : 不一致 {concurrent_mismatches}")
+    print(f"不一致               : {mismatches}")
+    sys.exit(0 if mismatches == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
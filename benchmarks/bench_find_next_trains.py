@@ -0,0 +1,96 @@
+"""
+find_next_trains のベンチマーク
+
+時刻表を 1倍 / 10倍 / 100倍 に水増しし、従来の全件走査と
+コンパイル済みインデックス (二分探索) の1問い合わせあたりの時間を比較する
+水増しした分は翌日以降の時刻として並べるので、1分あたりの列車の密度は変わらず、
+時刻表の件数だけが増える (インデックスの時間は件数に比例して増えないはず)
+
+    python benchmarks/bench_find_next_trains.py
+"""
+import os
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hachioji_timetable import HACHIOJI_TIMETABLE_UP_WEEKDAY
+from delay_index import DelayIndex
+from timetable_index import compile_timetable, service_minute
+
+QUERIES = 200
+
+
+def legacy_find_next_trains(now, timetable, delays):
+    """
+    インデックス導入前の実装 (全件を strptime してソートする)
+    水増しした時刻表の24時以降の時刻 (翌日以降) は日数を足して扱う
+    """
+    next_trains = []
+    for entry in timetable:
+        hour, minute = entry["time"].split(":")
+        days, hour = divmod(int(hour), 24)
+        scheduled_time_str = f"{now.year}-{now.month}-{now.day} {hour}:{minute}"
+        scheduled_time = datetime.strptime(scheduled_time_str, "%Y-%m-%d %H:%M")
+        scheduled_time += timedelta(days=days)
+        if scheduled_time.hour < 4 and now.hour > 20 and not days:
+            scheduled_time += timedelta(days=1)
+        delay_seconds = delays.get(entry.get("train_number"), 0)
+        actual_time = scheduled_time + timedelta(seconds=delay_seconds)
+        if actual_time > now:
+            entry_copy = entry.copy()
+            entry_copy['scheduled_time'] = scheduled_time.strftime('%H:%M')
+            entry_copy['actual_time'] = actual_time.strftime('%H:%M')
+            entry_copy['delay_minutes'] = delay_seconds // 60
+            next_trains.append(entry_copy)
+    return sorted(next_trains, key=lambda x: x['actual_time'])[:3]
+
+
+def scaled_timetable(factor):
+    """
+    元の時刻表を factor 日ぶん並べた合成時刻表を作る
+    copy 日目の列車は運行日起点の分に copy 日ぶんを足した時刻 (24時以降の "HH:MM") にする
+    """
+    timetable = []
+    for copy in range(factor):
+        for entry in HACHIOJI_TIMETABLE_UP_WEEKDAY:
+            minute = service_minute(entry["time"]) + copy * 24 * 60
+            scaled = dict(entry, time=f"{minute // 60:02d}:{minute % 60:02d}")
+            scaled["train_number"] = f"{entry['train_number']}-{copy}"
+            timetable.append(scaled)
+    return timetable
+
+
+def main():
+    rng = random.Random(0)
+    base = datetime(2025, 1, 27)
+    queries = [base + timedelta(seconds=rng.randint(5 * 3600, 22 * 3600))
+               for _ in range(QUERIES)]
+
+    print(f"{'倍率':>6} {'件数':>8} {'従来 (µs/件)':>14} {'索引 (µs/件)':>14} {'索引 (対1倍)':>12}")
+    first = None
+    for factor in (1, 10, 100):
+        timetable = scaled_timetable(factor)
+        delays = {entry["train_number"]: 120
+                  for entry in rng.sample(timetable, min(30, len(timetable)))}
+        index = compile_timetable(timetable)
+        delay_index = DelayIndex(delays)
+
+        legacy = timeit.timeit(
+            lambda: [legacy_find_next_trains(now, timetable, delays) for now in queries],
+            number=1,
+        )
+        indexed = min(timeit.repeat(
+            lambda: [index.next_k(now, 3, delay_index) for now in queries],
+            number=5, repeat=3,
+        )) / 5
+        first = first or indexed
+        print(f"{factor:>6} {len(timetable):>8} "
+              f"{legacy / QUERIES * 1e6:>14.1f} {indexed / QUERIES * 1e6:>14.1f} "
+              f"{indexed / first:>11.2f}x")
+
+
+if __name__ == "__main__":
+    main()
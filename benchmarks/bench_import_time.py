@@ -0,0 +1,74 @@
+"""
+find_next_trains_hachioji の import 時間のベンチマーク
+
+`python -X importtime` でモジュールの累積 import 時間を測り、予算を超えた場合や
+requests / bs4 / dotenv を import 時に読み込んでいる場合、import 時に時刻表ファイルを
+開いている (コンパイルしている) 場合は終了コード 1 で終わる
+
+    python benchmarks/bench_import_time.py [予算ミリ秒]
+"""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULE = "find_next_trains_hachioji"
+# import 時に読み込んではいけない重い依存
+HEAVY_MODULES = ("requests", "bs4", "dotenv")
+# 初めて使うときに開く時刻表 (モジュール名, 開いたものを入れる変数)
+LAZY_TIMETABLES = (("find_next_trains_hachioji", "_hachioji_timetable"),
+                   ("bus_timetable", "_bus_index"))
+DEFAULT_BUDGET_MS = 50.0
+RUNS = 5
+
+
+def measure_import(module):
+    """
+    新しいプロセスで module を import し、
+    (累積時間ミリ秒, 読み込まれた重い依存と import 時に開いた時刻表) を返す
+    """
+    code = (
+        f"import sys, {module}; "
+        f"loaded = [m for m in {HEAVY_MODULES!r} if m in sys.modules]; "
+        f"loaded += [f'{{name}}.{{attr}}' for name, attr in {LAZY_TIMETABLES!r} "
+        f"if getattr(sys.modules.get(name), attr, None) is not None]; "
+        f"print(','.join(loaded))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    cumulative_us = None
+    for line in result.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            cumulative_us = int(fields[1])
+    loaded = [name for name in result.stdout.strip().split(",") if name]
+    return cumulative_us / 1000, loaded
+
+
+def main():
+    budget_ms = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BUDGET_MS
+    timings = []
+    loaded = []
+    for _ in range(RUNS):
+        elapsed_ms, loaded = measure_import(MODULE)
+        timings.append(elapsed_ms)
+    best_ms = min(timings)
+
+    print(f"{MODULE} の import 時間: {best_ms:.1f} ms (予算 {budget_ms:.1f} ms, {RUNS}回中最速)")
+    failed = False
+    if best_ms > budget_ms:
+        print("予算を超えています")
+        failed = True
+    if loaded:
+        print(f"import 時に重い依存・時刻表が読み込まれています: {', '.join(loaded)}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
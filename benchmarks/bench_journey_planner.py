@@ -0,0 +1,76 @@
+"""
+乗り継ぎ検索 (journey_planner) のベンチマーク
+
+キャンパス → 東京 について
+  - 接続の列の構築 (遅延情報が変わるたびに必要)
+  - 1日分のプロファイル (全出発時刻の最早到着) の計算
+  - 1日の全ての分 (1,440件) について earliest_arrival / latest_departure を個別に求める場合
+を計測し、プロファイルと個別の検索結果が一致することを確かめる
+
+    python benchmarks/bench_journey_planner.py
+"""
+import os
+import random
+import sys
+import time
+from bisect import bisect_left
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from delay_index import DelayIndex
+from find_next_trains_hachioji import HACHIOJI_INDEX, HACHIOJI_TIMETABLE_UP_WEEKDAY
+from journey_planner import JourneyPlanner
+from timetable_index import SERVICE_DAY_START_HOUR
+
+REPEAT = 20
+
+
+def main():
+    rng = random.Random(0)
+    delays = DelayIndex({entry["train_number"]: rng.choice((0, 60, 180, 300))
+                         for entry in rng.sample(HACHIOJI_TIMETABLE_UP_WEEKDAY, 40)})
+
+    started = time.perf_counter()
+    for _ in range(REPEAT):
+        planner = JourneyPlanner(HACHIOJI_INDEX, delays)
+    build_seconds = (time.perf_counter() - started) / REPEAT
+
+    started = time.perf_counter()
+    for _ in range(REPEAT):
+        planner._profile = None
+        profile = planner.profile()
+    profile_seconds = (time.perf_counter() - started) / REPEAT
+
+    minutes = range(SERVICE_DAY_START_HOUR * 60, (SERVICE_DAY_START_HOUR + 24) * 60)
+    started = time.perf_counter()
+    earliest = [planner._scan_earliest(minute * 60) for minute in minutes]
+    earliest_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    latest = [planner._scan_latest(minute * 60) for minute in minutes]
+    latest_seconds = time.perf_counter() - started
+
+    # プロファイルから引いた最早到着と、個別に求めた最早到着が一致するか
+    departures = [departure for departure, _, _ in profile]
+    mismatches = 0
+    for minute, legs in zip(minutes, earliest):
+        i = bisect_left(departures, minute * 60)
+        expected = profile[i][1] if i < len(profile) else None
+        if expected != (legs[-1].arr if legs else None):
+            mismatches += 1
+    # 最も遅い出発で間に合うか
+    for minute, legs in zip(minutes, latest):
+        if legs and legs[-1].arr > minute * 60:
+            mismatches += 1
+
+    print(f"接続 {len(planner.connections)} 件 / パレート最適な乗り継ぎ {len(profile)} 件")
+    print(f"  接続の構築         : {build_seconds * 1000:8.2f} ms")
+    print(f"  1日分のプロファイル: {profile_seconds * 1000:8.2f} ms")
+    print(f"  最早到着 x{len(minutes)}   : {earliest_seconds * 1000:8.2f} ms")
+    print(f"  最遅出発 x{len(minutes)}   : {latest_seconds * 1000:8.2f} ms")
+    print(f"  不一致             : {mismatches}")
+    sys.exit(0 if mismatches == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+計測 (metrics) のオーバーヘッドのベンチマーク
+
+計測を無効・有効にした状態で TimetableIndex.next_k と BusIndex.next_buses の
+1件あたりの時間を比べ、有効にしたときの Prometheus 形式の出力を表示する
+
+    python benchmarks/bench_metrics_overhead.py
+"""
+import os
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics
+from bus_timetable import BUS_INDEX
+from delay_index import DelayIndex
+from find_next_trains_hachioji import HACHIOJI_INDEX, HACHIOJI_TIMETABLE_UP_WEEKDAY
+
+QUERIES = 2000
+REPEAT = 5
+
+
+def per_call(func, queries):
+    best = min(timeit.repeat(lambda: [func(now) for now in queries], number=1, repeat=REPEAT))
+    return best / len(queries) * 1e6
+
+
+def main():
+    rng = random.Random(0)
+    base = datetime(2025, 1, 27)
+    queries = [base + timedelta(seconds=rng.randrange(4 * 3600, 28 * 3600)) for _ in range(QUERIES)]
+    delays = DelayIndex({entry["train_number"]: rng.choice((0, 60, 180))
+                         for entry in rng.sample(HACHIOJI_TIMETABLE_UP_WEEKDAY, 30)})
+    cases = {
+        "next_k": lambda now: HACHIOJI_INDEX.next_k(now, 3, delays),
+        "next_buses": lambda now: BUS_INDEX.next_buses(now, 3),
+        "span のみ": lambda now: metrics.span("noop").__enter__(),
+    }
+
+    print(f"{'処理':<12} {'無効 (µs/件)':>14} {'有効 (µs/件)':>14}")
+    for name, func in cases.items():
+        metrics.disable()
+        disabled = per_call(func, queries)
+        metrics.enable()
+        enabled = per_call(func, queries)
+        print(f"{name:<12} {disabled:>14.2f} {enabled:>14.2f}")
+
+    metrics.reset()
+    metrics.enable()
+    for now in queries[:100]:
+        HACHIOJI_INDEX.next_k(now, 3, delays)
+        BUS_INDEX.next_buses(now, 3)
+    print()
+    print(metrics.render_prometheus(), end="")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+複数の駅・方向への遅延の配布 (multi_station) の検証とベンチマーク
+
+八王子駅の時刻表を駅ごとにずらした合成の時刻表 (既定は24駅 x 2方向) と、
+路線全体の合成の odpt:Train 応答を使って
+  - 駅ごとに応答を解析し直す方法 (駅ごとに1プロセス動かした場合の処理) と、
+    1回の解析から MultiStationEngine で全ての駅に配る方法の時間
+  - 両者の次の電車の結果が一致するか
+  - プロセスプール (next_trains_parallel) の結果が1プロセスの結果と一致するか
+  - .ttbin がまだ無い駅 (clone した直後) でも、ソースからコンパイルして答えられるか
+を確かめる。不一致があれば終了コード 1 で終わる
+
+    python benchmarks/bench_multi_station.py [--stations 24] [--workers 4]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from delay_index import DelayIndex
+from hachioji_timetable import HACHIOJI_TIMETABLE_UP_WEEKDAY
+from multi_station import (CHUO_RAPID_STATIONS, DIRECTIONS, MultiStationEngine,
+                           StationTimetable)
+from odpt_client import ALL_STATIONS, HACHIOJI_STATION, UP, parse_train_snapshot
+from timetable_index import service_minute
+from timetable_store import (DEFAULT_SOURCE, CompiledTimetable, compile_store, open_store,
+                             write_store)
+
+DAY = datetime(2025, 1, 27)
+
+
+def shifted_timetable(offset_minutes):
+    """
+    八王子駅の時刻表を offset_minutes 分ずらしたもの (列車番号はそのまま)
+    """
+    timetable = []
+    for entry in HACHIOJI_TIMETABLE_UP_WEEKDAY:
+        minute = (service_minute(entry["time"]) + offset_minutes) % (24 * 60)
+        shifted = dict(entry, time=f"{minute // 60:02d}:{minute % 60:02d}")
+        shifted.pop("end_time", None)
+        timetable.append(shifted)
+    return timetable
+
+
+def line_payload(stations, rng):
+    """
+    時刻表の全ての列車が路線上のどこかにいる odpt:Train 形式の応答 (bytes)
+    """
+    trains = []
+    for entry in HACHIOJI_TIMETABLE_UP_WEEKDAY:
+        position = rng.randrange(len(stations) - 1)
+        trains.append({
+            "@type": "odpt:Train",
+            "odpt:trainNumber": entry["train_number"],
+            "odpt:delay": rng.choice((0, 0, 60, 180, 300, 600)),
+            "odpt:fromStation": stations[position],
+            "odpt:toStation": stations[position + 1] if rng.random() < 0.5 else None,
+            "odpt:railDirection": rng.choice(DIRECTIONS),
+        })
+    return json.dumps(trains).encode("utf-8")
+
+
+def per_station(specs, chunks, times):
+    """
+    駅ごとに応答を解析し直して次の電車を求める (駅ごとに1プロセス動かした場合の処理)
+    """
+    results = {}
+    for spec in specs:
+        snapshot = parse_train_snapshot(chunks, (spec.station,))
+        delays = DelayIndex({number: train["delay"] for number, train in snapshot.items()
+                             if train["direction"] in (spec.direction, None)})
+        index = open_store(spec.path).index
+        results[spec.key] = [index.next_k(now, 3, delays) for now in times]
+    return results
+
+
+def check_missing_store(directory, times, workers):
+    """
+    .ttbin が無い駅を親プロセスとプロセスプールのワーカーで開き、
+    ソースからコンパイルした時刻表と同じ結果になるかを確かめて不一致の数を返す
+    """
+    index = CompiledTimetable(compile_store(HACHIOJI_TIMETABLE_UP_WEEKDAY)).index
+    expected = [index.next_k(now, 3, DelayIndex()) for now in times]
+    mismatches = 0
+    # 親プロセス
+    spec = StationTimetable(HACHIOJI_STATION, UP, os.path.join(directory, "parent.ttbin"),
+                            DEFAULT_SOURCE)
+    engine = MultiStationEngine([spec])
+    mismatches += sum(engine.next_trains(now)[spec.key] != trains
+                      for now, trains in zip(times, expected))
+    # ワーカー (親プロセスではまだ開いていない)
+    spec = StationTimetable(HACHIOJI_STATION, UP, os.path.join(directory, "worker.ttbin"),
+                            DEFAULT_SOURCE)
+    engine = MultiStationEngine([spec])
+    with ProcessPoolExecutor(workers) as executor:
+        parallel = engine.next_trains_parallel(times, executor)
+    mismatches += parallel[spec.key] != expected
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stations", type=int, default=len(CHUO_RAPID_STATIONS))
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    stations = CHUO_RAPID_STATIONS[:args.stations]
+    times = [DAY + timedelta(seconds=rng.randrange(4 * 3600, 28 * 3600))
+             for _ in range(args.queries)]
+    mismatches = 0
+
+    with tempfile.TemporaryDirectory() as directory:
+        specs = []
+        for i, station in enumerate(stations):
+            for direction in DIRECTIONS:
+                path = os.path.join(directory, f"{i}-{direction.rsplit(':', 1)[-1]}.ttbin")
+                write_store(shifted_timetable(i * 2 if direction == DIRECTIONS[0] else -i * 2),
+                            path)
+                specs.append(StationTimetable(station, direction, path))
+
+        payload = line_payload(stations, rng)
+        chunks = [payload[i:i + 65536] for i in range(0, len(payload), 65536)]
+
+        # 駅ごとに解析し直す場合と、1回の解析から振り分ける場合の遅延情報の準備
+        started = time.perf_counter()
+        for spec in specs:
+            parse_train_snapshot(chunks, (spec.station,))
+        separate_seconds = time.perf_counter() - started
+        engine = MultiStationEngine(specs)
+        started = time.perf_counter()
+        snapshot = parse_train_snapshot(chunks, ALL_STATIONS)
+        engine.apply(snapshot)
+        shared_seconds = time.perf_counter() - started
+
+        # 結果が駅ごとに解析した場合と一致するか (発車標の構築時間も測る)
+        expected = per_station(specs, chunks, times)
+        started = time.perf_counter()
+        for key in engine.stations:
+            engine.boards(key)
+        build_seconds = time.perf_counter() - started
+        for now_position, now in enumerate(times):
+            for key, trains in engine.next_trains(now).items():
+                if trains != expected[key][now_position]:
+                    mismatches += 1
+
+        # 2周期目: 一部の列車の遅延だけが変わる
+        for train in list(snapshot.values())[::10]:
+            train["delay"] += 60
+        started = time.perf_counter()
+        changed = engine.apply(snapshot)
+        update_seconds = time.perf_counter() - started
+        for now in times[:10]:
+            for key, trains in engine.next_trains(now).items():
+                index = engine.timetable(key).index
+                if trains != index.next_k(now, 3, engine.delays[key]):
+                    mismatches += 1
+
+        # 全ての駅の1日ぶんの発車標 (全ての分) をプロセスプールで計算する
+        minutes = [DAY + timedelta(minutes=minute) for minute in range(4 * 60, 28 * 60)]
+        started = time.perf_counter()
+        serial = {key: [engine.boards(key).lookup(now) for now in minutes]
+                  for key in engine.stations}
+        serial_seconds = time.perf_counter() - started
+        with ProcessPoolExecutor(args.workers) as executor:
+            parallel = engine.next_trains_parallel(times, executor)
+            mismatches += sum(parallel[key] != [engine.boards(key).lookup(now) for now in times]
+                              for key in engine.stations)
+            started = time.perf_counter()
+            parallel = engine.next_trains_parallel(minutes, executor)
+            pool_seconds = time.perf_counter() - started
+        mismatches += sum(parallel[key] != serial[key] for key in serial)
+        missing_mismatches = check_missing_store(directory, times, args.workers)
+        mismatches += missing_mismatches
+
+    print(f"駅・方向               : {len(specs)} ({len(stations)}駅 x 2方向), 列車 {len(snapshot)}本")
+    print(f"駅ごとに解析           : {separate_seconds * 1000:8.1f} ms")
+    print(f"1回の解析から振り分け  : {shared_seconds * 1000:8.1f} ms")
+    print(f"発車標の構築 (全駅)    : {build_seconds * 1000:8.1f} ms")
+    print(f"2周期目の差分更新      : {update_seconds * 1000:8.1f} ms ({len(changed)}駅・方向が変化)")
+    print(f"全駅の1日ぶんの結果    : {serial_seconds * 1000:8.1f} ms (1プロセス, 構築済み) / "
+          f"{pool_seconds * 1000:.1f} ms ({args.workers}並列, 構築から), CPU {os.cpu_count()}個")
+    print(f".ttbin が無い駅        : 不一致 {missing_mismatches}")
+    print(f"不一致                 : {mismatches}")
+    sys.exit(0 if mismatches == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+odpt:Train 応答の解析のベンチマーク
+
+ローカルの代役サーバーから合成した odpt:Train の応答 (既定は最大 50,000 列車) を配信し、
+従来の response.json() で全体をオブジェクトにしてから絞り込む方法と、
+fetch_train_delays で読みながら八王子駅の列車だけを取り出す方法の
+解析時間とピークメモリ (tracemalloc) を比較する
+
+    python benchmarks/bench_odpt_parse.py [--trains 5000 50000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+from odpt_client import fetch_train_data, fetch_train_delays, parse_train_delays
+
+STATIONS = ("Takao", "Nishihachioji", "Hachioji", "Toyoda", "Hino", "Tachikawa",
+            "Kokubunji", "Mitaka", "Shinjuku", "Tokyo")
+
+
+def synthetic_payload(count, seed=0):
+    """
+    中央線の駅間に散らばった count 本の列車の odpt:Train 形式の JSON (bytes) を作る
+    八王子駅の近くにいるのは全体の約1割
+    """
+    rng = random.Random(seed)
+    trains = []
+    for i in range(count):
+        position = rng.randrange(len(STATIONS) - 1)
+        from_station = f"odpt.Station:JR-East.ChuoRapid.{STATIONS[position]}"
+        to_station = (f"odpt.Station:JR-East.ChuoRapid.{STATIONS[position + 1]}"
+                      if rng.random() < 0.5 else None)
+        trains.append({
+            "@id": f"urn:ucode:_00001C000000000000010000030{i:08d}",
+            "@type": "odpt:Train",
+            "dc:date": "2025-01-27T07:30:00+09:00",
+            "owl:sameAs": f"odpt.Train:JR-East.ChuoRapid.{i}T",
+            "odpt:railway": "odpt.Railway:JR-East.ChuoRapid",
+            "odpt:operator": "odpt.Operator:JR-East",
+            "odpt:trainNumber": f"{i}T",
+            "odpt:trainType": "odpt.TrainType:JR-East.Rapid",
+            "odpt:delay": rng.choice((0, 0, 0, 60, 180, 300)),
+            "odpt:fromStation": from_station,
+            "odpt:toStation": to_station,
+            "odpt:railDirection": "odpt.RailDirection:Inbound",
+            "odpt:originStation": ["odpt.Station:JR-East.ChuoRapid.Takao"],
+            "odpt:destinationStation": ["odpt.Station:JR-East.ChuoRapid.Tokyo"],
+            "odpt:trainInformationText": {"ja": "八王子方面", "en": "For Hachioji"},
+        })
+    return json.dumps(trains, ensure_ascii=False).encode("utf-8")
+
+
+class PayloadHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    payload = b"[]"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(self.payload)))
+        self.end_headers()
+        self.wfile.write(self.payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def legacy_fetch(url, session):
+    return parse_train_delays(fetch_train_data(url, {}, session))
+
+
+def streaming_fetch(url, session):
+    return fetch_train_delays(url, {}, session)
+
+
+def measure(func, url, session):
+    # tracemalloc は処理を遅くするので、時間とメモリは別々に測る
+    started = time.perf_counter()
+    result = func(url, session)
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    func(url, session)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trains", type=int, nargs="+", default=[500, 5000, 50000])
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PayloadHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/api/v4/odpt:Train"
+    session = requests.Session()
+
+    ok = True
+    print(f"{'列車数':>8} {'応答':>9} | {'従来':>18} | {'逐次解析':>18} | 一致")
+    for count in args.trains:
+        PayloadHandler.payload = synthetic_payload(count)
+        legacy, legacy_seconds, legacy_peak = measure(legacy_fetch, url, session)
+        streamed, streamed_seconds, streamed_peak = measure(streaming_fetch, url, session)
+        identical = legacy == streamed and len(streamed) > 0
+        ok &= identical
+        print(f"{count:>8} {len(PayloadHandler.payload) / 1e6:7.1f}MB | "
+              f"{legacy_seconds * 1000:7.1f} ms {legacy_peak / 1e6:6.1f} MB | "
+              f"{streamed_seconds * 1000:7.1f} ms {streamed_peak / 1e6:6.1f} MB | {identical}")
+
+    server.shutdown()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
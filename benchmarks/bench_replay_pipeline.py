@@ -0,0 +1,161 @@
+"""
+記録した上流の応答の再生による、CLI 全体の負荷試験 (ネットワーク不要)
+
+upstream_log の代役サーバーで記録 (--log を省略すると合成した記録) を speed 倍で再生し、
+UPSTREAM_REPLAY をそこに向けた複数のプロセスから find_next_trains_hachioji.main()
+(遅延情報の取得 → 次の電車の検索 → 表示) を繰り返し実行して、
+1回あたりの応答時間とスループットを測る
+
+あわせて、再生中に UPSTREAM_RECORD で記録し直した内容が再生した応答と一致するか、
+表示に記録の遅延と運行情報が反映されるかを確かめる (違えば終了コード 1)
+
+    python benchmarks/bench_replay_pipeline.py [--log upstream.jsonl.gz] [--speed 60]
+                                               [--clients 4] [--duration 5]
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from hachioji_timetable import HACHIOJI_TIMETABLE_UP_WEEKDAY
+from odpt_client import HACHIOJI_STATION, REALTIME_API_URL
+from service_status import SERVICE_STATUS_URL
+from upstream_log import (RECORD_ENV, REPLAY_ENV, ReplayLog, UpstreamRecorder,
+                          make_replay_server, read_log, replay_path)
+
+STATUS_FIXTURES = [os.path.join(ROOT, "benchmarks", "fixtures", name)
+                   for name in ("diainfo_normal.html", "diainfo_delay.html")]
+
+
+def synthetic_log(path, minutes=30, seed=0):
+    """
+    30秒ごとの odpt:Train と1分ごとの運行情報ページの応答を minutes 分ぶん記録する
+    遅延は全ての列車で1分以上にする (表示に反映されたことを確かめるため)
+    """
+    rng = random.Random(seed)
+    recorder = UpstreamRecorder(path)
+    start = time.time() - minutes * 60
+    for step in range(minutes * 2):
+        trains = [{"odpt:trainNumber": entry["train_number"],
+                   "odpt:delay": rng.choice((60, 180, 300)),
+                   "odpt:fromStation": HACHIOJI_STATION,
+                   "odpt:railDirection": "odpt.RailDirection:Inbound"}
+                  for entry in HACHIOJI_TIMETABLE_UP_WEEKDAY]
+        recorder.write(f"{REALTIME_API_URL}?odpt%3Arailway=odpt.Railway%3AJR-East.ChuoRapid",
+                       200, {"Content-Type": "application/json"},
+                       json.dumps(trains).encode("utf-8"), recorded_at=start + step * 30)
+        if step % 2 == 0:
+            fixture = STATUS_FIXTURES[step // 2 % len(STATUS_FIXTURES)]
+            with open(fixture, "rb") as f:
+                recorder.write(SERVICE_STATUS_URL, 200,
+                               {"Content-Type": "text/html; charset=UTF-8",
+                                "ETag": f'"{step}"'},
+                               f.read(), recorded_at=start + step * 30)
+    recorder.close()
+
+
+def pipeline_env(base_url, cache_dir, record_path=None):
+    env = dict(os.environ, ACCESS_TOKEN="replay", DELAY_CACHE_TTL="0",
+               DELAY_CACHE_STALE_TTL="0",
+               DELAY_CACHE_PATH=os.path.join(cache_dir, f"delays-{os.getpid()}.json"))
+    env[REPLAY_ENV] = base_url
+    env.pop(RECORD_ENV, None)
+    if record_path:
+        env[RECORD_ENV] = record_path
+    return env
+
+
+# ----------------------------------------------------------------------------
+# 負荷をかけるプロセス
+# ----------------------------------------------------------------------------
+def run_client(args):
+    base_url, cache_dir, duration = args
+    os.environ.clear()
+    os.environ.update(pipeline_env(base_url, cache_dir))
+    import find_next_trains_hachioji
+
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            find_next_trains_hachioji.main()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def percentile(values, ratio):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * ratio))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--log", help="再生する記録 (省略すると合成する)")
+    parser.add_argument("--speed", type=float, default=60.0)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+    failures = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        log_path = args.log
+        if log_path is None:
+            log_path = os.path.join(directory, "upstream.jsonl.gz")
+            synthetic_log(log_path)
+        log = ReplayLog.load(log_path)
+        server = make_replay_server(log, port=0, speed=args.speed, loop=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        print(f"再生: {len(log)}件 ({log.end - log.start:.0f}秒ぶん) を {args.speed}倍で {base_url}")
+
+        # 再生中に記録し直し、CLI の出力と記録の内容を確かめる
+        record_path = os.path.join(directory, "rerecorded.jsonl.gz")
+        output = subprocess.run(
+            [sys.executable, os.path.join(ROOT, "find_next_trains_hachioji.py")],
+            env=pipeline_env(base_url, directory, record_path), cwd=directory,
+            capture_output=True, text=True, timeout=60).stdout
+        if "分遅れ" not in output:
+            failures.append("記録の遅延が表示に反映されていない")
+        if "運行情報の取得に失敗しました" in output:
+            failures.append("運行情報を取得できていない")
+        recorded = list(read_log(record_path))
+        urls = {record["url"].split("?")[0] for record in recorded}
+        if urls != {REALTIME_API_URL, SERVICE_STATUS_URL}:
+            failures.append(f"記録し直したURLが違う: {sorted(urls)}")
+        for record in recorded:
+            _, responses = log.routes.get(replay_path(record["url"]), ((), ()))
+            if record["body"] not in {response["body"] for response in responses}:
+                failures.append(f"記録し直した本文が再生した応答と違う: {record['url']}")
+        if any("consumerKey" in record["url"] for record in recorded):
+            failures.append("API キーが記録されている")
+
+        with multiprocessing.get_context("spawn").Pool(args.clients) as pool:
+            results = pool.map(run_client, [(base_url, directory, args.duration)] * args.clients)
+        server.shutdown()
+
+    latencies = [latency for result in results for latency in result]
+    print(f"パイプライン全体: {len(latencies)}回 / {args.duration}秒 x {args.clients}プロセス "
+          f"= {len(latencies) / args.duration:.0f} 回/秒")
+    print(f"応答時間: p50 {percentile(latencies, 0.5) * 1000:.1f} ms, "
+          f"p95 {percentile(latencies, 0.95) * 1000:.1f} ms, "
+          f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms")
+    for failure in failures:
+        print(f"NG: {failure}")
+    print(f"失敗: {len(failures)}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
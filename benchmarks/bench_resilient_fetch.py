@@ -0,0 +1,175 @@
+"""
+障害時の列車情報取得 (fetch_pipeline.ResilientFetcher) の検証
+
+ローカルの代役サーバーに主系・代替の2つの取得先を用意し、遅延やエラーを注入して
+  - 主系が 503 を返す: 代替APIの結果を使い、主系のサーキットが開く
+  - 両方とも落ちている: 再試行の後に前回の値を stale として返し、
+    サーキットが開いた後はリクエストを送らずにすぐ返る
+  - 主系が遅い: ヘッジした代替APIの結果を期限内に返す
+  - 復旧: reset_timeout 後の1件の試行でサーキットが閉じる
+  - 再試行の予算: 使い切ると再試行しない
+を確かめ、各場面の所要時間を表示する。期待と違えば終了コード 1 で終わる
+
+    python benchmarks/bench_resilient_fetch.py
+"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fetch_pipeline import CircuitBreaker, ResilientFetcher, RetryBudget
+from odpt_client import HACHIOJI_STATION, fetch_train_snapshot
+
+PAYLOAD = json.dumps([
+    {"odpt:trainNumber": "1234T", "odpt:delay": 120, "odpt:fromStation": HACHIOJI_STATION},
+    {"odpt:trainNumber": "1236T", "odpt:delay": 0, "odpt:toStation": HACHIOJI_STATION},
+]).encode("utf-8")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    /primary と /alt の応答を modes に従って返す
+      ("ok", 遅延秒) / ("error", ステータス) / ("slow", 遅延秒)
+    """
+
+    protocol_version = "HTTP/1.1"
+    modes = {}
+    hits = {}
+    lock = threading.Lock()
+
+    def do_GET(self):
+        name = self.path.split("?")[0].strip("/")
+        with self.lock:
+            self.hits[name] = self.hits.get(name, 0) + 1
+        mode, value = self.modes.get(name, ("ok", 0))
+        if mode in ("ok", "slow"):
+            time.sleep(value)
+            status, body = 200, PAYLOAD
+        else:
+            status, body = value, b'{"error": "injected"}'
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_fetcher(base, **kwargs):
+    options = {"budget": 2.0, "hedge_after": 0.3, "reset_timeout": 1.0, "failure_threshold": 2}
+    options.update(kwargs)
+    return ResilientFetcher(fetch_train_snapshot, urls=(f"{base}/primary", f"{base}/alt"),
+                            **options)
+
+
+def timed_fetch(fetcher):
+    started = time.perf_counter()
+    try:
+        result = fetcher.fetch({})
+    except Exception as e:
+        result = {"error": e}
+    return result, time.perf_counter() - started
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    failures = []
+
+    def check(name, condition, elapsed, detail=""):
+        print(f"{'OK ' if condition else 'NG '} {name:<40} {elapsed * 1000:8.1f} ms {detail}")
+        if not condition:
+            failures.append(name)
+
+    # 正常
+    StubHandler.modes = {"primary": ("ok", 0), "alt": ("ok", 0)}
+    fetcher = make_fetcher(base)
+    result, elapsed = timed_fetch(fetcher)
+    check("正常: 主系から取得", result.get("source", "").endswith("/primary")
+          and not result["stale"] and result["value"]["1234T"]["delay"] == 120, elapsed)
+
+    # 主系が 503: 代替APIを使い、主系のサーキットが開く
+    StubHandler.modes = {"primary": ("error", 503), "alt": ("ok", 0)}
+    for _ in range(2):
+        result, elapsed = timed_fetch(fetcher)
+        check("主系 503: 代替APIから取得", result.get("source", "").endswith("/alt")
+              and not result["stale"], elapsed)
+    check("主系 503: 主系のサーキットが開く",
+          fetcher.breakers[f"{base}/primary"].state == CircuitBreaker.OPEN, 0)
+    StubHandler.hits = {}
+    result, elapsed = timed_fetch(fetcher)
+    check("主系のサーキットが開いている間は送らない",
+          StubHandler.hits.get("primary", 0) == 0 and result.get("source", "").endswith("/alt"),
+          elapsed, f"hits={StubHandler.hits}")
+
+    # 両方とも落ちている: 前回の値を stale で返す
+    StubHandler.modes = {"primary": ("error", 503), "alt": ("error", 500)}
+    result, elapsed = timed_fetch(fetcher)
+    check("両方 5xx: 前回の値を stale で返す", result.get("stale") is True
+          and result["value"]["1234T"]["delay"] == 120 and elapsed < 2.0, elapsed,
+          f"attempts={result.get('attempts')}")
+    StubHandler.hits = {}
+    result, elapsed = timed_fetch(fetcher)
+    check("両方のサーキットが開いたらすぐ返す", result.get("stale") is True
+          and sum(StubHandler.hits.values()) == 0 and elapsed < 0.05, elapsed,
+          f"{fetcher.circuit_states()}")
+
+    # 前回の値がなければ例外
+    fresh = make_fetcher(base, max_attempts=1)
+    result, elapsed = timed_fetch(fresh)
+    check("前回の値がなければ例外", "error" in result and "value" not in result, elapsed,
+          repr(result.get("error")))
+
+    # 復旧: reset_timeout 後に1件だけ試してサーキットが閉じる
+    StubHandler.modes = {"primary": ("ok", 0), "alt": ("ok", 0)}
+    time.sleep(1.1)
+    result, elapsed = timed_fetch(fetcher)
+    # 代替APIは次に使われるまで試さないので、主系だけが閉じる
+    check("復旧: half_open の試行で閉じる", not result.get("stale", True)
+          and fetcher.breakers[f"{base}/primary"].state == CircuitBreaker.CLOSED, elapsed,
+          f"{fetcher.circuit_states()}")
+
+    # 主系が遅い: ヘッジした代替APIが先に返る
+    StubHandler.modes = {"primary": ("slow", 1.5), "alt": ("ok", 0)}
+    result, elapsed = timed_fetch(fetcher)
+    check("主系が遅い: ヘッジで代替APIから取得", result.get("source", "").endswith("/alt")
+          and elapsed < 1.0, elapsed)
+
+    # 両方遅い: 期限 (budget) で打ち切って前回の値を返す
+    StubHandler.modes = {"primary": ("slow", 3), "alt": ("slow", 3)}
+    started = time.perf_counter()
+    result = fetcher.fetch({}, budget=0.5)
+    elapsed = time.perf_counter() - started
+    check("両方遅い: 期限で打ち切って前回の値を返す", result["stale"] and elapsed < 0.7, elapsed,
+          repr(result.get("error")))
+
+    # 再試行の予算を使い切ると再試行しない
+    StubHandler.modes = {"primary": ("error", 503), "alt": ("error", 503)}
+    budget = RetryBudget(ratio=0, min_per_second=0, max_tokens=1)
+    limited = make_fetcher(base, retry_budget=budget, failure_threshold=100, max_attempts=5)
+    for _ in range(2):
+        timed_fetch(limited)
+    check("再試行の予算: 1回だけ再試行する", limited.stats["retries"] == 1, 0,
+          f"stats={limited.stats}")
+
+    # 4xx は再試行しない
+    StubHandler.modes = {"primary": ("error", 401), "alt": ("error", 401)}
+    unauthorized = make_fetcher(base)
+    result, elapsed = timed_fetch(unauthorized)
+    check("401: 再試行せず、サーキットも開かない", unauthorized.stats["retries"] == 0
+          and set(unauthorized.circuit_states().values()) == {CircuitBreaker.CLOSED}, elapsed)
+
+    server.shutdown()
+    print(f"失敗: {len(failures)}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
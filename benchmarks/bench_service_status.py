@@ -0,0 +1,66 @@
+"""
+運行情報ページ解析のベンチマーク
+
+保存済みの HTML (benchmarks/fixtures/diainfo_*.html) を使い、従来の
+BeautifulSoup (html.parser) による全体解析と、運行情報ブロックだけを
+逐次解析する parse_service_status の時間を比較する
+
+    python benchmarks/bench_service_status.py
+"""
+import glob
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from service_status import CHUNK_SIZE, parse_service_status
+
+FIXTURES = os.path.join(ROOT, "benchmarks", "fixtures", "diainfo_*.html")
+NUMBER = 20
+
+
+def legacy_parse(content):
+    """
+    従来の実装 (ページ全体の木を作って全ての dt / dd を探す)
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(content, "html.parser")
+    titles = [dt.get_text(strip=True) for dt in soup.find_all("dt")]
+    messages = [dd.get_text(strip=True) for dd in soup.find_all("dd")]
+    return titles, messages
+
+
+def streaming_parse(text):
+    chunks = (text[i:i + CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE))
+    return parse_service_status(chunks)
+
+
+def main():
+    try:
+        import bs4  # noqa: F401
+        has_bs4 = True
+    except ImportError:
+        has_bs4 = False
+        print("bs4 が無いため従来の実装は計測しません")
+
+    print(f"{'ファイル':<24} {'サイズ':>8} {'従来 (ms)':>10} {'逐次 (ms)':>10}")
+    for path in sorted(glob.glob(FIXTURES)):
+        with open(path, "rb") as f:
+            content = f.read()
+        text = content.decode("utf-8")
+
+        legacy_ms = "-"
+        if has_bs4:
+            legacy = timeit.timeit(lambda: legacy_parse(content), number=NUMBER) / NUMBER
+            legacy_ms = f"{legacy * 1000:.2f}"
+        streaming = timeit.timeit(lambda: streaming_parse(text), number=NUMBER) / NUMBER
+        print(f"{os.path.basename(path):<24} {len(content):>8} "
+              f"{legacy_ms:>10} {streaming * 1000:>10.2f}")
+        print(f"  → {streaming_parse(text)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+--watch の差分表示と --ndjson 出力の検証とベンチマーク (ネットワーク不要)
+
+取得関数を差し替えた BoardState で run_watch を1秒刻みの時計で1時間ぶん回し、
+  - 書き出した制御シーケンスを仮想の画面に適用した結果が、毎回の全体の表示と一致するか
+  - 毎回全体を書き直す場合と比べた出力量
+  - 端末でない出力では、現在時刻以外が変わったときだけ変わった行を追記するか
+  - NDJSON の各行が JSON として読め、変わった区分だけが出力されるか
+  - 1回あたりの表示の組み立て (文字列) と NDJSON の時間
+を確かめる。不一致があれば終了コード 1 で終わる
+
+    python benchmarks/bench_watch.py
+"""
+import io
+import json
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hachioji_timetable import HACHIOJI_TIMETABLE_UP_WEEKDAY
+from odpt_client import TrainSnapshot
+from train_server import BoardState
+from watch import (LineRenderer, NdjsonWriter, bus_records, frame_lines, run_watch,
+                   status_records, train_records)
+
+START = datetime(2025, 1, 27, 7, 30)
+TICKS = 3600
+CONTROL_RE = re.compile(r"\x1b\[(?:(\d+);1H|2J|K|H)")
+
+
+class VirtualScreen:
+    """
+    LineRenderer が使う制御シーケンス (カーソル移動・画面消去・行末まで消去) だけを解釈する
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.row = 0
+        self._wrote = False
+
+    def feed(self, text):
+        position = 0
+        for match in CONTROL_RE.finditer(text):
+            self._write(text[position:match.start()])
+            code = match.group(0)
+            if match.group(1):
+                self.row = int(match.group(1)) - 1
+                self._wrote = False
+            elif code.endswith("2J"):
+                self.rows = {}
+            elif code.endswith("H"):
+                self.row = 0
+                self._wrote = False
+            elif not self._wrote:
+                # 何も書かずに行末まで消去した行は空になる
+                self.rows[self.row] = ""
+            position = match.end()
+        self._write(text[position:])
+
+    def _write(self, text):
+        # LineRenderer は行全体を書き直すので、書いた内容がその行の内容になる
+        if text:
+            self.rows[self.row] = text
+            self._wrote = True
+
+    def lines(self, count):
+        return [self.rows.get(row, "") for row in range(count)]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = START
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += timedelta(seconds=seconds)
+
+
+def fake_state(rng):
+    trains = [entry["train_number"] for entry in HACHIOJI_TIMETABLE_UP_WEEKDAY]
+
+    def fetch_delays():
+        return TrainSnapshot({number: {"delay": rng.choice((0, 60, 120)), "from_station": None,
+                                       "to_station": None}
+                              for number in rng.sample(trains, 20)}, fetched_at=time.time())
+
+    def fetch_status():
+        return {"status": rng.choice(("平常運転", "列車遅延")), "detail": "事故・遅延情報はありません"}
+
+    state = BoardState(fetch_delays=fetch_delays, fetch_status=fetch_status)
+    # 裏のスレッドは使わず、時計に合わせて更新する
+    state.start = lambda: (state.refresh("delays"), state.refresh("status"))
+    return state
+
+
+def main():
+    rng = random.Random(0)
+    mismatches = 0
+
+    # 差分表示: 1秒ごとの表示を仮想の画面に適用して、全体の表示と比べる
+    state = fake_state(rng)
+    clock = FakeClock()
+    out = io.StringIO()
+    screen = VirtualScreen()
+    renderer = LineRenderer(out, ansi=True)
+    plain_out = io.StringIO()
+    plain = LineRenderer(plain_out, ansi=False)
+    content_changes = 0
+    previous = None
+    full_bytes = 0
+    state.start()
+    for tick in range(TICKS):
+        if tick % 30 == 0:
+            state.refresh("delays")
+        if tick % 60 == 0:
+            state.refresh("status")
+        now = clock()
+        lines = frame_lines(now, state.next_trains(now, 3), state.next_buses(now, 3),
+                            state.status, state.updated_at)
+        written = out.tell()
+        renderer.render(lines)
+        screen.feed(out.getvalue()[written:])
+        if screen.lines(len(lines) + 3) != lines + ["", "", ""]:
+            mismatches += 1
+        full_bytes += len("\n".join(lines)) + 1
+
+        # 端末でない出力: 現在時刻 (先頭の行) 以外が変わったときだけ書く
+        if previous is None or lines[1:] != previous[1:]:
+            content_changes += 1
+        plain.render(lines)
+        previous = lines
+        clock.sleep(1)
+
+    if plain.stats["frames"] != content_changes:
+        mismatches += 1
+    # 変わらない見出しは最初の1回だけ
+    shuttle_header = next(line for line in previous if "シャトルバス" in line)
+    if plain_out.getvalue().count(shuttle_header) != 1:
+        mismatches += 1
+
+    # run_watch 自体 (行数を変えたときに余った行が消えることも含めて確かめる)
+    clock = FakeClock()
+    out = io.StringIO()
+    run_watch(out=out, state=fake_state(rng), clock=clock, ticks=120, ansi=True,
+              sleep=clock.sleep)
+    if not out.getvalue().startswith("\x1b[H\x1b[2J"):
+        mismatches += 1
+
+    # NDJSON: 変わった区分だけを出力する
+    clock = FakeClock()
+    out = io.StringIO()
+    writer = run_watch(out=out, state=fake_state(rng), clock=clock, ticks=600, ndjson=True,
+                       sleep=clock.sleep)
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    kinds = {record["type"] for record in records}
+    if kinds != {"delays", "train", "bus", "service_status"}:
+        mismatches += 1
+    first_ticks = {record["now"] for record in records}
+    if len(first_ticks) >= 600:
+        # 毎回全ての区分を出力している
+        mismatches += 1
+
+    # 1回あたりの組み立て時間
+    state = fake_state(rng)
+    state.start()
+    times = [START + timedelta(seconds=second) for second in range(2000)]
+    started = time.perf_counter()
+    for now in times:
+        frame_lines(now, state.next_trains(now, 3), state.next_buses(now, 3),
+                    state.status, state.updated_at)
+    text_seconds = (time.perf_counter() - started) / len(times)
+    ndjson_writer = NdjsonWriter(io.StringIO())
+    started = time.perf_counter()
+    for now in times:
+        ndjson_writer.write({"trains": train_records(state.next_trains(now, 3)),
+                             "buses": bus_records(state.next_buses(now, 3)),
+                             "status": status_records(state.status)}, now, only_changed=True)
+    ndjson_seconds = (time.perf_counter() - started) / len(times)
+
+    stats = renderer.stats
+    print(f"差分表示 ({TICKS}秒)      : {stats['bytes'] / 1024:8.1f} KiB, "
+          f"書き直した行 {stats['lines_written']} / 全体を書き直す場合 {full_bytes / 1024:.1f} KiB")
+    print(f"端末以外 ({TICKS}秒)      : {plain.stats['bytes'] / 1024:8.1f} KiB, "
+          f"出力 {plain.stats['frames']}回 (内容が変わった回数 {content_changes})")
+    print(f"NDJSON (600秒)        : {writer.stats['records']}件, "
+          f"出力した時刻 {len(first_ticks)}回")
+    print(f"1回あたり             : 表示 {text_seconds * 1e6:.1f} µs / NDJSON {ndjson_seconds * 1e6:.1f} µs")
+    print(f"不一致                : {mismatches}")
+    sys.exit(0 if mismatches == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
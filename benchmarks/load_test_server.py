@@ -0,0 +1,146 @@
+"""
+train_server の負荷試験
+
+ODPT API と運行情報ページの代わりをするローカルサーバーを立て、
+そこから状態を取得する train_server に複数プロセスから Keep-Alive 接続で
+リクエストを送り続け、スループットと応答時間を測る
+
+    python benchmarks/load_test_server.py [--clients 4] [--duration 5]
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+import timeit
+from http.server import BaseHTTPRequestHandler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from hachioji_timetable import HACHIOJI_TIMETABLE_UP_WEEKDAY
+from odpt_client import HACHIOJI_STATION, fetch_train_delays
+from service_status import ServiceStatusFetcher
+from train_server import BoardState, handle_query, make_server
+from upstream_log import StandInServer
+
+STATUS_FIXTURE = os.path.join(ROOT, "benchmarks", "fixtures", "diainfo_delay.html")
+PATHS = ("/trains?k=3", "/buses?k=3", "/trains?k=3&at=2025-01-27T23:50")
+
+
+# ----------------------------------------------------------------------------
+# ODPT API・運行情報ページの代役
+# ----------------------------------------------------------------------------
+def synthetic_trains(rng):
+    """
+    時刻表の全列車に乱数の遅延を付けた odpt:Train 形式のデータを作る
+    """
+    return [{
+        "odpt:trainNumber": entry["train_number"],
+        "odpt:delay": rng.choice((0, 0, 0, 60, 180, 300)),
+        "odpt:fromStation": HACHIOJI_STATION,
+        "odpt:toStation": "odpt.Station:JR-East.ChuoRapid.Nishihachioji",
+    } for entry in HACHIOJI_TIMETABLE_UP_WEEKDAY]
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    rng = random.Random(0)
+
+    def do_GET(self):
+        if self.path.startswith("/api/v4/odpt:Train"):
+            body = json.dumps(synthetic_trains(self.rng)).encode("utf-8")
+            content_type = "application/json"
+        else:
+            with open(STATUS_FIXTURE, "rb") as f:
+                body = f.read()
+            content_type = "text/html; charset=UTF-8"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_in_thread(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ----------------------------------------------------------------------------
+# クライアント
+# ----------------------------------------------------------------------------
+def run_client(args):
+    port, duration = args
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    latencies = []
+    deadline = time.perf_counter() + duration
+    i = 0
+    while time.perf_counter() < deadline:
+        path = PATHS[i % len(PATHS)]
+        started = time.perf_counter()
+        conn.request("GET", path)
+        response = conn.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - started)
+        i += 1
+    conn.close()
+    return latencies
+
+
+def percentile(values, ratio):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * ratio))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+
+    stand_in = start_in_thread(StandInServer(("127.0.0.1", 0), StandInHandler))
+    base_url = f"http://127.0.0.1:{stand_in.server_port}"
+    status_fetcher = ServiceStatusFetcher(f"{base_url}/diainfo/38/0")
+
+    state = BoardState(
+        fetch_delays=lambda: fetch_train_delays(f"{base_url}/api/v4/odpt:Train", {}),
+        fetch_status=status_fetcher.fetch,
+        delay_interval=1, status_interval=1,
+    )
+    state.start()
+    while None in state.updated_at.values():
+        time.sleep(0.05)
+
+    # ハンドラ単体の処理時間
+    for path in PATHS:
+        route, _, query = path.partition("?")
+        number = 5000
+        elapsed = timeit.timeit(lambda: handle_query(state, route, query), number=number)
+        print(f"handle_query {path:<36} {elapsed / number * 1e6:8.1f} µs/件")
+
+    server = start_in_thread(make_server(state, port=0))
+    with multiprocessing.Pool(args.clients) as pool:
+        results = pool.map(run_client, [(server.server_port, args.duration)] * args.clients)
+    latencies = [latency for result in results for latency in result]
+
+    print(f"クライアント {args.clients} 並列 × {args.duration:.0f} 秒")
+    print(f"  リクエスト数: {len(latencies)}")
+    print(f"  スループット: {len(latencies) / args.duration:.0f} req/s")
+    print(f"  応答時間 p50: {percentile(latencies, 0.5) * 1000:.2f} ms, "
+          f"p99: {percentile(latencies, 0.99) * 1000:.2f} ms")
+
+    state.stop()
+    server.shutdown()
+    stand_in.shutdown()
+
+
+if __name__ == "__main__":
+    main()
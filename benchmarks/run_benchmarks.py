@@ -0,0 +1,371 @@
+"""
+ホットパスのベンチマークスイート (ネットワーク不要)
+
+合成・保存済みのフィクスチャだけを使って各処理の時間とメモリ確保量を測り、
+結果を JSON に保存したベースラインと比べる。いずれかの段階が閾値を超えて
+遅く (または多く確保するように) なっていれば終了コード 1 で終わる
+
+    python benchmarks/run_benchmarks.py                 # ベースラインと比較
+    python benchmarks/run_benchmarks.py --save          # 結果をベースラインとして保存
+    python benchmarks/run_benchmarks.py -k odpt --threshold 1.3
+
+段階:
+    timetable.next_k[1x/10x/100x]  時刻表を水増しした次のk本の検索
+    delays.build / delays.lookup   遅延情報のインデックス構築と照合 (数千列車)
+    odpt.parse[N]                  odpt:Train 応答の逐次解析 (数千列車の合成データ)
+    status.parse[*]                保存済みの運行情報ページの解析
+    bus.next_buses                 1日の全ての分のバス検索
+    boards.lookup / boards.update  分ごとの発車標
+    journey.profile                乗り継ぎ検索の1日分のプロファイル
+
+マシンの速さや負荷の違いを除くため、各段階の時間はその直前に測った基準の処理
+(reference_workload) の時間との比にしてからベースラインと比べる。それでも Python の版や
+マシンの種類が違うベースラインとの比較は参考として表示するだけで失敗にはしない
+(--save で保存し直したもの、または --baseline で指定したものと比べること)
+ベースラインが無い場合は比べずに終了コード 2 で終わる
+"""
+import argparse
+import bisect
+import gc
+import glob
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+from bench_find_next_trains import scaled_timetable
+from bench_odpt_parse import synthetic_payload
+from delay_index import DelayIndex
+from timetable_index import compile_timetable
+
+DEFAULT_BASELINE = os.path.join(HERE, "baseline.json")
+DEFAULT_THRESHOLD = 1.5
+# 1回の実行がこれより短い段階は誤差が大きいので、閾値を SHORT_STAGE_THRESHOLD 倍まで緩める
+SHORT_STAGE_SECONDS = 0.001
+SHORT_STAGE_THRESHOLD = 2.0
+# ベースラインが無く、比べられなかったときの終了コード
+EXIT_NO_BASELINE = 2
+# 閾値を超えた段階を測り直す回数 (他の処理の負荷で一時的に遅くなっただけのことがある)
+CONFIRM_RUNS = 2
+# これより小さいメモリ確保量の差は誤差として無視する
+ALLOCATION_SLACK = 4096
+FIXTURES = os.path.join(HERE, "fixtures", "diainfo_*.html")
+BASE_DAY = datetime(2025, 1, 27)
+
+
+# ----------------------------------------------------------------------------
+# 段階の定義
+# ----------------------------------------------------------------------------
+# 各段階は (名前, 準備関数) で、準備関数は (計測する引数なしの関数, 1回あたりの処理件数) を返す
+def _queries(rng, count):
+    return [BASE_DAY + timedelta(seconds=rng.randrange(4 * 3600, 28 * 3600)) for _ in range(count)]
+
+
+def stage_next_k(factor):
+    def setup():
+        rng = random.Random(factor)
+        timetable = scaled_timetable(factor)
+        index = compile_timetable(timetable)
+        delays = DelayIndex({entry["train_number"]: rng.choice((60, 120, 300))
+                             for entry in rng.sample(timetable, min(30, len(timetable)))})
+        queries = _queries(rng, 200)
+        return (lambda: [index.next_k(now, 3, delays) for now in queries]), len(queries)
+    return setup
+
+
+def _synthetic_delays(count):
+    rng = random.Random(count)
+    return {f"{rng.randrange(1, 2000)}{rng.choice('TCKM')}": rng.choice((0, 60, 180, 300))
+            for _ in range(count)}
+
+
+def stage_delay_build(count):
+    def setup():
+        delays = _synthetic_delays(count)
+        return (lambda: DelayIndex(delays)), 1
+    return setup
+
+
+def stage_delay_lookup(count):
+    def setup():
+        index = DelayIndex(_synthetic_delays(count))
+        numbers = [entry["train_number"] for entry in scaled_timetable(10)]
+        return (lambda: [index.lookup(number) for number in numbers]), len(numbers)
+    return setup
+
+
+def stage_odpt_parse(count):
+    def setup():
+        from odpt_client import parse_train_snapshot
+
+        payload = synthetic_payload(count)
+        chunks = [payload[i:i + 65536] for i in range(0, len(payload), 65536)]
+        return (lambda: parse_train_snapshot(chunks)), count
+    return setup
+
+
+def stage_status_parse(path):
+    def setup():
+        from service_status import CHUNK_SIZE, parse_service_status
+
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        chunks = [text[i:i + CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE)]
+        return (lambda: parse_service_status(iter(chunks))), 1
+    return setup
+
+
+def stage_next_buses():
+    from bus_timetable import BUS_INDEX
+
+    minutes = [f"{minute // 60:02d}:{minute % 60:02d}" for minute in range(24 * 60)]
+    return (lambda: [BUS_INDEX.next_buses(now, 3) for now in minutes]), len(minutes)
+
+
+def _departure_boards():
+    from departure_board import DepartureBoards
+    from find_next_trains_hachioji import HACHIOJI_INDEX
+
+    return HACHIOJI_INDEX, DepartureBoards(HACHIOJI_INDEX, DelayIndex())
+
+
+def stage_boards_lookup():
+    _, boards = _departure_boards()
+    queries = _queries(random.Random(0), 1000)
+    return (lambda: [boards.lookup(now) for now in queries]), len(queries)
+
+
+def stage_boards_update():
+    index, boards = _departure_boards()
+    trains = [entry.get("train_number") for entry in index.entries]
+    delays = [DelayIndex({train: 60 * (step % 2)}) for step, train in enumerate(trains[:40])]
+
+    def run():
+        for delay in delays:
+            boards.update(delay)
+    return run, len(delays)
+
+
+def stage_journey_profile():
+    from find_next_trains_hachioji import HACHIOJI_INDEX
+    from journey_planner import JourneyPlanner
+
+    def run():
+        return JourneyPlanner(HACHIOJI_INDEX).profile()
+    return run, 1
+
+
+def reference_workload():
+    """
+    マシンの速さを測るための基準の処理 (辞書・文字列・bisect を使う、コードの変更に依存しない処理)
+    """
+    rng = random.Random(0)
+    values = sorted(rng.random() for _ in range(2000))
+    keys = [f"{rng.randrange(1, 2000)}{rng.choice('TCKM')}" for _ in range(2000)]
+
+    def run():
+        table = {}
+        for key, value in zip(keys, values):
+            table[key] = bisect.bisect_left(values, value)
+        return sorted(table.items())
+    return run, len(keys)
+
+
+def all_stages():
+    stages = [(f"timetable.next_k[{factor}x]", stage_next_k(factor)) for factor in (1, 10, 100)]
+    stages += [
+        ("delays.build[5000]", stage_delay_build(5000)),
+        ("delays.lookup[5000]", stage_delay_lookup(5000)),
+        ("odpt.parse[1000]", stage_odpt_parse(1000)),
+        ("odpt.parse[10000]", stage_odpt_parse(10000)),
+    ]
+    stages += [(f"status.parse[{os.path.splitext(os.path.basename(path))[0]}]",
+                stage_status_parse(path)) for path in sorted(glob.glob(FIXTURES))]
+    stages += [
+        ("bus.next_buses", stage_next_buses),
+        ("boards.lookup", stage_boards_lookup),
+        ("boards.update", stage_boards_update),
+        ("journey.profile", stage_journey_profile),
+    ]
+    return stages
+
+
+# ----------------------------------------------------------------------------
+# 計測
+# ----------------------------------------------------------------------------
+def measure(func, ops, repeat, min_time=0.05):
+    """
+    func の1件あたりの時間 (最速の回) と、1回の実行で確保されるメモリのピークを測る
+    """
+    func()  # 初回だけの準備 (遅延読み込みなど) を除く
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or number >= 1 << 16:
+            break
+        number *= 2
+
+    best = elapsed / number
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat - 1):
+            started = time.perf_counter()
+            for _ in range(number):
+                func()
+            best = min(best, (time.perf_counter() - started) / number)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    # tracemalloc は処理を遅くするので時間とは別に測る
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": best, "per_op_us": best / ops * 1e6, "ops": ops, "peak_bytes": peak}
+
+
+def stage_threshold(base, threshold):
+    """
+    段階の閾値 (1回の実行が短い段階は緩める)
+    """
+    if base["seconds"] < SHORT_STAGE_SECONDS:
+        return max(threshold, SHORT_STAGE_THRESHOLD)
+    return threshold
+
+
+def relative_time(result):
+    """
+    基準の処理の時間に対する段階の時間の比 (基準の時間がない古い結果は時間そのもの)
+    """
+    return result["seconds"] / result.get("reference_seconds", 1.0)
+
+
+def time_ratio(result, base):
+    """
+    ベースラインに対する時間の比
+    """
+    if "reference_seconds" not in base:
+        return result["seconds"] / base["seconds"] if base["seconds"] else 1.0
+    return relative_time(result) / relative_time(base) if base["seconds"] else 1.0
+
+
+def compare(results, baseline, threshold):
+    """
+    ベースラインと比べて閾値を超えた段階の (名前, 理由) のリストを返す
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        ratio = time_ratio(result, base)
+        if ratio > stage_threshold(base, threshold):
+            regressions.append((name, f"時間 {ratio:.2f}倍"))
+        if result["peak_bytes"] > base["peak_bytes"] * threshold + ALLOCATION_SLACK:
+            regressions.append(
+                (name, f"メモリ {result['peak_bytes'] / max(base['peak_bytes'], 1):.2f}倍"))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-k", "--filter", default="", help="名前にこの文字列を含む段階だけ実行する")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="ベースラインの何倍を超えたら失敗にするか")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="結果をベースラインとして保存する")
+    parser.add_argument("--output", help="結果を JSON で書き出すファイル")
+    args = parser.parse_args()
+
+    baseline = {}
+    baseline_report = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline_report = json.load(f)
+        baseline = baseline_report.get("stages", {})
+
+    reference_func, reference_ops = reference_workload()
+
+    def measure_relative(func, ops):
+        # 基準の処理を段階の直前に測る (実行中の負荷の変化も同じように受ける)
+        reference = measure(reference_func, reference_ops, args.repeat)["seconds"]
+        return dict(measure(func, ops, args.repeat), reference_seconds=reference)
+
+    results = {}
+    print(f"{'段階':<28} {'µs/件':>10} {'件数':>6} {'ピーク':>10} {'対ベースライン':>14}")
+    for name, setup in all_stages():
+        if args.filter not in name:
+            continue
+        func, ops = setup()
+        result = measure_relative(func, ops)
+        base = baseline.get(name)
+        for _ in range(CONFIRM_RUNS):
+            if base is None or time_ratio(result, base) <= stage_threshold(base, args.threshold):
+                break
+            result = min(result, measure_relative(func, ops), key=relative_time)
+        results[name] = result
+        versus = f"{time_ratio(result, base):.2f}x" if base else "-"
+        print(f"{name:<28} {result['per_op_us']:>10.2f} {ops:>6} "
+              f"{result['peak_bytes'] / 1024:>8.1f}Ki {versus:>14}")
+
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "stages": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.save:
+        # 一部の段階だけ実行した場合は、それ以外の段階のベースラインを残す
+        report["stages"] = {**baseline, **results}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"ベースラインを保存しました: {args.baseline}")
+        return
+
+    if not baseline:
+        print(f"エラー: ベースライン {args.baseline} がないため性能低下を確かめていません "
+              "(--save で保存できます)", file=sys.stderr)
+        sys.exit(EXIT_NO_BASELINE)
+    environment = (platform.python_version(), platform.machine())
+    comparable = (baseline_report.get("python"), baseline_report.get("machine")) == environment
+    if not comparable:
+        print(f"注意: ベースラインは Python {baseline_report.get('python')} "
+              f"({baseline_report.get('machine')}) で保存したものです。"
+              f"この環境は Python {environment[0]} ({environment[1]}) なので、"
+              "比較は参考として表示するだけで失敗にはしません", file=sys.stderr)
+    uncorrected = [name for name in results
+                   if name in baseline and "reference_seconds" not in baseline[name]]
+    if uncorrected:
+        print("注意: ベースラインに基準の処理の時間がない段階は、マシンの速さの違いを補正せずに"
+              f"比べています: {', '.join(uncorrected)} (--save で保存し直してください)",
+              file=sys.stderr)
+    missing = [name for name in results if name not in baseline]
+    if missing:
+        print(f"注意: ベースラインにない段階は比べていません: {', '.join(missing)}", file=sys.stderr)
+    regressions = compare(results, baseline, args.threshold)
+    for name, reason in regressions:
+        threshold = stage_threshold(baseline[name], args.threshold)
+        print(f"性能低下: {name} ({reason}, 閾値 {threshold}倍)")
+    sys.exit(1 if regressions and comparable else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import os
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+import metrics
+from timetable_index import parse_hhmm
+from timetable_store import CompiledTimetable, compile_store, load_timetable
+
+# -----------------------------------------------------------------------------
+# 設定
+# -----------------------------------------------------------------------------
+BUS_TYPE = "バス"
+SHUTTLE_TYPE = "シャトル"
+BUS_DESTINATION = "八王子駅南口"
+
+# 時刻表のソース (shuttle_bus_timetable.py) とコンパイル先
+BUS_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "shuttle_bus_timetable.py")
+BUS_STORE = os.path.splitext(BUS_SOURCE)[0] + ".ttbin"
+
+
+def bus_timetable_entries():
+    """
+    バス時刻表とシャトル運行期間を、電車の時刻表と同じ形の辞書のリストにする
+      バス    : time=キャンパス発, end_time=駅発着
+      シャトル: time=運行開始, end_time=運行終了, note=運行間隔
+    """
+    from shuttle_bus_timetable import BUS_TIMETABLE, SHUTTLE_PERIODS
+
+    entries = [{"time": campus_dep, "type": BUS_TYPE, "destination": BUS_DESTINATION,
+                "end_time": station_arr}
+               for campus_dep, station_arr in BUS_TIMETABLE]
+    entries += [{"time": start, "type": SHUTTLE_TYPE, "destination": BUS_DESTINATION,
+                 "end_time": end, "note": interval}
+                for start, end, interval in SHUTTLE_PERIODS]
+    return entries
+
+
+def _minute_of(now):
+    if isinstance(now, datetime):
+        return now.hour * 60 + now.minute
+    return parse_hhmm(now)
+
+
+# ----------------------------------------------------------------------------
+# バスの発車インデックス
+# ----------------------------------------------------------------------------
+class BusIndex:
+    """
+    バスの発車 (時点) とシャトル運行期間 (区間) を開始時刻順の1本の列にまとめたもの
+
+    電車と同じコンパイル済み時刻表 (CompiledTimetable) の上で二分探索する
+    シャトル運行期間は互いに重ならないこと
+    """
+
+    def __init__(self, table):
+        if not isinstance(table, CompiledTimetable):
+            table = CompiledTimetable(compile_store(table))
+        self.table = table
+        self.minutes = table.minutes
+
+        shuttle_code = None
+        for code in set(table.type_codes):
+            if table.string(code) == SHUTTLE_TYPE:
+                shuttle_code = code
+        self._shuttle_code = shuttle_code
+
+        # シャトル運行期間だけを取り出した区間の列
+        self.shuttle_positions = [position for position in range(len(table))
+                                  if table.type_codes[position] == shuttle_code]
+        self.shuttle_starts = [table.minutes[position] for position in self.shuttle_positions]
+        self.shuttle_ends = [table.end_minutes[position] for position in self.shuttle_positions]
+
+    def _current_shuttle(self, minute):
+        i = bisect_right(self.shuttle_starts, minute) - 1
+        if i >= 0 and minute <= self.shuttle_ends[i]:
+            return self.shuttle_positions[i]
+        return None
+
+    def in_shuttle(self, now):
+        """
+        現在シャトル運行中なら運行間隔の説明を、そうでなければ None を返す
+        """
+        position = self._current_shuttle(_minute_of(now))
+        if position is None:
+            return None
+        return self.table[position]["note"]
+
+    def next_buses(self, now, k=3):
+        """
+        現在時刻以降のバスを発車時刻順に最大k件返す
+        (運行中のシャトルも1件として数える)
+
+        各要素は次のいずれかの辞書
+          {"kind": "shuttle_now", "interval": ...}                  現在シャトル運行中
+          {"kind": "bus", "campus_departure": ..., "station_arrival": ...}
+          {"kind": "shuttle", "start": ..., "end": ..., "interval": ...}
+        """
+        with metrics.span("bus_lookup"):
+            return self._next_buses(_minute_of(now), k)
+
+    def _next_buses(self, minute, k):
+        buses = []
+        if k <= 0:
+            return buses
+
+        current = self._current_shuttle(minute)
+        if current is not None:
+            buses.append({"kind": "shuttle_now", "interval": self.table[current]["note"]})
+
+        table = self.table
+        position = bisect_left(self.minutes, minute)
+        while len(buses) < k and position < len(table):
+            entry = table[position]
+            if table.type_codes[position] != self._shuttle_code:
+                buses.append({"kind": "bus", "campus_departure": entry["time"],
+                              "station_arrival": entry["end_time"]})
+            elif position != current:
+                buses.append({"kind": "shuttle", "start": entry["time"],
+                              "end": entry["end_time"], "interval": entry["note"]})
+            position += 1
+        return buses
+
+
+# コンパイル済みの時刻表は mmap するだけで解析しない (import 時には開かず、初めて使うときに開く)
+_bus_index = None
+
+
+def get_bus_index():
+    """
+    バス・シャトルの BusIndex を返す
+    """
+    global _bus_index
+    if _bus_index is None:
+        _bus_index = BusIndex(load_timetable(BUS_STORE, BUS_SOURCE,
+                                             load_source=bus_timetable_entries))
+    return _bus_index
+
+
+def __getattr__(name):
+    # 時刻表は使われたときに初めて読み込む
+    if name == "BUS_INDEX":
+        return get_bus_index()
+    if name in ("BUS_TIMETABLE", "SHUTTLE_PERIODS"):
+        import shuttle_bus_timetable
+        return getattr(shuttle_bus_timetable, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# ----------------------------------------------------------------------------
+# 次のバスを見つける関数
+# ----------------------------------------------------------------------------
+def in_shuttle(now):
+    """
+    現在シャトル運行中なら運行間隔の説明を、そうでなければ None を返す
+    """
+    return get_bus_index().in_shuttle(now)
+
+
+def next_buses(now, k=3):
+    """
+    現在時刻以降のバスを発車時刻順に最大k件返す (BusIndex.next_buses を参照)
+    """
+    return get_bus_index().next_buses(now, k)
+
+
+def is_in_shuttle_period(time_str):
+    """
+    "HH:MM" がシャトル運行の時間帯なら運行間隔の説明を、そうでなければ None を返す
+    """
+    return in_shuttle(time_str)
+
+
+def find_next_buses(now, k=3):
+    """
+    現在時刻以降のバスを最大k件返す (next_buses と同じ)
+    """
+    return next_buses(now, k)
+
+
+def bus_lines(buses):
+    """
+    find_next_buses の結果の表示を1行ずつのリストで返す
+    """
+    lines = ["", "八王子駅⇔東京工科大学 シャトルバス時刻表（抜粋）", "-" * 50,
+             "八王子駅南口［発着所：片柳研究所西側］"]
+
+    for bus in buses:
+        if bus["kind"] == "shuttle_now":
+            lines.append(f"現在はシャトル運行中（{bus['interval']}）")
+        elif bus["kind"] == "bus":
+            lines.append(f"キャンパス発{bus['campus_departure']} → 駅発着{bus['station_arrival']}")
+        else:
+            lines.append(f"{bus['start']}〜{bus['end']} シャトル運行（{bus['interval']}）")
+
+    if not buses:
+        lines.append("本日の運行は終了しました。")
+    return lines
+
+
+def render_buses(buses):
+    """
+    find_next_buses の結果を表示する
+    """
+    print("\n".join(bus_lines(buses)))
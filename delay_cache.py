@@ -0,0 +1,177 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows ではプロセス間ロックなしで動作する
+    fcntl = None
+
+import metrics
+from delay_index import DelayIndex
+
+# -----------------------------------------------------------------------------
+# 設定
+# -----------------------------------------------------------------------------
+# ODPT の列車情報はおよそ30秒ごとに更新される
+DEFAULT_TTL = 30
+# TTL切れ後もこの秒数までは古い値を即座に返し、裏で更新する
+DEFAULT_STALE_TTL = 300
+DEFAULT_CACHE_PATH = os.path.join(tempfile.gettempdir(), "tell_me_chuoline_delays.json")
+
+
+# ----------------------------------------------------------------------------
+# ファイルロック
+# ----------------------------------------------------------------------------
+@contextmanager
+def _file_lock(lock_path, blocking=True):
+    """
+    lock_path を排他ロックする。blocking=False で取得できなければ False を返す
+    """
+    with open(lock_path, "a") as lock_file:
+        if fcntl is None:
+            yield True
+            return
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(lock_file, flags)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# ----------------------------------------------------------------------------
+# 遅延情報キャッシュ
+# ----------------------------------------------------------------------------
+class DelayCache:
+    """
+    遅延情報取得関数をTTL付きでキャッシュする (stale-while-revalidate)
+
+    キャッシュはファイルに保存し、ロックを取って一時ファイルから置き換えるため、
+    同時に起動した複数のプロセスでも取得は1回にまとまる
+      - TTL以内: キャッシュをそのまま返す (hit)
+      - TTL切れ〜stale_ttl以内: キャッシュを返しつつ裏で更新する (stale)
+      - それ以上古い / キャッシュなし: その場で取得する (miss)
+    取得関数が stale (取得失敗で前回の値を代用) の DelayIndex を返した場合は
+    キャッシュを書き換えず、キャッシュに残っている値を stale として返す
+    """
+
+    def __init__(self, fetch, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL,
+                 stale_ttl=DEFAULT_STALE_TTL, clock=time.time):
+        self.fetch = fetch
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.clock = clock
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0,
+                      "stale_fallbacks": 0}
+        self._refresh_thread = None
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+        metrics.count(f"delay_cache_{name}")
+
+    def _read(self):
+        """
+        キャッシュファイルを読み込み (取得時刻, 遅延情報) を返す。読めなければ None
+        """
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            return data["fetched_at"], DelayIndex(data["delays"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write(self, delays):
+        """
+        遅延情報を一時ファイルに書き出し、キャッシュファイルをアトミックに置き換える
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".delays-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"fetched_at": self.clock(), "delays": dict(delays)},
+                          f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _age(self, cached):
+        return self.clock() - cached[0]
+
+    def _fetch_and_store(self):
+        delays = self.fetch()
+        if not isinstance(delays, DelayIndex):
+            delays = DelayIndex(delays)
+        if delays.stale:
+            # 取得に失敗して前回の値で代用した結果は新しい値として保存しない
+            # キャッシュの方が新しければ (TTLを過ぎていても) そちらを返す
+            self._count("stale_fallbacks")
+            cached = self._read()
+            if cached is not None and (delays.fetched_at is None or cached[0] >= delays.fetched_at):
+                return DelayIndex(cached[1], stale=True, fetched_at=cached[0])
+            return delays
+        try:
+            self._write(delays)
+        except OSError:
+            # 書き込めなくても取得した値はそのまま使う
+            pass
+        return delays
+
+    def _refresh(self):
+        # 他のプロセスが更新中ならそちらに任せる
+        with _file_lock(self.lock_path, blocking=False) as locked:
+            if not locked:
+                return
+            cached = self._read()
+            if cached is not None and self._age(cached) < self.ttl:
+                return
+            self._count("refreshes")
+            self._fetch_and_store()
+
+    def refresh_in_background(self):
+        """
+        バックグラウンドでキャッシュを更新する (更新中なら何もしない)
+        """
+        if self._refresh_thread is not None and self._refresh_thread.is_alive():
+            return
+        # 非デーモンスレッドにして、CLI終了前に更新を書き終えるようにする
+        self._refresh_thread = threading.Thread(target=self._refresh, name="delay-cache-refresh")
+        self._refresh_thread.start()
+
+    def get(self):
+        """
+        遅延情報を DelayIndex で返す
+        """
+        cached = self._read()
+        if cached is not None:
+            age = self._age(cached)
+            if age < self.ttl:
+                self._count("hits")
+                return cached[1]
+            if age < self.stale_ttl:
+                self._count("stale_hits")
+                self.refresh_in_background()
+                return cached[1]
+
+        # キャッシュが使えない場合はロックを取って取得する
+        with _file_lock(self.lock_path):
+            # ロック待ちの間に他のプロセスが取得済みならそれを使う
+            cached = self._read()
+            if cached is not None and self._age(cached) < self.ttl:
+                self._count("hits")
+                return cached[1]
+            self._count("misses")
+            return self._fetch_and_store()
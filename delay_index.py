@@ -0,0 +1,83 @@
+from collections.abc import Mapping
+
+import metrics
+
+# -----------------------------------------------------------------------------
+# 列車番号の正規化
+# -----------------------------------------------------------------------------
+# 列車番号の末尾に付く種別記号 (T: 快速, C: 中央特快, K: かいじ など)
+TRAIN_NUMBER_SUFFIXES = 'TCKSLAFM'
+
+
+def normalize_train_number(train_number):
+    """
+    列車番号から末尾の種別記号と先頭のゼロを除いた基本番号を返す
+    ("0019T" → "19", "1504M" → "1504")
+    """
+    if not train_number:
+        return ""
+    base_number = train_number.strip().upper().rstrip(TRAIN_NUMBER_SUFFIXES)
+    return base_number.lstrip("0") or base_number
+
+
+# ----------------------------------------------------------------------------
+# 遅延情報のインデックス
+# ----------------------------------------------------------------------------
+class DelayIndex(Mapping):
+    """
+    {列車番号: 遅延秒数} を読み取り専用で保持し、基本番号での検索を O(1) で行う
+
+    検索の優先順位:
+      1. 列車番号の完全一致
+      2. 基本番号 (normalize_train_number) の一致
+         同じ基本番号の列車が複数ある場合は列車番号の辞書順で最初のもの
+    部分文字列では照合しないため "504" が "1504M" に一致することはない
+
+    stale は取得に失敗して前回の値 (または空) で代用していること、
+    fetched_at はその値を取得した時刻 (time.time()) を表す
+    """
+
+    def __init__(self, delays=None, stale=False, fetched_at=None):
+        self._delays = dict(delays or {})
+        self.stale = stale
+        self.fetched_at = fetched_at
+        self._by_base = {}
+        with metrics.span("delay_index_build"):
+            for train_number in sorted(self._delays):
+                base_number = normalize_train_number(train_number)
+                if base_number:
+                    self._by_base.setdefault(base_number, self._delays[train_number])
+        self.max_delay = max(0, max(self._delays.values(), default=0))
+        self.min_delay = min(0, min(self._delays.values(), default=0))
+
+    def __getitem__(self, train_number):
+        return self._delays[train_number]
+
+    def __iter__(self):
+        return iter(self._delays)
+
+    def __len__(self):
+        return len(self._delays)
+
+    def __repr__(self):
+        return f"DelayIndex({self._delays!r})"
+
+    def lookup(self, train_number):
+        """
+        時刻表の列車番号に対応する遅延秒数を返す (見つからなければ 0)
+        """
+        if not train_number:
+            return 0
+        delay_seconds = self._delays.get(train_number)
+        if delay_seconds is not None:
+            return delay_seconds
+        return self._by_base.get(normalize_train_number(train_number), 0)
+
+
+def as_delay_index(delays):
+    """
+    遅延情報を DelayIndex に変換する (既に DelayIndex ならそのまま返す)
+    """
+    if isinstance(delays, DelayIndex):
+        return delays
+    return DelayIndex(delays)
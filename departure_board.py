@@ -0,0 +1,219 @@
+"""
+運行日の1分ごとの「次のk本」をあらかじめ計算しておく発車標
+
+問い合わせの答えは運行日の分 (4:00〜翌3:59 の1,440通り) だけで決まるため、
+全ての分について TimetableIndex.next_k の結果を計算して配列に持ち、
+問い合わせは配列の添字1回で済ませる
+
+遅延が変わったときは、その列車が結果に入りうる分の範囲だけを計算し直す
+  - 列車の実発車秒 a が結果に入るのは、その分の時刻 < a かつ a <= k本目の実発車秒 のとき
+  - k本目の実発車秒は分について単調増加なので、範囲は二分探索で求まる
+  - 変更前・変更後の実発車秒と、翌運行日に回り込んだ分 (+24時間) のそれぞれについて範囲を求める
+  - 最大遅延が大きく k本目が約1日後に回り込む分があると、翌運行日の列車の扱いが分ごとに
+    変わって k本目が単調でなくなるので、その場合は全ての分を計算し直す
+
+遅延が分の途中 (60秒の倍数でない) になる列車がある分と、k本目が翌運行日に回り込んで
+走査の開始位置にかかる分は、秒によって結果が変わるため配列には持たず、
+その都度 next_k で計算する
+"""
+import math
+import sys
+from bisect import bisect_left
+
+from delay_index import as_delay_index
+from timetable_index import (SECONDS_PER_DAY, SERVICE_DAY_START_HOUR, format_service_seconds,
+                             service_clock)
+
+# -----------------------------------------------------------------------------
+# 設定
+# -----------------------------------------------------------------------------
+FIRST_MINUTE = SERVICE_DAY_START_HOUR * 60
+MINUTES_PER_DAY = 24 * 60
+INFINITY = float("inf")
+
+
+# ----------------------------------------------------------------------------
+# 発車標
+# ----------------------------------------------------------------------------
+class DepartureBoards:
+    """
+    運行日の分ごとの次のk本 (TimetableIndex.next_k と同じ辞書のリスト) を持つ表
+
+    lookup() が返すリストと辞書は複数の分・問い合わせで共有しているので変更しないこと
+    update() で遅延情報を差し替えると、結果が変わりうる分だけを計算し直す
+
+    update() / rebuild() は表の複製に計算し直してから
+    (表, 分の途中の分, 回り込む分, 遅延情報) の組をまとめて差し替えるので、
+    別のスレッドの lookup() はロックなしで常に
+    どちらか一方の遅延情報だけに基づく結果を受け取る (更新は1スレッドから行うこと)
+    """
+
+    def __init__(self, index, delays=None, k=3):
+        self.index = index
+        self.k = k
+        self.stats = {"full_builds": 0, "updates": 0, "rebuilt_minutes": 0}
+        self._build(as_delay_index(delays))
+
+    # --- 構築 -----------------------------------------------------------------
+    def _effective_delays(self, delays):
+        return [delays.lookup(entry.get("train_number")) for entry in self.index.entries]
+
+    def _publish(self, boards, kth_actual, split_counts, delays):
+        # lookup() は _view を1回読むだけなので、組の中身が食い違うことはない
+        self.boards = boards
+        self.kth_actual = kth_actual
+        self._split_counts = split_counts
+        self.delays = delays
+        wrapping = self._wrapping_minutes(kth_actual, delays.max_delay)
+        self._view = (boards, split_counts, wrapping, delays)
+
+    def _build(self, delays):
+        self._position_delays = self._effective_delays(delays)
+        self._results = {}
+        boards = [None] * MINUTES_PER_DAY
+        kth_actual = [INFINITY] * MINUTES_PER_DAY
+        split_counts = {}
+        for position, delay_seconds in enumerate(self._position_delays):
+            self._count_split(split_counts, position, delay_seconds, 1)
+        for i in range(MINUTES_PER_DAY):
+            self._build_minute(boards, kth_actual, i, delays)
+        self._publish(boards, kth_actual, split_counts, delays)
+        self.stats["full_builds"] += 1
+
+    def _actual_times(self, position, delay_seconds):
+        scheduled = self.index.minutes[position] * 60
+        return (scheduled + delay_seconds, scheduled + delay_seconds + SECONDS_PER_DAY)
+
+    def _count_split(self, split_counts, position, delay_seconds, step):
+        # 分の途中に発車する列車の数を分ごとに数えておく
+        if delay_seconds % 60 == 0:
+            return
+        for actual in self._actual_times(position, delay_seconds):
+            i = actual // 60 - FIRST_MINUTE
+            if 0 <= i < MINUTES_PER_DAY:
+                count = split_counts.get(i, 0) + step
+                if count:
+                    split_counts[i] = count
+                else:
+                    del split_counts[i]
+
+    def _result(self, scheduled, actual, delay_seconds, position):
+        # 同じ列車の結果の辞書は、それが含まれる全ての分で共有する
+        key = (scheduled, delay_seconds, position)
+        result = self._results.get(key)
+        if result is None:
+            result = self.index.entries[position].copy()
+            result['scheduled_time'] = format_service_seconds(scheduled)
+            result['actual_time'] = format_service_seconds(actual)
+            result['delay_minutes'] = delay_seconds // 60
+            self._results[key] = result
+        return result
+
+    def _build_minute(self, boards, kth_actual, i, delays):
+        selected = self.index.select((FIRST_MINUTE + i) * 60, self.k, delays)
+        boards[i] = [self._result(*item) for item in selected]
+        kth_actual[i] = selected[-1][1] if len(selected) == self.k else INFINITY
+
+    # --- 問い合わせ -----------------------------------------------------------
+    def lookup(self, now):
+        """
+        now 以降に発車する電車を最大k本返す (next_k(now, k, delays) と同じ結果)
+        """
+        boards, split_counts, wrapping, delays = self._view
+        _, seconds = service_clock(now)
+        i = int(seconds // 60) - FIRST_MINUTE
+        if i in split_counts or i in wrapping:
+            return self.index.next_k(now, self.k, delays)
+        return boards[i]
+
+    # --- 差分更新 -------------------------------------------------------------
+    @staticmethod
+    def _wrapping_minutes(kth_actual, max_delay):
+        """
+        最大遅延が max_delay のとき、k本目が翌運行日に回り込んで走査の開始位置に
+        かかる分の添字 (これらの分では k本目は分について単調とは限らない)
+        """
+        # 走査の開始位置 (現在時刻 - 最大遅延) の1日後より先の列車は、分や秒によって
+        # 当日の列車として走査されたり翌運行日の列車として走査されたりする
+        margin = SECONDS_PER_DAY - max_delay - 60
+        return frozenset(i for i, kth in enumerate(kth_actual)
+                         if kth >= (FIRST_MINUTE + i) * 60 + margin)
+
+    def _affected_range(self, actual):
+        """
+        実発車秒 actual の列車が結果に入りうる分の添字の範囲 [lo, hi)
+        """
+        hi = min(math.ceil(actual / 60) - FIRST_MINUTE, MINUTES_PER_DAY)
+        lo = bisect_left(self.kth_actual, actual)
+        return lo, max(lo, hi)
+
+    def update(self, delays, positions=None):
+        """
+        遅延情報を差し替え、結果が変わりうる分だけを計算し直す
+        positions (時刻表の位置) を渡すとその列車だけを比べる
+        (TrainStateStore の変更なら AffectedEntries.positions で求められる)
+        戻り値は計算し直した分の数
+        """
+        delays = as_delay_index(delays)
+        old_delays = self.delays
+        if self._wrapping_minutes(self.kth_actual, max(delays.max_delay, old_delays.max_delay)):
+            # 範囲を二分探索で求められないので全体を作り直す (列車が少ない時刻表か、
+            # 1日近い遅延がある場合だけ)
+            self._build(delays)
+            self.stats["updates"] += 1
+            self.stats["rebuilt_minutes"] += MINUTES_PER_DAY
+            return MINUTES_PER_DAY
+        if positions is None:
+            positions = range(len(self.index))
+
+        # 問い合わせ中の表は変更せず、複製に計算し直してから差し替える
+        split_counts = dict(self._split_counts)
+        position_delays = list(self._position_delays)
+        ranges = []
+        for position in positions:
+            entry = self.index.entries[position]
+            old = position_delays[position]
+            new = delays.lookup(entry.get("train_number"))
+            if old == new:
+                continue
+            for actual in self._actual_times(position, old) + self._actual_times(position, new):
+                ranges.append(self._affected_range(actual))
+            self._count_split(split_counts, position, old, -1)
+            self._count_split(split_counts, position, new, 1)
+            position_delays[position] = new
+
+        minutes = set()
+        for lo, hi in ranges:
+            minutes.update(range(lo, hi))
+        boards = list(self.boards)
+        kth_actual = list(self.kth_actual)
+        for i in sorted(minutes):
+            self._build_minute(boards, kth_actual, i, delays)
+        self._position_delays = position_delays
+        self._publish(boards, kth_actual, split_counts, delays)
+        if minutes:
+            # 遅延が変わった列車の古い結果はもうどの分からも参照されない
+            self._results = {key: result for key, result in self._results.items()
+                             if key[1] == position_delays[key[2]]}
+        self.stats["updates"] += 1
+        self.stats["rebuilt_minutes"] += len(minutes)
+        return len(minutes)
+
+    def rebuild(self, delays=None):
+        """
+        全ての分を計算し直す
+        """
+        self._build(self.delays if delays is None else as_delay_index(delays))
+
+    def memory_bytes(self):
+        """
+        表が使っているおおよそのメモリ量 (バイト)
+        時刻表のエントリ自体は含めない
+        """
+        size = sys.getsizeof(self.boards) + sys.getsizeof(self.kth_actual)
+        size += sum(sys.getsizeof(board) for board in self.boards)
+        size += sum(sys.getsizeof(kth) for kth in self.kth_actual)
+        size += sys.getsizeof(self._results)
+        for result in self._results.values():
+            size += sys.getsizeof(result) + sum(sys.getsizeof(value) for value in result.values())
+        return size
@@ -0,0 +1,438 @@
+import asyncio
+import random
+import threading
+import time
+
+import metrics
+from odpt_client import ALTERNATIVE_API_URL, REALTIME_API_URL, fetch_train_data, fetch_train_snapshot
+
+# -----------------------------------------------------------------------------
+# 設定
+# -----------------------------------------------------------------------------
+# 全ての取得元をまとめて待つ時間の上限 (秒)
+DEFAULT_BUDGET = 8.0
+# 主系APIがこの秒数 (p95 応答時間) 以内に応答しなければ代替APIも並行して叩く
+DEFAULT_HEDGE_AFTER = 2.0
+
+# 取得処理を同時に動かすスレッドの上限 (requests は同期APIのためスレッドで並行実行する)
+MAX_WORKERS = 8
+# 取得元ごとの期限は全体の期限よりこの秒数だけ短くし、取得元が自分で諦めて
+# 前回値などを返すのを全体の期限切れより先にする
+SOURCE_MARGIN = 0.25
+
+# 1回の取得で試す回数の上限 (最初の1回を含む) と、再試行の待ち時間 (指数バックオフ + ジッター)
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 0.2
+BACKOFF_CAP = 2.0
+# 取得先ごとのサーキットブレーカー: 連続してこの回数失敗したら開き、RESET_TIMEOUT 秒後に1回だけ試す
+FAILURE_THRESHOLD = 3
+RESET_TIMEOUT = 30.0
+
+_session = None
+_session_lock = threading.Lock()
+_worker_slots = threading.BoundedSemaphore(MAX_WORKERS)
+
+
+def get_session():
+    """
+    Keep-Alive で接続を使い回す共有セッションを返す
+    (環境変数で上流の応答の記録・再生を設定していればそれも組み込む)
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+            # 環境変数 UPSTREAM_RECORD / UPSTREAM_REPLAY で応答を記録・再生する
+            import upstream_log
+            upstream_log.configure_session(_session, pool_connections=4,
+                                           pool_maxsize=MAX_WORKERS)
+        return _session
+
+
+def _resolve(future, result=None, error=None):
+    # 呼び出し側がキャンセル (期限切れ) した Future には何もしない
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+def run_in_thread(func, *args, **kwargs):
+    """
+    同期関数を取得用スレッドで実行する Future を返す
+
+    期限切れで見捨てた取得がプロセスの終了を待たせないよう、スレッドプール
+    (終了時に全てのスレッドを join する) ではなくデーモンスレッドで動かす
+    同時に動くのは MAX_WORKERS 件まで
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def run():
+        with _worker_slots:
+            try:
+                outcome = {"result": func(*args, **kwargs)}
+            except Exception as e:
+                outcome = {"error": e}
+        try:
+            loop.call_soon_threadsafe(lambda: _resolve(future, **outcome))
+        except RuntimeError:
+            # イベントループが既に閉じている (見捨てられた取得)
+            pass
+
+    threading.Thread(target=run, name="fetch", daemon=True).start()
+    return future
+
+
+# ----------------------------------------------------------------------------
+# サーキットブレーカーと再試行
+# ----------------------------------------------------------------------------
+class CircuitOpenError(RuntimeError):
+    """
+    全ての取得先のサーキットが開いていて、リクエストを送らなかった
+    """
+
+
+class CircuitBreaker:
+    """
+    取得先ごとのサーキットブレーカー
+
+      - closed: 通常どおりリクエストを送る。failure_threshold 回続けて失敗したら open
+      - open: reset_timeout 秒の間はリクエストを送らずにすぐ失敗する
+      - half_open: reset_timeout 秒経ったら1件だけ試し、成功なら closed・失敗なら再び open
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT,
+                 clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        リクエストを送ってよければ True を返す (half_open では1件だけ許可する)
+        True を返した場合は record_success / record_failure のどちらかを必ず呼ぶこと
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                if self.clock() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    metrics.count("circuit_opened")
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+
+
+class RetryBudget:
+    """
+    プロセス全体で共有する再試行の予算 (トークンバケット)
+
+    リクエスト1件ごとに ratio 個、時間経過で毎秒 min_per_second 個のトークンがたまり、
+    再試行1回ごとに1個使う。障害時に全ての呼び出しが再試行して負荷を増やさないよう、
+    再試行はおおむね通常のリクエストの ratio 倍までに抑えられる
+    """
+
+    def __init__(self, ratio=0.2, min_per_second=0.1, max_tokens=3.0, clock=time.monotonic):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.clock = clock
+        self.tokens = max_tokens
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.max_tokens,
+                          self.tokens + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def record_request(self):
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self):
+        """
+        再試行してよければトークンを1個使って True を返す
+        """
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+        metrics.count("retry_budget_exhausted")
+        return False
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP, rng=random):
+    """
+    attempt 回目の再試行の前に待つ秒数 (指数バックオフに full jitter をかけたもの)
+    """
+    return rng.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def is_retryable(error):
+    """
+    再試行して意味のある失敗か (接続エラー・タイムアウト・5xx・429 なら True)
+    認証エラーなどの 4xx は何度送っても同じなので再試行せず、取得先の障害とも数えない
+    """
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    return status is None or status >= 500 or status == 429
+
+
+def _fetch_guarded(fetch, breaker, url, params, session, timeout):
+    # スレッド側で結果を記録するため、呼び出し側がキャンセルしても記録は漏れない
+    try:
+        result = fetch(url, params, session, timeout)
+    except Exception as e:
+        if breaker is not None:
+            if is_retryable(e):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+        raise
+    if breaker is not None:
+        breaker.record_success()
+    return result
+
+
+# ----------------------------------------------------------------------------
+# 列車情報のヘッジ付き取得
+# ----------------------------------------------------------------------------
+async def fetch_train_data_hedged(params, timeout=DEFAULT_BUDGET,
+                                  hedge_after=DEFAULT_HEDGE_AFTER,
+                                  urls=(REALTIME_API_URL, ALTERNATIVE_API_URL),
+                                  fetch=fetch_train_data, breakers=None):
+    """
+    主系APIから列車情報を取得し、hedge_after 秒以内に応答がないか失敗した場合は
+    代替APIにも並行してリクエストを送り、先に成功した方の結果を返す
+
+    fetch は fetch(url, params, session, timeout) の形の取得関数
+    (既定は応答全体を返す fetch_train_data。逐次解析するなら odpt_client.fetch_train_delays)
+    breakers ({URL: CircuitBreaker}) を渡すと、サーキットが開いている取得先は飛ばす
+    戻り値は (取得元URL, fetch の結果)。全て失敗した場合は最初に送った取得先の例外を、
+    1件も送れなかった場合は CircuitOpenError を送出する
+    """
+    session = get_session()
+    candidates = list(urls)
+    sources = {}
+
+    def launch():
+        while candidates:
+            url = candidates.pop(0)
+            breaker = breakers.get(url) if breakers else None
+            if breaker is not None and not breaker.allow():
+                metrics.count("circuit_short_circuits")
+                continue
+            task = asyncio.ensure_future(
+                run_in_thread(_fetch_guarded, fetch, breaker, url, params, session, timeout))
+            sources[task] = url
+            return task
+        return None
+
+    primary = launch()
+    if primary is None:
+        raise CircuitOpenError("全ての取得先のサーキットが開いています")
+
+    done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+    if not done or primary.exception() is not None:
+        if launch() is not None:
+            metrics.count("odpt_hedges")
+            while launch() is not None:
+                pass
+
+    pending = set(sources)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if sources[task] != urls[0]:
+                        metrics.count("odpt_fallbacks")
+                    return sources[task], task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+    raise primary.exception()
+
+
+# ----------------------------------------------------------------------------
+# 再試行・サーキットブレーカー・前回値へのフォールバック付きの取得
+# ----------------------------------------------------------------------------
+class ResilientFetcher:
+    """
+    fetch_train_data_hedged を再試行・サーキットブレーカー付きで呼び出し、
+    最後に成功した結果 (last known good) を覚えておく
+
+      - 失敗したら指数バックオフ + ジッターを挟み、budget 秒の期限内で最大 max_attempts 回試す
+      - 再試行は RetryBudget (プロセス全体で共有) の範囲内でだけ行う
+      - 全ての取得先のサーキットが開いているときはリクエストを送らずにすぐ諦める
+      - 諦めたときに前回の成功結果があればそれを stale として返し、なければ例外を送出する
+
+    fetch() の戻り値は {"value": 結果, "source": 取得元URL (前回値なら None),
+    "stale": 前回値か, "fetched_at": 結果を取得した時刻 (time.time()), "attempts": 試した回数}
+    """
+
+    def __init__(self, fetch=fetch_train_snapshot,
+                 urls=(REALTIME_API_URL, ALTERNATIVE_API_URL), budget=DEFAULT_BUDGET,
+                 hedge_after=DEFAULT_HEDGE_AFTER, max_attempts=MAX_ATTEMPTS,
+                 failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT,
+                 retry_budget=None, clock=time.monotonic, rng=None):
+        self.fetch_func = fetch
+        self.urls = tuple(urls)
+        self.budget = budget
+        self.hedge_after = hedge_after
+        self.max_attempts = max_attempts
+        self.breakers = {url: CircuitBreaker(url, failure_threshold, reset_timeout, clock)
+                         for url in self.urls}
+        self.retry_budget = retry_budget or RetryBudget(clock=clock)
+        self.rng = rng or random.Random()
+        self.last_good = None
+        self.last_good_at = None
+        self.stats = {"requests": 0, "retries": 0, "failures": 0, "stale": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+        metrics.count(f"fetch_{name}")
+
+    async def fetch_async(self, params, budget=None, hedge_after=None):
+        """
+        params で取得する (イベントループ内から呼び出す版)
+        """
+        budget = self.budget if budget is None else budget
+        hedge_after = self.hedge_after if hedge_after is None else hedge_after
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + budget
+        self._count("requests")
+        self.retry_budget.record_request()
+
+        attempts = 0
+        while True:
+            attempts += 1
+            remaining = deadline - loop.time()
+            try:
+                url, value = await asyncio.wait_for(
+                    fetch_train_data_hedged(params, timeout=remaining,
+                                            hedge_after=min(hedge_after, remaining),
+                                            urls=self.urls, fetch=self.fetch_func,
+                                            breakers=self.breakers),
+                    remaining)
+            except CircuitOpenError as e:
+                error = e
+                break
+            except Exception as e:
+                error = e
+                if (not is_retryable(e) or attempts >= self.max_attempts
+                        or not self.retry_budget.try_spend()):
+                    break
+                delay = backoff_delay(attempts - 1, rng=self.rng)
+                if loop.time() + delay >= deadline:
+                    break
+                self._count("retries")
+                await asyncio.sleep(delay)
+                continue
+
+            fetched_at = time.time()
+            with self._lock:
+                self.last_good = value
+                self.last_good_at = fetched_at
+            return {"value": value, "source": url, "stale": False,
+                    "fetched_at": fetched_at, "attempts": attempts}
+
+        self._count("failures")
+        with self._lock:
+            last_good, last_good_at = self.last_good, self.last_good_at
+        if last_good is None:
+            raise error
+        self._count("stale")
+        return {"value": last_good, "source": None, "stale": True,
+                "fetched_at": last_good_at, "attempts": attempts, "error": error}
+
+    def fetch(self, params, budget=None, hedge_after=None):
+        """
+        fetch_async の同期版 (イベントループ外から呼び出す)
+        """
+        return asyncio.run(self.fetch_async(params, budget, hedge_after))
+
+    def circuit_states(self):
+        """
+        取得先ごとのサーキットの状態 {URL: "closed" / "open" / "half_open"}
+        """
+        return {url: breaker.state for url, breaker in self.breakers.items()}
+
+
+# ----------------------------------------------------------------------------
+# 複数の取得元をまとめて取得
+# ----------------------------------------------------------------------------
+async def fetch_sources(sources, budget=DEFAULT_BUDGET):
+    """
+    {名前: 引数なしの同期関数} を並行して実行し、budget 秒以内に終わったものの
+    結果を返す
+
+    戻り値は (結果の辞書, エラーの辞書)。期限切れのものは TimeoutError になる
+    """
+    tasks = {asyncio.ensure_future(run_in_thread(fetch)): name
+             for name, fetch in sources.items()}
+    results = {}
+    errors = {}
+    if not tasks:
+        return results, errors
+
+    done, pending = await asyncio.wait(tasks, timeout=budget)
+    for task in done:
+        if task.exception() is None:
+            results[tasks[task]] = task.result()
+        else:
+            errors[tasks[task]] = task.exception()
+    for task in pending:
+        task.cancel()
+        errors[tasks[task]] = TimeoutError(f"{budget}秒以内に応答がありませんでした")
+    return results, errors
+
+
+def fetch_sources_sync(sources, budget=DEFAULT_BUDGET):
+    """
+    fetch_sources の同期版 (イベントループ外から呼び出す)
+    """
+    return asyncio.run(fetch_sources(sources, budget))
@@ -1,113 +1,142 @@
-import requests
-import json
-from datetime import datetime, timedelta
+from datetime import datetime
+import functools
 import os
-from dotenv import load_dotenv
-from bs4 import BeautifulSoup
+import sys
+import time
+
+import metrics
+from delay_cache import DelayCache, DEFAULT_CACHE_PATH, DEFAULT_STALE_TTL, DEFAULT_TTL
+from odpt_client import (REALTIME_API_URL, TrainSnapshot, build_params, fetch_train_snapshot,
+                         snapshot_delays)
+
+# requests / dotenv と、asyncio を使う fetch_pipeline・service_status は起動を速くするため、
+# 使う関数の中で遅延 import する
 
 # -----------------------------------------------------------------------------
 # 設定
 # -----------------------------------------------------------------------------
-load_dotenv()
-ACCESS_TOKEN = os.getenv("ACCESS_TOKEN")
+_env_loaded = False
+
+
+def load_env():
+    """
+    .env ファイルを環境変数に読み込む (初回呼び出し時のみ)
+    """
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+
+def get_access_token():
+    """
+    ODPT API のアクセストークンを返す
+    """
+    load_env()
+    return os.getenv("ACCESS_TOKEN")
+
+
+def get_fetch_budget():
+    """
+    全ての取得元をまとめて待つ秒数 (環境変数 FETCH_BUDGET で設定)
+    """
+    from fetch_pipeline import DEFAULT_BUDGET
 
-# リアルタイム列車情報API (2025年更新版)
-REALTIME_API_URL = "https://api.odpt.org/api/v4/odpt:Train"
+    load_env()
+    return float(os.getenv("FETCH_BUDGET", DEFAULT_BUDGET))
+
+
+def get_source_timeout():
+    """
+    取得元ごとの期限 (秒)。全体の期限 (FETCH_BUDGET) より少し短くし、期限内に
+    取得元が自分で諦めて結果 (前回値など) を返せるようにする
+    """
+    from fetch_pipeline import SOURCE_MARGIN
+
+    budget = get_fetch_budget()
+    return max(budget - SOURCE_MARGIN, budget / 2)
+
+
+def get_hedge_after():
+    """
+    代替APIへのヘッジを始めるまでの秒数 (環境変数 FETCH_HEDGE_AFTER で設定)
+    """
+    from fetch_pipeline import DEFAULT_HEDGE_AFTER
+
+    load_env()
+    return float(os.getenv("FETCH_HEDGE_AFTER", DEFAULT_HEDGE_AFTER))
 
 # -----------------------------------------------------------------------------
 # 手動で作成した時刻表データ (八王子駅・平日・上り方面)は外部ファイルに分離
+# 初めて使うときにコンパイル済みの列指向ファイル (hachioji_timetable.ttbin) を mmap して使う
 # -----------------------------------------------------------------------------
-from hachioji_timetable import HACHIOJI_TIMETABLE_UP_WEEKDAY
+from timetable_index import compile_timetable
+from timetable_store import CompiledTimetable, load_timetable
+from delay_index import DelayIndex
+from bus_timetable import next_buses, render_buses
 
 # -----------------------------------------------------------------------------
 # リアルタイムの遅延情報を取得する関数
 # -----------------------------------------------------------------------------
-def get_realtime_delays():
+# プロセス内で共有する取得処理 (サーキットの状態と前回の取得結果を持つ。初回利用時に作成)
+_train_fetcher = None
+
+
+def get_train_fetcher():
     """
-    JR中央線(快速)のリアルタイム列車情報をAPIから取得し、
-    {列車番号: 遅延秒数} の辞書形式で返す
-    """
-    # 2025年API仕様に準拠したパラメータ
-    params = {
-        "acl:consumerKey": ACCESS_TOKEN,
-        "odpt:railway": "odpt.Railway:JR-East.ChuoRapid",
-        "odpt:operator": "odpt.Operator:JR-East"
-    }
-    
-    # 2025年API仕様に準拠したヘッダー
-    headers = {
-        "Accept": "application/json",
-        "User-Agent": "TrainInfoApp/1.0"
-    }
-    
-    delays = {}
+    列車情報の取得処理 (再試行・サーキットブレーカー付き) を返す
+    """
+    global _train_fetcher
+    if _train_fetcher is None:
+        from fetch_pipeline import ResilientFetcher
+
+        _train_fetcher = ResilientFetcher(fetch_train_snapshot, budget=get_fetch_budget(),
+                                          hedge_after=get_hedge_after())
+    return _train_fetcher
+
+
+def get_realtime_snapshot(hedge_after=None, timeout=15):
+    """
+    JR中央線(快速)のリアルタイム列車情報をAPIから取得し、八王子駅の列車ごとの
+    {列車番号: {"delay": 遅延秒数, "from_station": 駅ID, "to_station": 駅ID}} を
+    TrainSnapshot で返す
+
+    主系APIが hedge_after 秒以内に応答しない場合は代替APIにも並行して問い合わせ、
+    失敗した場合は timeout 秒の期限内で再試行する。取得できなかった場合は
+    前回取得した値を、それもなければ空の辞書を stale=True で返す
+    (イベントループ内からは呼び出さないこと)
+    """
+    import asyncio
+    import requests
+    from fetch_pipeline import CircuitOpenError
+
+    params = build_params(get_access_token())
+
+    snapshot = TrainSnapshot(stale=True)
     try:
-        # print("リアルタイム遅延情報を取得中...")
-        response = requests.get(REALTIME_API_URL, params=params, headers=headers, timeout=15)
-        
-        # レスポンスの詳細を出力
-        # print(f"ステータスコード: {response.status_code}")
-        # print(f"リクエストURL: {response.url}")
-        
-        # 200 OK 以外の場合はエラーとして処理
-        response.raise_for_status()
-        train_data = response.json()
-        
-        # print(f"取得したデータ件数: {len(train_data)}")
-        
-        if train_data:
-            # デバッグ用：最初の3件のデータを表示
-            # print("取得データの例:")
-            # for i, train in enumerate(train_data[:3]):
-            #     print(f"  {i+1}. 列車ID: {train.get('owl:sameAs', 'N/A')}")
-            #     print(f"     列車番号: {train.get('odpt:trainNumber', 'N/A')}")
-            #     print(f"     遅延: {train.get('odpt:delay', 0)}秒")
-            #     print(f"     現在位置: {train.get('odpt:fromStation', 'N/A')} → {train.get('odpt:toStation', 'N/A')}")
-            
-            for train in train_data:
-                # 2025年API仕様での列車番号取得
-                train_number = train.get("odpt:trainNumber")
-                
-                # 遅延情報の取得（秒単位）
-                delay_seconds = train.get("odpt:delay", 0)
-                
-                # 列車の現在位置情報
-                from_station = train.get("odpt:fromStation", "")
-                to_station = train.get("odpt:toStation", "")
-                
-                # 八王子駅に関連する列車のみを対象にする
-                hachioji_station = "odpt.Station:JR-East.ChuoRapid.Hachioji"
-                
-                if train_number and (hachioji_station in from_station or 
-                                   "Hachioji" in from_station or
-                                   "八王子" in str(train.get("odpt:trainInformationText", ""))):
-                    delays[train_number] = delay_seconds
-                    # print(f"  列車番号: {train_number}, 遅延: {delay_seconds}秒")
-                    # print(f"    現在位置: {from_station} → {to_station}")
-            
-            # print(f"リアルタイムの遅延情報を取得しました。対象列車数: {len(delays)}")
-        else:
-            # print("現在、走行中の列車情報はありません。")
-            pass
+        # 応答は読みながら解析し、八王子駅の列車だけを取り出す
+        result = get_train_fetcher().fetch(params, budget=timeout, hedge_after=hedge_after)
+        snapshot = TrainSnapshot(result["value"], stale=result["stale"],
+                                 fetched_at=result["fetched_at"], source=result["source"])
+        if snapshot.stale:
+            age = time.time() - snapshot.fetched_at
+            print(f"列車情報を取得できませんでした ({result['error']})。"
+                  f"{age:.0f}秒前に取得した遅延情報を表示します。")
+        elif snapshot.source != REALTIME_API_URL:
+            print(f"代替API成功: {len(snapshot)}件の列車情報を取得")
 
     except requests.exceptions.HTTPError as http_err:
         print(f"HTTPエラー: {http_err}")
         if hasattr(http_err.response, 'text'):
             print(f"エラー詳細: {http_err.response.text[:500]}")
-        
-        # 2025年API仕様での代替エンドポイントを試行
-        try:
-            print("代替APIエンドポイントを試行中...")
-            alternative_url = "https://api-tokyochallenge.odpt.org/api/v4/odpt:Train"
-            response = requests.get(alternative_url, params=params, headers=headers, timeout=15)
-            if response.status_code == 200:
-                train_data = response.json()
-                print(f"代替API成功: {len(train_data)}件のデータを取得")
-                # 上記と同じ処理ロジックを適用
-                # ...existing code...
-        except:
-            print("代替APIも失敗しました。")
-        
+        print("代替APIも失敗しました。")
+        print("リアルタイム遅延情報の取得をスキップします。定刻での表示を行います。")
+    except CircuitOpenError as circuit_err:
+        print(f"{circuit_err} (直前の取得が続けて失敗したため、しばらく問い合わせを控えます)")
+        print("リアルタイム遅延情報の取得をスキップします。定刻での表示を行います。")
+    except asyncio.TimeoutError:
+        print(f"{timeout}秒以内に列車情報を取得できませんでした。")
         print("リアルタイム遅延情報の取得をスキップします。定刻での表示を行います。")
     except requests.exceptions.RequestException as req_err:
         print(f"リクエストエラー: {req_err}")
@@ -115,63 +144,176 @@ def get_realtime_delays():
     except Exception as e:
         print(f"予期せぬエラー: {e}")
         print("リアルタイム遅延情報の取得をスキップします。定刻での表示を行います。")
-        
-    return delays
+
+    return snapshot
+
+
+def get_realtime_delays(hedge_after=None, timeout=15):
+    """
+    JR中央線(快速)のリアルタイム列車情報をAPIから取得し、
+    {列車番号: 遅延秒数} の DelayIndex (読み取り専用の辞書) で返す
+    """
+    # 遅延情報ごとに一度だけ列車番号のインデックスを構築する
+    snapshot = get_realtime_snapshot(hedge_after, timeout)
+    return DelayIndex(snapshot_delays(snapshot), stale=snapshot.stale,
+                      fetched_at=snapshot.fetched_at)
+
+
+# 複数のプロセスで共有するファイルキャッシュ (初回利用時に作成)
+_delay_cache = None
+
+
+def get_delay_cache():
+    """
+    遅延情報キャッシュを返す
+    TTL・保存先は環境変数 DELAY_CACHE_TTL / DELAY_CACHE_STALE_TTL / DELAY_CACHE_PATH で設定する
+    """
+    global _delay_cache
+    if _delay_cache is None:
+        load_env()
+        _delay_cache = DelayCache(
+            functools.partial(get_realtime_delays, timeout=get_source_timeout()),
+            path=os.getenv("DELAY_CACHE_PATH", DEFAULT_CACHE_PATH),
+            ttl=float(os.getenv("DELAY_CACHE_TTL", DEFAULT_TTL)),
+            stale_ttl=float(os.getenv("DELAY_CACHE_STALE_TTL", DEFAULT_STALE_TTL)),
+        )
+    return _delay_cache
+
+
+def get_cached_realtime_delays():
+    """
+    キャッシュ経由で遅延情報を取得する (TTL切れの場合は古い値を返しつつ裏で更新)
+    """
+    return get_delay_cache().get()
 
 # ----------------------------------------------------------------------------
 # 次の電車を見つける関数
 # ----------------------------------------------------------------------------
+# 時刻表はコンパイル済みファイルを mmap するだけで解析しない
+# import 時にはファイルを開かず、初めて使うときに開く (無いか古ければコンパイルする)
+_hachioji_timetable = None
+_COMPILED_TIMETABLES = {}
+
+
+def get_hachioji_timetable():
+    """
+    八王子駅 (上り) のコンパイル済み時刻表 (CompiledTimetable) を返す
+    """
+    global _hachioji_timetable
+    if _hachioji_timetable is None:
+        _hachioji_timetable = load_timetable()
+    return _hachioji_timetable
+
+
+def __getattr__(name):
+    # 時刻表は使われたときに初めて読み込む
+    if name == "HACHIOJI_TIMETABLE":
+        return get_hachioji_timetable()
+    if name == "HACHIOJI_INDEX":
+        return get_hachioji_timetable().index
+    if name == "HACHIOJI_TIMETABLE_UP_WEEKDAY":
+        from hachioji_timetable import HACHIOJI_TIMETABLE_UP_WEEKDAY
+        _COMPILED_TIMETABLES[id(HACHIOJI_TIMETABLE_UP_WEEKDAY)] = (
+            HACHIOJI_TIMETABLE_UP_WEEKDAY, get_hachioji_timetable().index)
+        return HACHIOJI_TIMETABLE_UP_WEEKDAY
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_timetable_index(timetable):
+    """
+    時刻表に対応するコンパイル済みインデックスを返す (未コンパイルならコンパイルする)
+    """
+    if isinstance(timetable, CompiledTimetable):
+        return timetable.index
+    cached = _COMPILED_TIMETABLES.get(id(timetable))
+    if cached is None or cached[0] is not timetable:
+        cached = _COMPILED_TIMETABLES[id(timetable)] = (timetable, compile_timetable(timetable))
+    return cached[1]
+
+
+def next_k(now, k=3, delays=None):
+    """
+    八王子駅 (上り) で現在時刻以降に発車する電車をk本返す
+    """
+    return get_hachioji_timetable().index.next_k(now, k, delays)
+
+
 def find_next_trains(now, timetable, delays):
     """
     現在時刻、時刻表、遅延情報を元に、次に来る電車3本を返す
     """
-    next_trains = []
-    
-    for entry in timetable:
-        # 時刻表の時刻をdatetimeオブジェクトに変換
-        # 日付は実行日に合わせる
-        scheduled_time_str = f"{now.year}-{now.month}-{now.day} {entry['time']}"
-        scheduled_time = datetime.strptime(scheduled_time_str, "%Y-%m-%d %H:%M")
-
-        # 0時台の電車で、現在時刻が23時台などの場合は日付を1日進める
-        if scheduled_time.hour < 4 and now.hour > 20:
-            scheduled_time += timedelta(days=1)
-
-        # 遅延情報を取得（2025年API対応の検索パターン）
-        train_number = entry.get("train_number")
-        delay_seconds = 0
-        
-        # 2025年API仕様に対応した列車番号マッチング
-        if train_number:
-            # 完全一致を最優先
-            delay_seconds = delays.get(train_number, 0)
-            
-            # マッチしない場合は、接尾辞を除去して再検索
-            if delay_seconds == 0:
-                base_number = train_number.rstrip('TCKSLAFM')
-                for key, value in delays.items():
-                    if key.startswith(base_number) or base_number in key:
-                        delay_seconds = value
-                        print(f"遅延情報マッチ: {train_number} → {key} ({delay_seconds}秒)")
-                        break
-        
-        actual_time = scheduled_time + timedelta(seconds=delay_seconds)
-
-        # 現在時刻より後に出発する電車をリストに追加
-        if actual_time > now:
-            entry_copy = entry.copy()  # 元のデータを変更しないようにコピー
-            entry_copy['scheduled_time'] = scheduled_time.strftime('%H:%M')
-            entry_copy['actual_time'] = actual_time.strftime('%H:%M')
-            entry_copy['delay_minutes'] = delay_seconds // 60
-            next_trains.append(entry_copy)
-
-    # 到着時刻順にソートして、最初の3件を返す
-    return sorted(next_trains, key=lambda x: x['actual_time'])[:3]
+    return get_timetable_index(timetable).next_k(now, 3, delays)
+
+# ----------------------------------------------------------------------------
+# 表示
+# ----------------------------------------------------------------------------
+def train_lines(trains):
+    """
+    find_next_trains の結果の表示を1行ずつのリストで返す
+    """
+    lines = []
+    if trains:
+        lines.append("次の電車情報:")
+        for i, train in enumerate(trains):
+            delay_info = f"({train['delay_minutes']}分遅れ)" if train['delay_minutes'] > 0 else "(定刻)"
+            lines.append(
+                f"{i+1}. {train['scheduled_time']}発 → {train['actual_time']}頃 "
+                f"【{train['type']}】{train['destination']}行き "
+                f"{delay_info}"
+            )
+    else:
+        lines.append("現在時刻以降に利用可能な電車はありません。")
+    lines.append("-" * 50)
+    lines.append("※リアルタイム情報は公共交通オープンデータセンター(ODPT)提供")
+    return lines
+
+
+def fetch_current_sources():
+    """
+    リアルタイムの遅延情報 ("delays") と運行情報 ("status") を並行して取得し、
+    (結果の辞書, エラーの辞書) を返す
+    """
+    from fetch_pipeline import fetch_sources_sync, get_session
+    from service_status import get_service_status
+
+    timeout = get_source_timeout()
+    return fetch_sources_sync({
+        "delays": get_cached_realtime_delays,
+        "status": lambda: get_service_status(timeout=timeout, session=get_session()),
+    }, budget=get_fetch_budget())
+
 
 # ----------------------------------------------------------------------------
 # メイン処理
 # ----------------------------------------------------------------------------
-if __name__ == "__main__":
+def parse_args(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="八王子駅 (上り) の次の電車とシャトルバスを表示する")
+    parser.add_argument("--watch", action="store_true",
+                        help="終了せずに表示を更新し続ける (変わった行だけを書き換える)")
+    parser.add_argument("--interval", type=float, default=1.0,
+                        help="--watch で表示を見直す間隔 (秒)")
+    parser.add_argument("--ndjson", action="store_true",
+                        help="次の電車・バス・運行情報を1行1件の JSON で出力する")
+    return parser.parse_args(argv)
+
+
+def main(argv=()):
+    args = parse_args(argv)
+    if args.watch or args.ndjson:
+        # 常駐・NDJSON 出力は watch モジュールで行う (通常の起動では読み込まない)
+        import watch
+
+        if args.watch:
+            watch.run_watch(interval=args.interval, ndjson=args.ndjson)
+        else:
+            watch.print_ndjson()
+        metrics.export_from_env()
+        return
+
+    from service_status import render_service_status
+
     # 現在時刻を取得
     current_time = datetime.now()
     # current_time = datetime.strptime("2025-01-27 08:00", "%Y-%m-%d %H:%M") # テスト用
@@ -181,121 +323,39 @@ if __name__ == "__main__":
     print("ODPT API v4 (2025年仕様) を使用")
     print("-" * 50)
 
-    # リアルタイムの遅延情報を取得
-    realtime_delays = get_realtime_delays()
+    # リアルタイムの遅延情報と運行情報を並行して取得する
+    sources, errors = fetch_current_sources()
+    realtime_delays = sources.get("delays", {})
+    if "delays" in errors:
+        print(f"遅延情報を取得できませんでした: {errors['delays']}")
     
     print("API停止中につきスキップ中")
     print("-" * 50)
 
 
     # 次の電車を検索
-    next_trains_to_display = find_next_trains(current_time, HACHIOJI_TIMETABLE_UP_WEEKDAY, realtime_delays)
+    next_trains_to_display = find_next_trains(current_time, get_hachioji_timetable(),
+                                              realtime_delays)
 
     # 結果を表示
-    if next_trains_to_display:
-        print("次の電車情報:")
-        for i, train in enumerate(next_trains_to_display):
-            delay_info = f"({train['delay_minutes']}分遅れ)" if train['delay_minutes'] > 0 else "(定刻)"
-            print(
-                f"{i+1}. {train['scheduled_time']}発 → {train['actual_time']}頃 "
-                f"【{train['type']}】{train['destination']}行き "
-                f"{delay_info}"
-            )
-    else:
-        print("現在時刻以降に利用可能な電車はありません。")
-    print("-" * 50)
-    print("※リアルタイム情報は公共交通オープンデータセンター(ODPT)提供")
-
-    # バス時刻表データ（キャンパス発、駅発着）
-    BUS_TIMETABLE = [
-        ("07:15", "07:30"), ("07:28", "07:40"), ("07:33", "07:45"), ("07:38", "07:50"), ("07:43", "07:55"),
-        ("09:03", "09:15"), ("09:08", "09:20"), ("09:13", "09:25"), ("09:18", "09:30"), ("09:23", "09:35"),
-        ("09:28", "09:40"), ("09:33", "09:45"), ("09:38", "09:50"), ("09:43", "09:55"), ("09:48", "10:00"),
-        ("09:53", "10:05"), ("09:58", "10:10"), ("10:03", "10:15"), ("10:08", "10:20"), ("10:13", "10:25"),
-        ("10:18", "10:30"), ("10:23", "10:35"), ("10:28", "10:40"), ("10:33", "10:45"), ("10:38", "10:50"),
-        ("10:48", "11:00"), ("10:58", "11:10"), ("11:08", "11:20"), ("11:18", "11:30"), ("11:28", "11:40"),
-        ("11:38", "11:50"), ("11:53", "12:05"), ("12:03", "12:15"), ("12:08", "12:20"), ("12:13", "12:25"),
-        ("12:18", "12:30"), ("12:23", "12:35"), ("12:28", "12:40"), ("12:33", "12:45"), ("12:38", "12:50"),
-        ("12:48", "13:00"), ("12:58", "13:10"), ("13:08", "13:20"), ("13:18", "13:30"), ("13:28", "13:40"),
-        ("13:38", "13:50"), ("13:48", "14:00"), ("13:58", "14:10"), ("14:08", "14:20"), ("14:18", "14:30"),
-        ("14:28", "14:40"), ("14:38", "14:50"), ("14:48", "15:00"), ("15:00", "15:11"),
-        ("15:30", "15:41"), ("15:40", "15:51"), ("15:50", "16:01"), ("16:00", "16:11"), ("16:10", "16:21"), ("16:20", "16:31"),
-        ("17:30", "17:41"), ("17:40", "17:51"), ("17:50", "18:01"), ("18:00", "18:11"), ("18:10", "18:21"),
-        ("18:20", "18:31"), ("18:30", "18:41"), ("18:40", "18:51"),
-        ("19:10", "19:21"), ("19:20", "19:31"), ("19:30", "19:41"), ("19:40", "19:51"), ("19:50", "20:01"),
-        ("20:00", "20:11"), ("20:10", "20:21"), ("20:20", "20:31"), ("20:30", "20:41"), ("20:45", "20:56"),
-        ("21:00", "21:11"), ("21:10", "21:21"), ("21:15", "21:26"), ("21:20", "21:31")
-    ]
-
-    # シャトル運行の時間帯定義
-    SHUTTLE_PERIODS = [
-        ("07:55", "09:03", "約3～5分間隔"),
-        ("15:11", "15:30", "約5～10分間隔"),
-        ("16:31", "17:30", "約3～10分間隔"),
-        ("18:51", "19:10", "約5～10分間隔")
-    ]
-
-    # バス時刻表の表示
-    print("\n八王子駅⇔東京工科大学 シャトルバス時刻表（抜粋）")
-    print("-" * 50)
-    print("八王子駅南口［発着所：片柳研究所西側］")
-    
-    # 現在時刻以降のバス3本を表示
-    now_hm = current_time.strftime("%H:%M")
-    count = 0
-    found_future_bus = False
-    
-    # シャトル運行期間をチェック
-    def is_in_shuttle_period(time_str):
-        for start, end, interval in SHUTTLE_PERIODS:
-            if start <= time_str <= end:
-                return interval
-        return None
-    
-    # まずシャトル運行期間をチェック
-    shuttle_info = is_in_shuttle_period(now_hm)
-    if shuttle_info:
-        print(f"現在はシャトル運行中（{shuttle_info}）")
-        found_future_bus = True
-        count = 1
-    
-    # 通常の時刻表から次のバスを探す
-    for campus_dep, station_arr in BUS_TIMETABLE:
-        if campus_dep >= now_hm and count < 3:
-            found_future_bus = True
-            print(f"キャンパス発{campus_dep} → 駅発着{station_arr}")
-            count += 1
-    
-    # 未来のシャトル運行期間もチェック
-    if count < 3:
-        for start, end, interval in SHUTTLE_PERIODS:
-            if start > now_hm and count < 3:
-                print(f"{start}〜{end} シャトル運行（{interval}）")
-                count += 1
-    
-    if not found_future_bus:
-        print("本日の運行は終了しました。")
-    elif count == 0:
-        print("現在時刻以降のバスはありません。")
-
-print("-" * 50)
+    with metrics.span("render_trains"):
+        print("\n".join(train_lines(next_trains_to_display)))
 
-# アクセスするURL
-url = "https://transit.yahoo.co.jp/diainfo/38/0"
-
-# URLにアクセスする
-res = requests.get(url)
-
-
-# res.textをBeautifulSoupで扱うための処理
-soup = BeautifulSoup(res.content, "html.parser")
+    # 現在時刻以降のバス3本を表示
+    buses = next_buses(current_time, 3)
+    with metrics.span("render_buses"):
+        render_buses(buses)
 
-st = soup.find_all("dt")
+    print("-" * 50)
+    with metrics.span("render_status"):
+        if "status" in sources:
+            render_service_status(sources["status"])
+        else:
+            print(f"運行情報の取得に失敗しました: {errors['status']}")
 
-for dt in st:
-    print(dt.get_text(strip=True))
+    # METRICS=1 METRICS_EXPORT=ファイル名 のとき計測結果を書き出す
+    metrics.export_from_env()
 
-mes = soup.find_all("dd")
 
-for dt in mes:
-    print(dt.get_text(strip=True))
+if __name__ == "__main__":
+    main(sys.argv[1:])
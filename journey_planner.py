@@ -0,0 +1,294 @@
+"""
+キャンパス → 東京 の乗り継ぎ検索 (シャトルバス + 中央線)
+
+バス (シャトル運行期間は運行間隔ごとの便に展開) と中央線の列車を
+出発時刻順の接続 (connection) の列にしておき、Connection Scan で
+  - earliest_arrival: 出発時刻から東京に最も早く着く乗り継ぎ
+  - latest_departure: 到着期限に間に合う最も遅い出発
+  - profile         : 1日分の全ての出発時刻に対する最早到着 (パレート最適な組)
+を求める。八王子駅での乗り換えには transfer_buffer 秒の余裕を見込む
+
+時刻表には八王子駅の発車時刻しかないため、東京までの所要時間は
+種別ごとの概算 (RIDE_MINUTES_TO_TOKYO) を使う
+"""
+import re
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+from statistics import median
+
+from bus_timetable import SHUTTLE_TYPE, get_bus_index
+from delay_index import as_delay_index
+from timetable_index import format_service_seconds, service_clock
+
+# -----------------------------------------------------------------------------
+# 設定
+# -----------------------------------------------------------------------------
+CAMPUS = "campus"
+HACHIOJI = "hachioji"
+TOKYO = "tokyo"
+
+# 八王子 → 東京 の種別ごとの概算所要時間 (分)
+RIDE_MINUTES_TO_TOKYO = {
+    "快速": 60,
+    "中央特快": 53,
+    "通勤特別快速": 48,
+    "かいじ": 45,
+    "あずさ": 45,
+}
+# 東京まで行く列車の行き先
+TOKYO_DESTINATIONS = ("東京",)
+# 特急券が必要な種別 (既定では使わない)
+LIMITED_EXPRESS_TYPES = ("かいじ", "あずさ", "富士回遊")
+
+DEFAULT_TRANSFER_BUFFER = 5 * 60
+INFINITY = float("inf")
+
+
+def _shuttle_headway_minutes(note):
+    """
+    "約3～5分間隔" のような説明から最も長い運行間隔 (分) を取り出す
+    """
+    numbers = [int(number) for number in re.findall(r"\d+", note or "")]
+    return max(numbers) if numbers else 10
+
+
+# ----------------------------------------------------------------------------
+# 接続の列
+# ----------------------------------------------------------------------------
+class Connection:
+    """
+    1本の便の1区間 (from_stop を dep に出て to_stop に arr に着く)
+    """
+
+    __slots__ = ("from_stop", "to_stop", "dep", "arr", "kind", "info")
+
+    def __init__(self, from_stop, to_stop, dep, arr, kind, info):
+        self.from_stop = from_stop
+        self.to_stop = to_stop
+        self.dep = dep
+        self.arr = arr
+        self.kind = kind
+        self.info = info
+
+
+def build_connections(train_index, delays=None, bus_index=None,
+                      include_limited_express=False, shuttle_ride_minutes=None):
+    """
+    バスと列車の接続を出発時刻順 (同時刻なら到着順) に並べたリストを返す
+    時刻は全て運行日0時からの秒
+    """
+    if bus_index is None:
+        bus_index = get_bus_index()
+    delays = as_delay_index(delays)
+    connections = []
+
+    # バス (シャトル運行期間は運行間隔ごとの便として展開する)
+    bus_table = bus_index.table
+    rides = [(bus_table.end_minutes[i] - bus_table.minutes[i])
+             for i in range(len(bus_table)) if bus_table[i]["type"] != SHUTTLE_TYPE]
+    if shuttle_ride_minutes is None:
+        shuttle_ride_minutes = median(rides) if rides else 12
+    for position in range(len(bus_table)):
+        entry = bus_table[position]
+        start = bus_table.minutes[position]
+        end = bus_table.end_minutes[position]
+        if entry["type"] == SHUTTLE_TYPE:
+            headway = _shuttle_headway_minutes(entry.get("note"))
+            for minute in range(start, end + 1, headway):
+                info = {"kind": "shuttle", "campus_departure": format_service_seconds(minute * 60),
+                        "station_arrival": format_service_seconds((minute + shuttle_ride_minutes) * 60),
+                        "interval": entry.get("note")}
+                connections.append(Connection(CAMPUS, HACHIOJI, minute * 60,
+                                              (minute + shuttle_ride_minutes) * 60, "bus", info))
+        else:
+            info = {"kind": "bus", "campus_departure": entry["time"],
+                    "station_arrival": entry["end_time"]}
+            connections.append(Connection(CAMPUS, HACHIOJI, start * 60, end * 60, "bus", info))
+
+    # 列車 (東京まで行くものだけ)
+    for position in range(len(train_index)):
+        entry = train_index.entries[position]
+        ride = RIDE_MINUTES_TO_TOKYO.get(entry["type"])
+        if ride is None or entry["destination"] not in TOKYO_DESTINATIONS:
+            continue
+        if entry["type"] in LIMITED_EXPRESS_TYPES and not include_limited_express:
+            continue
+        delay_seconds = delays.lookup(entry.get("train_number"))
+        scheduled = train_index.minutes[position] * 60
+        dep = scheduled + delay_seconds
+        connections.append(Connection(HACHIOJI, TOKYO, dep, dep + ride * 60, "train",
+                                      (entry, scheduled, delay_seconds)))
+
+    connections.sort(key=lambda c: (c.dep, c.arr))
+    return connections
+
+
+# ----------------------------------------------------------------------------
+# 乗り継ぎ検索
+# ----------------------------------------------------------------------------
+class JourneyPlanner:
+    """
+    キャンパス → 東京 の Connection Scan による乗り継ぎ検索
+    遅延情報が変わったら作り直す (接続の列の構築は1回数ミリ秒)
+    """
+
+    def __init__(self, train_index, delays=None, transfer_buffer=DEFAULT_TRANSFER_BUFFER,
+                 bus_index=None, include_limited_express=False):
+        self.transfer_buffer = transfer_buffer
+        self.connections = build_connections(train_index, delays, bus_index,
+                                             include_limited_express)
+        self.departures = [c.dep for c in self.connections]
+        self._profile = None
+
+    def _change_time(self, stop, origin):
+        # 出発地以外で乗り換えるときだけ余裕を見込む
+        return 0 if stop == origin else self.transfer_buffer
+
+    def _scan_earliest(self, start_seconds, origin=CAMPUS, target=TOKYO):
+        earliest = {origin: start_seconds}
+        via = {}
+        for i in range(bisect_left(self.departures, start_seconds), len(self.connections)):
+            c = self.connections[i]
+            # 以降の接続は目的地への到着を早められない
+            if c.dep >= earliest.get(target, INFINITY):
+                break
+            ready = earliest.get(c.from_stop, INFINITY) + self._change_time(c.from_stop, origin)
+            if ready <= c.dep and c.arr < earliest.get(c.to_stop, INFINITY):
+                earliest[c.to_stop] = c.arr
+                via[c.to_stop] = c
+        return self._trace(via, origin, target)
+
+    def _scan_latest(self, deadline_seconds, origin=CAMPUS, target=TOKYO):
+        latest = {target: deadline_seconds}
+        via = {}
+        # 期限より後に出る接続は間に合わないので飛ばす
+        for i in range(bisect_right(self.departures, deadline_seconds) - 1, -1, -1):
+            c = self.connections[i]
+            # 出発地を出られる時刻より前の接続はもう使えない
+            if c.dep < latest.get(origin, -INFINITY):
+                break
+            # 目的地以外で乗り換えるときは、次の便の出発の transfer_buffer 前に着いている必要がある
+            margin = 0 if c.to_stop == target else self.transfer_buffer
+            if c.arr + margin <= latest.get(c.to_stop, -INFINITY) and \
+                    c.dep > latest.get(c.from_stop, -INFINITY):
+                latest[c.from_stop] = c.dep
+                via[c.from_stop] = c
+        legs = []
+        stop = origin
+        while stop != target and stop in via:
+            legs.append(via[stop])
+            stop = via[stop].to_stop
+        return legs if stop == target else None
+
+    @staticmethod
+    def _trace(via, origin, target):
+        if target not in via:
+            return None
+        legs = []
+        stop = target
+        while stop != origin:
+            legs.append(via[stop])
+            stop = via[stop].from_stop
+        return legs[::-1]
+
+    def profile(self):
+        """
+        1日分の全ての出発時刻について最早到着を求め、パレート最適な
+        (出発秒, 到着秒, 乗り継ぎ) のリストを出発時刻順に返す (Profile Connection Scan)
+        """
+        if self._profile is not None:
+            return self._profile
+
+        # 停留所ごとに (-出発秒) の昇順リストと (到着秒, 乗り継ぎ) を持つ
+        neg_deps = {}
+        values = {}
+
+        def evaluate(stop, ready):
+            keys = neg_deps.get(stop)
+            if not keys:
+                return INFINITY, None
+            i = bisect_right(keys, -ready) - 1
+            if i < 0:
+                return INFINITY, None
+            return values[stop][i]
+
+        for c in reversed(self.connections):
+            if c.to_stop == TOKYO:
+                arrival, legs = c.arr, (c,)
+            else:
+                arrival, rest = evaluate(c.to_stop, c.arr + self.transfer_buffer)
+                legs = (c,) + rest if rest is not None else None
+            if legs is None:
+                continue
+            keys = neg_deps.setdefault(c.from_stop, [])
+            stop_values = values.setdefault(c.from_stop, [])
+            # より遅く出て同じかより早く着く乗り継ぎが既にあれば不要
+            if stop_values and stop_values[-1][0] <= arrival:
+                continue
+            if keys and keys[-1] == -c.dep:
+                keys.pop()
+                stop_values.pop()
+            keys.append(-c.dep)
+            stop_values.append((arrival, legs))
+
+        self._profile = [(-neg_dep, arrival, list(legs)) for neg_dep, (arrival, legs)
+                         in zip(reversed(neg_deps.get(CAMPUS, [])),
+                                reversed(values.get(CAMPUS, [])))]
+        return self._profile
+
+    def earliest_arrival(self, now):
+        """
+        now 以降にキャンパスを出て東京に最も早く着く乗り継ぎを返す (なければ None)
+        """
+        midnight, seconds = service_clock(now)
+        return _describe(self._scan_earliest(seconds), midnight)
+
+    def latest_departure(self, deadline):
+        """
+        deadline までに東京に着くための最も遅い乗り継ぎを返す (なければ None)
+        """
+        midnight, seconds = service_clock(deadline)
+        return _describe(self._scan_latest(seconds), midnight)
+
+    def day_profile(self, day):
+        """
+        day の運行日の全ての出発時刻に対するパレート最適な乗り継ぎを返す
+        """
+        midnight, _ = service_clock(day)
+        return [_describe(legs, midnight) for _, _, legs in self.profile()]
+
+
+def _describe(legs, midnight):
+    """
+    接続のリストを表示用の辞書にする
+    """
+    if not legs:
+        return None
+    journey = {
+        "departure": format_service_seconds(legs[0].dep),
+        "arrival": format_service_seconds(legs[-1].arr),
+        "departure_time": midnight + timedelta(seconds=legs[0].dep),
+        "arrival_time": midnight + timedelta(seconds=legs[-1].arr),
+    }
+    for c in legs:
+        if c.kind == "bus":
+            journey["bus"] = dict(c.info)
+        else:
+            entry, scheduled, delay_seconds = c.info
+            train = dict(entry.items())
+            train["scheduled_time"] = format_service_seconds(scheduled)
+            train["actual_time"] = format_service_seconds(c.dep)
+            train["delay_minutes"] = delay_seconds // 60
+            train["tokyo_arrival"] = format_service_seconds(c.arr)
+            journey["train"] = train
+    return journey
+
+
+def plan_journeys(now, delays=None, transfer_buffer=DEFAULT_TRANSFER_BUFFER):
+    """
+    八王子駅 (上り) の時刻表で now 以降の最早到着の乗り継ぎを返す
+    """
+    from find_next_trains_hachioji import HACHIOJI_INDEX
+
+    planner = JourneyPlanner(HACHIOJI_INDEX, delays, transfer_buffer)
+    return planner.earliest_arrival(now)
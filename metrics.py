@@ -0,0 +1,246 @@
+"""
+処理段階ごとの所要時間とカウンターの計測
+
+    with metrics.span("odpt_fetch"):       # 所要時間をヒストグラム odpt_fetch_seconds に記録
+        ...
+    metrics.count("delay_cache_hits")       # カウンター delay_cache_hits_total を1増やす
+
+計測は環境変数 METRICS=1 か enable() で有効にする。無効のときの span() は
+共有の何もしないコンテキストマネージャーを返すだけなので、ホットパスに置いてよい
+
+集計結果は Prometheus のテキスト形式 (render_prometheus)、JSON (render_json) か
+JSON Lines (render_json_lines) で書き出せる。環境変数 METRICS_EXPORT に
+ファイル名を指定すると export_from_env() がそこに書き出す
+(拡張子 .jsonl なら JSON Lines を追記、.json なら1つの JSON で上書き)
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# -----------------------------------------------------------------------------
+# 設定
+# -----------------------------------------------------------------------------
+# 所要時間のヒストグラムの区切り (秒)
+DEFAULT_BUCKETS = (0.00001, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+PREFIX = "chuoline_"
+
+_enabled = os.environ.get("METRICS", "").lower() in ("1", "true", "yes")
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """
+    集計結果を全て消す
+    """
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+# ----------------------------------------------------------------------------
+# 記録
+# ----------------------------------------------------------------------------
+class Histogram:
+    """
+    区切りごとの件数・合計・件数を持つ (Prometheus の histogram と同じ形)
+    """
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def count(name, value=1):
+    """
+    カウンター name を value 増やす
+    """
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name, seconds):
+    """
+    ヒストグラム name に所要時間を記録する
+    """
+    if not _enabled:
+        return
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+
+class _Span:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, time.perf_counter() - self.started)
+        if exc_type is not None:
+            count(f"{self.name}_errors")
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name):
+    """
+    with 文の中の所要時間を name のヒストグラムに記録する (例外はカウンター name_errors)
+    """
+    if not _enabled:
+        return _NOOP_SPAN
+    return _Span(name)
+
+
+def timed(name):
+    """
+    関数の所要時間を name のヒストグラムに記録するデコレーター
+    """
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(name):
+                return func(*args, **kwargs)
+        wrapper.__name__ = func.__name__
+        wrapper.__qualname__ = func.__qualname__
+        wrapper.__doc__ = func.__doc__
+        wrapper.__wrapped__ = func
+        return wrapper
+    return decorator
+
+
+# ----------------------------------------------------------------------------
+# 書き出し
+# ----------------------------------------------------------------------------
+def snapshot():
+    """
+    現在の集計結果を {"counters": {...}, "histograms": {...}} で返す
+    """
+    with _lock:
+        counters = dict(_counters)
+        histograms = {name: {"buckets": list(h.buckets), "counts": list(h.counts),
+                             "sum": h.sum, "count": h.count}
+                      for name, h in _histograms.items()}
+    return {"counters": counters, "histograms": histograms}
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(prefix=PREFIX):
+    """
+    集計結果を Prometheus のテキスト形式で返す
+    カウンターは <name>_total、所要時間は <name>_seconds のヒストグラムになる
+    """
+    data = snapshot()
+    lines = []
+    for name, value in sorted(data["counters"].items()):
+        metric = f"{prefix}{name}_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {_format_value(value)}")
+    for name, histogram in sorted(data["histograms"].items()):
+        metric = f"{prefix}{name}_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        cumulative = 0
+        for bound, bucket_count in zip(histogram["buckets"], histogram["counts"]):
+            cumulative += bucket_count
+            lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram["count"]}')
+        lines.append(f"{metric}_sum {_format_value(histogram['sum'])}")
+        lines.append(f"{metric}_count {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def render_json_lines():
+    """
+    集計結果を1行1メトリクスの JSON Lines で返す
+    """
+    data = snapshot()
+    timestamp = time.time()
+    lines = [json.dumps({"time": timestamp, "type": "counter", "name": name, "value": value})
+             for name, value in sorted(data["counters"].items())]
+    for name, histogram in sorted(data["histograms"].items()):
+        lines.append(json.dumps({"time": timestamp, "type": "histogram", "name": name,
+                                 **histogram}))
+    return "".join(line + "\n" for line in lines)
+
+
+def render_json():
+    """
+    集計結果を1つの JSON ({"time", "counters", "histograms"}) で返す
+    """
+    return json.dumps({"time": time.time(), **snapshot()}) + "\n"
+
+
+def export(path):
+    """
+    集計結果をファイルに書き出す
+      - 拡張子 .jsonl: JSON Lines を追記 (実行ごとに行が増える)
+      - 拡張子 .json : 1つの JSON で上書き
+      - それ以外    : Prometheus のテキスト形式で上書き
+    """
+    if path.endswith(".jsonl"):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(render_json_lines())
+        return
+    text = render_json() if path.endswith(".json") else render_prometheus()
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def export_from_env():
+    """
+    計測が有効で環境変数 METRICS_EXPORT が設定されていれば、そこに書き出す
+    """
+    path = os.environ.get("METRICS_EXPORT")
+    if _enabled and path:
+        export(path)
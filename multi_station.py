@@ -0,0 +1,230 @@
+"""
+中央線(快速)の複数の駅・方向の発車標に、1回の odpt:Train 取得の遅延をまとめて配る
+
+駅ごとにプロセスを動かすと、同じ路線全体のフィードを駅の数だけ取得・解析することになる。
+ここでは路線全体のスナップショット (fetch_line_snapshot) を1周期に1回だけ取得し、
+1回の走査で (駅, 方向) ごとに列車を振り分けてから、登録された全ての駅の時刻表に配る
+
+    engine = MultiStationEngine([StationTimetable(HACHIOJI_STATION, UP, DEFAULT_STORE, DEFAULT_SOURCE)])
+    engine.apply(snapshot)                 # 遅延が変わった駅の発車標だけを差分更新する
+    engine.next_trains(now)                # {(駅ID, 方向): [次の電車...]}
+
+駅の数が多い場合は next_trains_parallel() でプロセスプールに駅を分けて計算できる
+ワーカーは時刻表ファイルを mmap して (ページは全プロセスで共有) 発車標をプロセス内に
+保持するので、2回目以降は遅延が変わった分だけを計算し直す
+"""
+from delay_index import DelayIndex
+from departure_board import DepartureBoards
+from odpt_client import DOWN, HACHIOJI_STATION, UP
+from timetable_store import DEFAULT_SOURCE, DEFAULT_STORE, load_timetable, open_store
+
+# -----------------------------------------------------------------------------
+# 設定
+# -----------------------------------------------------------------------------
+STATION_PREFIX = "odpt.Station:JR-East.ChuoRapid."
+# 中央線(快速) の駅 (東京 → 高尾)
+CHUO_RAPID_STATIONS = tuple(STATION_PREFIX + name for name in (
+    "Tokyo", "Kanda", "Ochanomizu", "Yotsuya", "Shinjuku", "Nakano", "Koenji", "Asagaya",
+    "Ogikubo", "NishiOgikubo", "Kichijoji", "Mitaka", "MusashiSakai", "HigashiKoganei",
+    "MusashiKoganei", "Kokubunji", "NishiKokubunji", "Kunitachi", "Tachikawa", "Hino",
+    "Toyoda", "Hachioji", "NishiHachioji", "Takao",
+))
+DIRECTIONS = (UP, DOWN)
+DEFAULT_K = 3
+# プロセスプールのワーカーで発車標を作るのは、1回に問い合わせる時刻がこれ以上のとき
+BOARD_MIN_QUERIES = 1000
+
+
+# ----------------------------------------------------------------------------
+# 駅ごとの時刻表
+# ----------------------------------------------------------------------------
+class StationTimetable:
+    """
+    1つの駅・方向のコンパイル済み時刻表 (timetable_store の .ttbin ファイル)
+
+    source (時刻表のソースファイル) を渡すと load_timetable() で開くので、.ttbin が
+    無いか古い場合は load_source() の時刻表 (既定は八王子駅・平日・上り) から
+    コンパイルし直す。source が無い場合は compile 済みのファイルをそのまま開く
+
+    プロセスプールに渡すときはファイルのパスだけを送り、ワーカー側で mmap し直す
+    (load_source はワーカーに送れるようにモジュールの関数にする)
+    """
+
+    __slots__ = ("station", "direction", "path", "source", "load_source")
+
+    def __init__(self, station, direction, path, source=None, load_source=None):
+        self.station = station
+        self.direction = direction
+        self.path = path
+        self.source = source
+        self.load_source = load_source
+
+    @property
+    def key(self):
+        return (self.station, self.direction)
+
+    def open(self):
+        """
+        コンパイル済み時刻表 (CompiledTimetable) を開く
+        """
+        if self.source is None:
+            return open_store(self.path)
+        return load_timetable(self.path, self.source, self.load_source)
+
+    def __repr__(self):
+        return (f"StationTimetable({self.station!r}, {self.direction!r}, {self.path!r}, "
+                f"{self.source!r})")
+
+
+def default_stations():
+    """
+    時刻表データがある駅・方向 (現在は八王子駅・平日・上りのみ)
+    他の駅は compile した .ttbin (とそのソース) を StationTimetable で追加する
+    """
+    return [StationTimetable(HACHIOJI_STATION, UP, DEFAULT_STORE, DEFAULT_SOURCE)]
+
+
+# ----------------------------------------------------------------------------
+# スナップショットの駅ごとの振り分け
+# ----------------------------------------------------------------------------
+def index_by_station(snapshot, keys=None):
+    """
+    路線全体のスナップショット ({列車番号: {"delay", "from_station", "to_station",
+    "direction"}}) を1回走査し、{(駅ID, 方向): {列車番号: 遅延秒数}} に振り分ける
+
+    列車は在線位置の駅 (from_station) と次の駅 (to_station) の両方に入る
+    (fetch_train_snapshot で駅を絞り込んだ場合と同じ対象)。方向が分からない列車は
+    両方向に入れる。keys を渡すとその (駅ID, 方向) だけを作る
+    """
+    wanted = None if keys is None else frozenset(keys)
+    by_station = {}
+    for train_number, train in snapshot.items():
+        direction = train.get("direction")
+        directions = DIRECTIONS if direction is None else (direction,)
+        delay = train.get("delay") or 0
+        from_station = train.get("from_station")
+        to_station = train.get("to_station")
+        for station in (from_station, to_station):
+            if station is None:
+                continue
+            for direction in directions:
+                key = (station, direction)
+                if wanted is None or key in wanted:
+                    by_station.setdefault(key, {})[train_number] = delay
+            if to_station == from_station:
+                break
+    return by_station
+
+
+# ----------------------------------------------------------------------------
+# 複数の駅の発車標
+# ----------------------------------------------------------------------------
+class MultiStationEngine:
+    """
+    複数の駅・方向の発車標 (DepartureBoards) をまとめて持ち、
+    1回の路線全体のスナップショットから全ての駅の遅延を更新する
+
+    発車標は最初に問い合わせたときに作り、以後は遅延が変わった駅だけを差分更新する
+    """
+
+    def __init__(self, stations=None, k=DEFAULT_K):
+        self.stations = {spec.key: spec for spec in (stations or default_stations())}
+        self.k = k
+        self.delays = {key: DelayIndex() for key in self.stations}
+        self._tables = {}
+        self._boards = {}
+        self.stats = {"applies": 0, "station_updates": 0}
+
+    def timetable(self, key):
+        """
+        (駅ID, 方向) のコンパイル済み時刻表を返す (初回に mmap する)
+        """
+        table = self._tables.get(key)
+        if table is None:
+            table = self._tables[key] = self.stations[key].open()
+        return table
+
+    def boards(self, key):
+        """
+        (駅ID, 方向) の発車標を返す (初回に作る)
+        """
+        boards = self._boards.get(key)
+        if boards is None:
+            boards = self._boards[key] = DepartureBoards(self.timetable(key).index,
+                                                         self.delays[key], self.k)
+        return boards
+
+    def apply(self, snapshot):
+        """
+        路線全体のスナップショットを全ての駅に配り、遅延が変わった (駅ID, 方向) のリストを返す
+        """
+        by_station = index_by_station(snapshot, self.stations)
+        changed = []
+        for key, old in self.delays.items():
+            new = by_station.get(key, {})
+            if new == old:
+                continue
+            delays = self.delays[key] = DelayIndex(new, stale=getattr(snapshot, "stale", False),
+                                                   fetched_at=getattr(snapshot, "fetched_at", None))
+            boards = self._boards.get(key)
+            if boards is not None:
+                boards.update(delays)
+            changed.append(key)
+        self.stats["applies"] += 1
+        self.stats["station_updates"] += len(changed)
+        return changed
+
+    def next_trains(self, now, keys=None):
+        """
+        now 以降に発車する電車を (駅ID, 方向) ごとに最大k本返す
+        """
+        return {key: self.boards(key).lookup(now) for key in (keys or self.stations)}
+
+    def next_trains_parallel(self, times, executor, keys=None, chunks=None):
+        """
+        複数の時刻について、(駅ID, 方向) ごとの次の電車をプロセスプールで計算する
+
+        executor は concurrent.futures.ProcessPoolExecutor。駅を chunks 個
+        (既定はワーカー数) に分けて送り、{(駅ID, 方向): [時刻ごとの結果]} を返す
+        """
+        keys = list(keys or self.stations)
+        times = list(times)
+        if chunks is None:
+            chunks = getattr(executor, "_max_workers", 1)
+        chunks = max(1, min(chunks, len(keys)))
+        shards = [[(self.stations[key], dict(self.delays[key])) for key in keys[i::chunks]]
+                  for i in range(chunks)]
+        results = {}
+        for shard_result in executor.map(_shard_next_trains, shards,
+                                         [times] * chunks, [self.k] * chunks):
+            results.update(shard_result)
+        return results
+
+
+# ----------------------------------------------------------------------------
+# プロセスプールのワーカー
+# ----------------------------------------------------------------------------
+# ワーカープロセスごとの時刻表 {ファイル: TimetableIndex} と発車標 {(ファイル, k): DepartureBoards}
+_worker_indexes = {}
+_worker_boards = {}
+
+
+def _shard_next_trains(shard, times, k):
+    # どのワーカーにどの駅が来るかは決まらないので、発車標がまだないワーカーでは
+    # 問い合わせが発車標の構築 (1,440分ぶんの next_k) より十分多いときだけ作る
+    results = {}
+    for spec, delays in shard:
+        index = _worker_indexes.get(spec.path)
+        if index is None:
+            index = _worker_indexes[spec.path] = spec.open().index
+        boards = _worker_boards.get((spec.path, k))
+        if boards is None and len(times) >= BOARD_MIN_QUERIES:
+            boards = _worker_boards[(spec.path, k)] = DepartureBoards(index, delays, k)
+        if boards is None:
+            delays = DelayIndex(delays)
+            results[spec.key] = [index.next_k(now, k, delays) for now in times]
+            continue
+        if dict(boards.delays) != delays:
+            boards.update(delays)
+        results[spec.key] = [boards.lookup(now) for now in times]
+    return results
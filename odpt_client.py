@@ -0,0 +1,266 @@
+import codecs
+import json
+import re
+import time
+
+import metrics
+
+# -----------------------------------------------------------------------------
+# 設定
+# -----------------------------------------------------------------------------
+# リアルタイム列車情報API (2025年更新版)
+REALTIME_API_URL = "https://api.odpt.org/api/v4/odpt:Train"
+# 2025年API仕様での代替エンドポイント
+ALTERNATIVE_API_URL = "https://api-tokyochallenge.odpt.org/api/v4/odpt:Train"
+
+HACHIOJI_STATION = "odpt.Station:JR-East.ChuoRapid.Hachioji"
+# 在線位置 (odpt:fromStation / odpt:toStation) がこれらの駅の列車を対象にする
+HACHIOJI_STATIONS = (HACHIOJI_STATION,)
+# stations にこれを渡すと駅で絞り込まずに路線全体の列車を取り出す
+ALL_STATIONS = None
+
+# 運行方向 (odpt:railDirection)。中央線は東京方面が上り
+UP = "odpt.RailDirection:Inbound"
+DOWN = "odpt.RailDirection:Outbound"
+
+CHUNK_SIZE = 65536
+
+# 2025年API仕様に準拠したヘッダー
+HEADERS = {
+    "Accept": "application/json",
+    "User-Agent": "TrainInfoApp/1.0"
+}
+
+
+def build_params(access_token):
+    """
+    2025年API仕様に準拠したリクエストパラメータを返す
+    """
+    return {
+        "acl:consumerKey": access_token,
+        "odpt:railway": "odpt.Railway:JR-East.ChuoRapid",
+        "odpt:operator": "odpt.Operator:JR-East"
+    }
+
+
+# ----------------------------------------------------------------------------
+# 列車情報の取得と解析
+# ----------------------------------------------------------------------------
+def fetch_train_data(url, params, session=None, timeout=15):
+    """
+    odpt:Train エンドポイントから列車情報 (JSONのリスト) を取得する
+    200 OK 以外の場合は requests.exceptions.HTTPError を送出する
+    """
+    import requests
+
+    with metrics.span("odpt_fetch"):
+        response = (session or requests).get(url, params=params, headers=HEADERS, timeout=timeout)
+        response.raise_for_status()
+    return response.json()
+
+
+def _is_target(train, stations):
+    if stations is None:
+        return True
+    return (train.get("odpt:fromStation") in stations or
+            train.get("odpt:toStation") in stations)
+
+
+def parse_train_delays(train_data, stations=HACHIOJI_STATIONS):
+    """
+    列車情報 (JSONのリスト) から八王子駅に在線・接近中の列車の {列車番号: 遅延秒数} を取り出す
+    駅は部分一致ではなく駅IDの完全一致で判定する
+    """
+    stations = None if stations is None else frozenset(stations)
+    delays = {}
+    for train in train_data or []:
+        train_number = train.get("odpt:trainNumber")
+        if train_number and _is_target(train, stations):
+            # 遅延情報（秒単位）
+            delays[train_number] = train.get("odpt:delay") or 0
+    metrics.count("odpt_trains_seen", len(train_data or []))
+    metrics.count("odpt_trains_matched", len(delays))
+    return delays
+
+
+# ----------------------------------------------------------------------------
+# 逐次解析 (応答全体を Python のオブジェクトにしない)
+# ----------------------------------------------------------------------------
+_SEPARATOR_RE = re.compile(r"[\s,]*")
+
+
+class TrainStreamParser:
+    """
+    odpt:Train の応答 (列車オブジェクトの配列) を断片ごとに受け取り、
+    対象駅の列車の番号・遅延・在線位置・運行方向だけを取り出す
+    (stations が ALL_STATIONS なら路線全体の列車)
+
+    列車オブジェクトは配列の要素ごとに1件ずつデコードし、使う項目だけを見て
+    すぐに捨てる。保持するのは読みかけの断片と対象駅の列車の遅延だけなので、
+    フィードが大きくなってもメモリ使用量は増えない
+    """
+
+    def __init__(self, stations=HACHIOJI_STATIONS):
+        self.stations = None if stations is None else frozenset(stations)
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self.started = False
+        self.finished = False
+        self.seen = 0
+        # {列車番号: {"delay": 遅延秒数, "from_station": 駅ID, "to_station": 駅ID,
+        #             "direction": 運行方向}}
+        self.trains = {}
+
+    @property
+    def delays(self):
+        return snapshot_delays(self.trains)
+
+    def feed(self, text):
+        if self.finished:
+            return
+        self._buffer += text
+        self._consume(final=False)
+
+    def close(self):
+        """
+        入力の終わり。配列が閉じていなければ ValueError を送出する
+        """
+        if not self.finished:
+            self._consume(final=True)
+        if not self.finished:
+            raise ValueError("odpt:Train の応答が途中で切れています")
+        return self.trains
+
+    def _consume(self, final):
+        buffer = self._buffer
+        pos = _SEPARATOR_RE.match(buffer).end() if not self.started else 0
+        if not self.started:
+            if pos == len(buffer):
+                self._buffer = ""
+                return
+            if buffer[pos] != "[":
+                raise ValueError(f"odpt:Train の応答が配列ではありません: {buffer[pos:pos + 200]}")
+            self.started = True
+            pos += 1
+
+        while True:
+            pos = _SEPARATOR_RE.match(buffer, pos).end()
+            if pos == len(buffer):
+                break
+            if buffer[pos] == "]":
+                self.finished = True
+                pos += 1
+                break
+            try:
+                train, end = self._decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # まだ途中までしか届いていない
+                if final:
+                    raise ValueError("odpt:Train の応答を解析できません")
+                break
+            self.seen += 1
+            self._accept(train)
+            pos = end
+        self._buffer = buffer[pos:]
+
+    def _accept(self, train):
+        if not isinstance(train, dict):
+            return
+        train_number = train.get("odpt:trainNumber")
+        if train_number and _is_target(train, self.stations):
+            self.trains[train_number] = {
+                "delay": train.get("odpt:delay") or 0,
+                "from_station": train.get("odpt:fromStation"),
+                "to_station": train.get("odpt:toStation"),
+                "direction": train.get("odpt:railDirection"),
+            }
+
+
+def parse_train_snapshot(chunks, stations=HACHIOJI_STATIONS, encoding="utf-8"):
+    """
+    odpt:Train の応答の断片 (bytes または str のイテラブル) から対象駅の列車の
+    {列車番号: {"delay": 遅延秒数, "from_station": 駅ID, "to_station": 駅ID,
+    "direction": 運行方向}} を取り出す
+    """
+    parser = TrainStreamParser(stations)
+    decoder = codecs.getincrementaldecoder(encoding)()
+    # 受信と解析が交互に進むため、解析 (デコード + 絞り込み) の時間だけを合計する
+    parse_seconds = 0.0
+    for chunk in chunks:
+        started = time.perf_counter()
+        parser.feed(decoder.decode(chunk) if isinstance(chunk, bytes) else chunk)
+        parse_seconds += time.perf_counter() - started
+    parser.feed(decoder.decode(b"", final=True))
+    trains = parser.close()
+    metrics.observe("odpt_parse", parse_seconds)
+    metrics.count("odpt_trains_seen", parser.seen)
+    metrics.count("odpt_trains_matched", len(trains))
+    return trains
+
+
+def parse_train_stream(chunks, stations=HACHIOJI_STATIONS, encoding="utf-8"):
+    """
+    odpt:Train の応答の断片から対象駅の列車の {列車番号: 遅延秒数} を取り出す
+    """
+    return snapshot_delays(parse_train_snapshot(chunks, stations, encoding))
+
+
+class TrainSnapshot(dict):
+    """
+    列車ごとの状態の辞書 (parse_train_snapshot の結果) に取得の情報を添えたもの
+      - stale: 今回の取得に失敗し、前回取得した値 (または空) で代用している
+      - fetched_at: 値を取得した時刻 (time.time())
+      - source: 取得元のURL
+    """
+
+    def __init__(self, trains=(), stale=False, fetched_at=None, source=None):
+        super().__init__(trains)
+        self.stale = stale
+        self.fetched_at = fetched_at
+        self.source = source
+
+
+def snapshot_delays(snapshot):
+    """
+    列車ごとの状態から {列車番号: 遅延秒数} を作る
+    """
+    return {train_number: train["delay"] for train_number, train in snapshot.items()}
+
+
+def fetch_train_delays(url, params, session=None, timeout=15, stations=HACHIOJI_STATIONS):
+    """
+    odpt:Train エンドポイントの応答を読みながら解析し、
+    対象駅の列車の {列車番号: 遅延秒数} を返す
+    200 OK 以外の場合は requests.exceptions.HTTPError を送出する
+    """
+    return snapshot_delays(fetch_train_snapshot(url, params, session, timeout, stations))
+
+
+def fetch_train_snapshot(url, params, session=None, timeout=15, stations=HACHIOJI_STATIONS):
+    """
+    fetch_train_delays と同じだが、列車ごとの遅延と在線位置
+    ({列車番号: {"delay", "from_station", "to_station"}}) を返す
+
+    odpt_fetch にはリクエストから応答ヘッダーを受け取るまでを記録し、
+    本文は読みながら解析するので解析の時間は odpt_parse に入る
+    """
+    import requests
+
+    with metrics.span("odpt_fetch"):
+        response = (session or requests).get(url, params=params, headers=HEADERS,
+                                             timeout=timeout, stream=True)
+        if not response.ok:
+            # エラー詳細を表示できるよう、閉じる前にエラーの本文を読んでおく
+            with response:
+                response.content
+            response.raise_for_status()
+    with response:
+        return parse_train_snapshot(response.iter_content(CHUNK_SIZE), stations)
+
+
+def fetch_line_snapshot(url, params, session=None, timeout=15):
+    """
+    fetch_train_snapshot と同じだが、駅で絞り込まずに路線全体の列車を返す
+    (複数の駅の発車標に1回の取得で遅延を配るときに使う)
+    """
+    return fetch_train_snapshot(url, params, session, timeout, ALL_STATIONS)
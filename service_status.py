@@ -0,0 +1,228 @@
+import codecs
+import re
+import threading
+from html.parser import HTMLParser
+
+import metrics
+
+# -----------------------------------------------------------------------------
+# 設定
+# -----------------------------------------------------------------------------
+# Yahoo!路線情報 JR中央線(快速) の運行情報ページ
+SERVICE_STATUS_URL = "https://transit.yahoo.co.jp/diainfo/38/0"
+
+# 運行状況 (<dt>) と詳細 (<dd>) が入っている要素の id
+STATUS_BLOCK_ID = "mdServiceStatus"
+
+CHUNK_SIZE = 8192
+# <meta charset="..."> と <meta http-equiv="Content-Type" content="...; charset=..."> の両方に一致する
+META_CHARSET_RE = re.compile(rb"<meta[^>]*?charset\s*=\s*[\"']?([A-Za-z0-9_.:-]+)", re.IGNORECASE)
+
+
+# ----------------------------------------------------------------------------
+# 運行情報ブロックだけを取り出すパーサー
+# ----------------------------------------------------------------------------
+class ServiceStatusParser(HTMLParser):
+    """
+    ページ全体の木は作らず、運行情報ブロック内の最初の <dt>/<dd> だけを拾う
+    必要な部分を読み終えたら done が True になり、それ以降の入力は無視する
+    """
+
+    def __init__(self, block_id=STATUS_BLOCK_ID):
+        super().__init__(convert_charrefs=True)
+        self.block_id = block_id
+        self.block_tag = None
+        self.depth = 0
+        self.current = None
+        self.texts = {"dt": [], "dd": []}
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if self.block_tag is None:
+            if dict(attrs).get("id") == self.block_id:
+                self.block_tag = tag
+                self.depth = 1
+            return
+        if tag == self.block_tag:
+            self.depth += 1
+        elif tag in self.texts and self.current is None:
+            self.current = tag
+
+    def handle_endtag(self, tag):
+        if self.done or self.block_tag is None:
+            return
+        if tag == self.current:
+            self.current = None
+            # 状況と詳細の組がそろえば終わり
+            if tag == "dd":
+                self.done = True
+        elif tag == self.block_tag:
+            self.depth -= 1
+            if self.depth == 0:
+                self.done = True
+
+    def handle_data(self, data):
+        if self.current is not None:
+            self.texts[self.current].append(data)
+
+    def result(self):
+        """
+        {"status": 運行状況, "detail": 詳細} を返す。ブロックが見つからなければ None
+        """
+        if self.block_tag is None:
+            return None
+        # BeautifulSoup の get_text(strip=True) と同じく各文字列を strip して連結する
+        status, detail = ("".join(text.strip() for text in self.texts[tag])
+                          for tag in ("dt", "dd"))
+        return {"status": status, "detail": detail}
+
+
+def parse_service_status(chunks, block_id=STATUS_BLOCK_ID):
+    """
+    HTML文字列 (またはその断片のイテラブル) から運行情報を取り出す
+    運行情報ブロックを読み終えた時点で残りの入力は読まない
+    """
+    if isinstance(chunks, str):
+        chunks = (chunks,)
+    parser = ServiceStatusParser(block_id)
+    for chunk in chunks:
+        parser.feed(chunk)
+        if parser.done:
+            break
+    return parser.result()
+
+
+def _declared_charset(content_type):
+    """
+    Content-Type ヘッダーに明示された charset (なければ None)
+    requests の response.encoding は charset のない text/html を ISO-8859-1 とみなすため使わない
+    """
+    for param in (content_type or "").split(";")[1:]:
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "charset":
+            return value.strip().strip("'\"") or None
+    return None
+
+
+def _known_codec(name):
+    try:
+        return codecs.lookup(name).name
+    except (LookupError, TypeError):
+        return None
+
+
+def _decode_chunks(response):
+    """
+    応答の本文を少しずつ文字列にして返す
+    文字コードはヘッダーの charset、なければ先頭の <meta> の charset、どちらもなければ UTF-8
+    """
+    chunks = response.iter_content(chunk_size=CHUNK_SIZE)
+    first = next(chunks, b"")
+    encoding = _known_codec(_declared_charset(response.headers.get("Content-Type")))
+    if encoding is None:
+        match = META_CHARSET_RE.search(first)
+        encoding = _known_codec(match.group(1).decode("ascii")) if match else None
+    decoder = codecs.getincrementaldecoder(encoding or "utf-8")(errors="replace")
+    yield decoder.decode(first)
+    for chunk in chunks:
+        yield decoder.decode(chunk)
+    yield decoder.decode(b"", final=True)
+
+
+# ----------------------------------------------------------------------------
+# 条件付きGETで運行情報を取得する
+# ----------------------------------------------------------------------------
+class ServiceStatusFetcher:
+    """
+    ETag / Last-Modified を覚えておき、ページが変わっていなければ (304)
+    前回の解析結果をそのまま返す
+    """
+
+    def __init__(self, url=SERVICE_STATUS_URL):
+        self.url = url
+        self.etag = None
+        self.last_modified = None
+        self.status = None
+        self.stats = {"parsed": 0, "not_modified": 0}
+        self._lock = threading.Lock()
+
+    def fetch(self, timeout=15, session=None):
+        # requests は運行情報を使うときだけ読み込む
+        import requests
+
+        with self._lock:
+            headers = {}
+            if self.status is not None:
+                if self.etag:
+                    headers["If-None-Match"] = self.etag
+                if self.last_modified:
+                    headers["If-Modified-Since"] = self.last_modified
+
+        with metrics.span("status_fetch"):
+            response = (session or requests).get(self.url, headers=headers,
+                                                 timeout=timeout, stream=True)
+            with response:
+                if response.status_code == 304:
+                    metrics.count("status_not_modified")
+                    with self._lock:
+                        self.stats["not_modified"] += 1
+                        return self.status
+                response.raise_for_status()
+                with metrics.span("status_parse"):
+                    status = parse_service_status(_decode_chunks(response))
+        metrics.count("status_parsed")
+
+        with self._lock:
+            self.etag = response.headers.get("ETag")
+            self.last_modified = response.headers.get("Last-Modified")
+            self.status = status
+            self.stats["parsed"] += 1
+        return status
+
+
+_fetchers = {}
+_fetchers_lock = threading.Lock()
+
+
+def get_service_status(url=SERVICE_STATUS_URL, timeout=15, session=None):
+    """
+    運行情報ページを取得し、{"status": 運行状況, "detail": 詳細} を返す
+    ページに運行情報ブロックが見つからなければ None を返す
+    """
+    with _fetchers_lock:
+        fetcher = _fetchers.get(url)
+        if fetcher is None:
+            fetcher = _fetchers[url] = ServiceStatusFetcher(url)
+    return fetcher.fetch(timeout=timeout, session=session)
+
+
+def print_service_status(url=SERVICE_STATUS_URL):
+    """
+    運行情報を取得して表示する
+    """
+    import requests
+
+    try:
+        status = get_service_status(url)
+    except requests.exceptions.RequestException as req_err:
+        print(f"運行情報の取得に失敗しました: {req_err}")
+        return
+    render_service_status(status)
+
+
+def service_status_lines(status):
+    """
+    運行情報の表示を1行ずつのリストで返す
+    """
+    if status is None:
+        return ["運行情報が見つかりませんでした。"]
+    return [status["status"], status["detail"]]
+
+
+def render_service_status(status):
+    """
+    運行情報を表示する
+    """
+    print("\n".join(service_status_lines(status)))
@@ -0,0 +1,31 @@
+# -----------------------------------------------------------------------------
+# 八王子駅⇔東京工科大学 シャトルバス時刻表
+# -----------------------------------------------------------------------------
+# バス時刻表データ（キャンパス発、駅発着）
+BUS_TIMETABLE = [
+    ("07:15", "07:30"), ("07:28", "07:40"), ("07:33", "07:45"), ("07:38", "07:50"), ("07:43", "07:55"),
+    ("09:03", "09:15"), ("09:08", "09:20"), ("09:13", "09:25"), ("09:18", "09:30"), ("09:23", "09:35"),
+    ("09:28", "09:40"), ("09:33", "09:45"), ("09:38", "09:50"), ("09:43", "09:55"), ("09:48", "10:00"),
+    ("09:53", "10:05"), ("09:58", "10:10"), ("10:03", "10:15"), ("10:08", "10:20"), ("10:13", "10:25"),
+    ("10:18", "10:30"), ("10:23", "10:35"), ("10:28", "10:40"), ("10:33", "10:45"), ("10:38", "10:50"),
+    ("10:48", "11:00"), ("10:58", "11:10"), ("11:08", "11:20"), ("11:18", "11:30"), ("11:28", "11:40"),
+    ("11:38", "11:50"), ("11:53", "12:05"), ("12:03", "12:15"), ("12:08", "12:20"), ("12:13", "12:25"),
+    ("12:18", "12:30"), ("12:23", "12:35"), ("12:28", "12:40"), ("12:33", "12:45"), ("12:38", "12:50"),
+    ("12:48", "13:00"), ("12:58", "13:10"), ("13:08", "13:20"), ("13:18", "13:30"), ("13:28", "13:40"),
+    ("13:38", "13:50"), ("13:48", "14:00"), ("13:58", "14:10"), ("14:08", "14:20"), ("14:18", "14:30"),
+    ("14:28", "14:40"), ("14:38", "14:50"), ("14:48", "15:00"), ("15:00", "15:11"),
+    ("15:30", "15:41"), ("15:40", "15:51"), ("15:50", "16:01"), ("16:00", "16:11"), ("16:10", "16:21"), ("16:20", "16:31"),
+    ("17:30", "17:41"), ("17:40", "17:51"), ("17:50", "18:01"), ("18:00", "18:11"), ("18:10", "18:21"),
+    ("18:20", "18:31"), ("18:30", "18:41"), ("18:40", "18:51"),
+    ("19:10", "19:21"), ("19:20", "19:31"), ("19:30", "19:41"), ("19:40", "19:51"), ("19:50", "20:01"),
+    ("20:00", "20:11"), ("20:10", "20:21"), ("20:20", "20:31"), ("20:30", "20:41"), ("20:45", "20:56"),
+    ("21:00", "21:11"), ("21:10", "21:21"), ("21:15", "21:26"), ("21:20", "21:31")
+]
+
+# シャトル運行の時間帯定義
+SHUTTLE_PERIODS = [
+    ("07:55", "09:03", "約3～5分間隔"),
+    ("15:11", "15:30", "約5～10分間隔"),
+    ("16:31", "17:30", "約3～10分間隔"),
+    ("18:51", "19:10", "約5～10分間隔")
+]
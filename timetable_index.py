@@ -0,0 +1,158 @@
+import heapq
+import math
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+import metrics
+from delay_index import as_delay_index
+
+# -----------------------------------------------------------------------------
+# 定数
+# -----------------------------------------------------------------------------
+# 運行日の区切り (4時より前の列車は前日の運行日として扱う)
+SERVICE_DAY_START_HOUR = 4
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def parse_hhmm(time_str):
+    """
+    "HH:MM" 形式の文字列を 0時起点の分に変換する
+    """
+    hour, minute = time_str.split(":")
+    return int(hour) * 60 + int(minute)
+
+
+def service_minute(time_str):
+    """
+    "HH:MM" 形式の文字列を運行日起点の分に変換する
+    (0〜3時台は前日の運行日の続きとして 24時以降に繰り上げる)
+    """
+    minute = parse_hhmm(time_str)
+    if minute < SERVICE_DAY_START_HOUR * 60:
+        minute += 24 * 60
+    return minute
+
+
+def service_clock(now):
+    """
+    datetime を (運行日の0時, 運行日0時からの経過秒) に変換する
+    """
+    midnight = datetime(now.year, now.month, now.day, tzinfo=now.tzinfo)
+    seconds = (now - midnight).total_seconds()
+    if now.hour < SERVICE_DAY_START_HOUR:
+        midnight -= timedelta(days=1)
+        seconds += SECONDS_PER_DAY
+    return midnight, seconds
+
+
+def format_service_seconds(seconds):
+    """
+    運行日0時からの経過秒を "HH:MM" 形式にする (24時以降は 0時からに戻す)
+    """
+    minutes = int(seconds) // 60
+    return f"{minutes // 60 % 24:02d}:{minutes % 60:02d}"
+
+
+# ----------------------------------------------------------------------------
+# コンパイル済み時刻表
+# ----------------------------------------------------------------------------
+class TimetableIndex:
+    """
+    時刻表を運行日起点の分でソートしたインデックス
+
+    読み込み時に一度だけ文字列を解析しておき、問い合わせは
+    二分探索 + 遅延を考慮した少数件のマージだけで済ませる
+    """
+
+    def __init__(self, timetable):
+        compiled = sorted(
+            ((service_minute(entry["time"]), position, entry)
+             for position, entry in enumerate(timetable)),
+            key=lambda item: (item[0], item[1]),
+        )
+        self.timetable = timetable
+        self.minutes = [minute for minute, _, _ in compiled]
+        self.entries = [entry for _, _, entry in compiled]
+
+    @classmethod
+    def from_columns(cls, minutes, entries, timetable=None):
+        """
+        コンパイル済みの列 (運行日起点の分でソート済み) から作る
+        minutes / entries は添字でアクセスできれば memoryview などでもよい
+        """
+        index = cls.__new__(cls)
+        index.timetable = timetable if timetable is not None else entries
+        index.minutes = minutes
+        index.entries = entries
+        return index
+
+    def __len__(self):
+        return len(self.entries)
+
+    def select(self, now_seconds, k=3, delays=None):
+        """
+        運行日0時からの経過秒 now_seconds より後に発車する電車を実際の発車時刻順に最大k本選び、
+        (予定秒, 実発車秒, 遅延秒, 時刻表の位置) のリストで返す (秒は運行日0時起点)
+
+        delays は {列車番号: 遅延秒数} の辞書または DelayIndex
+        """
+        if k <= 0 or not self.entries:
+            return []
+        delays = as_delay_index(delays)
+        max_delay = delays.max_delay
+        min_delay = delays.min_delay
+
+        # 遅延で発車時刻が現在時刻を越えうる最も早い列車から走査を始める
+        size = len(self.entries)
+        start = bisect_left(self.minutes, math.ceil((now_seconds - max_delay) / 60))
+        best = []  # (-実発車秒, -走査順, 予定秒, 遅延秒, 位置) の最大ヒープ
+        order = 0
+        # 翌運行日に回り込んでも各列車は1回までしか走査しない
+        while order < size:
+            cycle, position = divmod(start + order, size)
+            scheduled = self.minutes[position] * 60 + cycle * SECONDS_PER_DAY
+            # 予定時刻が既にk本目より後なら、以降の列車が割り込むことはない
+            if len(best) == k and scheduled + min_delay > -best[0][0]:
+                break
+            delay_seconds = delays.lookup(self.entries[position].get("train_number"))
+            actual = scheduled + delay_seconds
+            if actual > now_seconds:
+                item = (-actual, -order, scheduled, delay_seconds, position)
+                if len(best) < k:
+                    heapq.heappush(best, item)
+                elif item > best[0]:
+                    heapq.heapreplace(best, item)
+            order += 1
+
+        return [(scheduled, -neg_actual, delay_seconds, position)
+                for neg_actual, _, scheduled, delay_seconds, position in sorted(best, reverse=True)]
+
+    def next_k(self, now, k=3, delays=None):
+        """
+        現在時刻以降に発車する電車を実際の発車時刻順に最大k本返す
+
+        delays は {列車番号: 遅延秒数} の辞書または DelayIndex
+        """
+        midnight, now_seconds = service_clock(now)
+        with metrics.span("next_trains_search"):
+            selected = self.select(now_seconds, k, delays)
+        results = []
+        for scheduled, actual, delay_seconds, position in selected:
+            scheduled_time = midnight + timedelta(seconds=scheduled)
+            actual_time = midnight + timedelta(seconds=actual)
+            entry_copy = self.entries[position].copy()  # 元のデータを変更しないようにコピー
+            entry_copy['scheduled_time'] = scheduled_time.strftime('%H:%M')
+            entry_copy['actual_time'] = actual_time.strftime('%H:%M')
+            entry_copy['delay_minutes'] = delay_seconds // 60
+            results.append(entry_copy)
+        if metrics.is_enabled():
+            metrics.count("delay_matched_trains",
+                          sum(1 for _, _, delay_seconds, _ in selected if delay_seconds))
+        return results
+
+
+def compile_timetable(timetable):
+    """
+    時刻表 (辞書のリスト) を TimetableIndex にコンパイルする
+    """
+    return TimetableIndex(timetable)
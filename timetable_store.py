@@ -0,0 +1,325 @@
+"""
+列指向のコンパイル済み時刻表 (メモリマップ可能なバイナリ形式)
+
+Python の辞書リストの時刻表を次の列に変換して1つのファイルに保存し、
+起動時は mmap するだけで使えるようにする (解析なし・複数プロセスでページ共有)
+
+    ヘッダー   : マジック, バージョン, バイト順, 件数, 文字列数, 文字列領域の長さ
+    文字列表   : uint32 のオフセット + UTF-8 (種別・行き先・列車番号を重複なしで格納)
+    minutes    : uint16  運行日起点の分 (昇順)
+    end        : uint16  到着・運行終了の運行日起点の分 (なしは 0xFFFF)
+    type       : uint16  種別の文字列番号
+    destination: uint16  行き先の文字列番号
+    note       : uint16  補足 (運行間隔など) の文字列番号 (なしは 0xFFFF)
+    train      : uint32  列車番号の文字列番号 (なしは 0xFFFFFFFF)
+
+    python timetable_store.py [出力ファイル]   # 八王子駅・平日・上りをコンパイルする
+"""
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from collections.abc import Mapping, Sequence
+
+from timetable_index import TimetableIndex, format_service_seconds, service_minute
+
+# -----------------------------------------------------------------------------
+# 形式
+# -----------------------------------------------------------------------------
+MAGIC = b"CHUOTT"
+VERSION = 2
+HEADER = struct.Struct("<6sHcxIIIxx")  # 4バイト境界にそろえる
+NO_TRAIN_NUMBER = 0xFFFFFFFF
+NO_VALUE = 0xFFFF
+BYTEORDER = b"<" if sys.byteorder == "little" else b">"
+
+# 既定の時刻表 (八王子駅・平日・上り) のソースとコンパイル先
+DEFAULT_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hachioji_timetable.py")
+DEFAULT_STORE = os.path.splitext(DEFAULT_SOURCE)[0] + ".ttbin"
+
+
+def _pad(data, alignment=4):
+    return data + b"\0" * (-len(data) % alignment)
+
+
+# ----------------------------------------------------------------------------
+# コンパイラ
+# ----------------------------------------------------------------------------
+def compile_store(timetable):
+    """
+    時刻表 (辞書のリスト) をバイナリ形式の bytes に変換する
+    エントリは "time" / "type" / "destination" を持ち、
+    "train_number" / "end_time" / "note" は省略できる
+    """
+    compiled = sorted(
+        ((service_minute(entry["time"]), position, entry)
+         for position, entry in enumerate(timetable)),
+        key=lambda item: (item[0], item[1]),
+    )
+
+    strings = []
+    codes = {}
+
+    def intern(value):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(strings)
+            strings.append(value)
+        return code
+
+    minutes, ends, types, destinations, notes, trains = [], [], [], [], [], []
+    for minute, _, entry in compiled:
+        minutes.append(minute)
+        end_time = entry.get("end_time")
+        ends.append(NO_VALUE if end_time is None else service_minute(end_time))
+        types.append(intern(entry["type"]))
+        destinations.append(intern(entry["destination"]))
+        note = entry.get("note")
+        notes.append(NO_VALUE if note is None else intern(note))
+        train_number = entry.get("train_number")
+        trains.append(NO_TRAIN_NUMBER if train_number is None else intern(train_number))
+    if len(strings) >= NO_VALUE:
+        raise ValueError("文字列の種類が多すぎます")
+
+    encoded = [value.encode("utf-8") for value in strings]
+    offsets = [0]
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+    blob = b"".join(encoded)
+
+    count = len(compiled)
+    parts = [
+        HEADER.pack(MAGIC, VERSION, BYTEORDER, count, len(strings), len(blob)),
+        struct.pack(f"={len(offsets)}I", *offsets),
+        _pad(blob),
+        _pad(struct.pack(f"={count}H", *minutes)),
+        _pad(struct.pack(f"={count}H", *ends)),
+        _pad(struct.pack(f"={count}H", *types)),
+        _pad(struct.pack(f"={count}H", *destinations)),
+        _pad(struct.pack(f"={count}H", *notes)),
+        struct.pack(f"={count}I", *trains),
+    ]
+    return b"".join(parts)
+
+
+def write_store(timetable, path):
+    """
+    時刻表をコンパイルして path にアトミックに書き出す
+    """
+    data = compile_store(timetable)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".ttbin-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        # 他のユーザーのワーカープロセスからも読めるようにする
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return data
+
+
+# ----------------------------------------------------------------------------
+# 読み込み (コピーなしで列を参照する)
+# ----------------------------------------------------------------------------
+class StoreFormatError(ValueError):
+    pass
+
+
+class CompiledTimetable(Sequence):
+    """
+    コンパイル済み時刻表の列を memoryview で参照する
+
+    従来の辞書の形は TimetableEntry (読み取り専用の Mapping) として
+    添字アクセスのたびに作るため、全件の辞書をメモリに持つことはない
+    """
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        view = memoryview(buffer)
+        if len(view) < HEADER.size:
+            raise StoreFormatError("ヘッダーが不完全です")
+        magic, version, byteorder, count, string_count, blob_size = HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            raise StoreFormatError("時刻表ファイルの形式が違います")
+        if byteorder != BYTEORDER:
+            raise StoreFormatError("バイト順が違います")
+
+        def section(start, size):
+            # 途中で切れたファイルでは cast() が TypeError になるので、先に長さを確かめる
+            if start + size > len(view):
+                raise StoreFormatError("データが途中で切れています")
+            return view[start:start + size]
+
+        offset = HEADER.size
+        offsets_size = (string_count + 1) * 4
+        self._string_offsets = section(offset, offsets_size).cast("I")
+        offset += offsets_size
+        self._blob = section(offset, blob_size)
+        offset += blob_size + (-blob_size % 4)
+
+        def column(fmt, itemsize):
+            nonlocal offset
+            size = count * itemsize
+            data = section(offset, size).cast(fmt)
+            offset += size + (-size % 4)
+            return data
+
+        self.minutes = column("H", 2)
+        self.end_minutes = column("H", 2)
+        self.type_codes = column("H", 2)
+        self.destination_codes = column("H", 2)
+        self.note_codes = column("H", 2)
+        self.train_codes = column("I", 4)
+        if len(self.train_codes) != count:
+            raise StoreFormatError("データが途中で切れています")
+        self._strings = [None] * string_count
+        self._index = None
+
+    def string(self, code):
+        """
+        文字列番号から文字列を返す (一度デコードしたものは使い回す)
+        """
+        value = self._strings[code]
+        if value is None:
+            start, end = self._string_offsets[code], self._string_offsets[code + 1]
+            value = self._strings[code] = str(self._blob[start:end], "utf-8")
+        return value
+
+    def __len__(self):
+        return len(self.minutes)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+        return TimetableEntry(self, position)
+
+    @property
+    def index(self):
+        """
+        この時刻表の TimetableIndex (列をそのまま使うので再ソートしない)
+        """
+        if self._index is None:
+            self._index = TimetableIndex.from_columns(self.minutes, self)
+        return self._index
+
+
+class TimetableEntry(Mapping):
+    """
+    コンパイル済み時刻表の1件を従来の辞書と同じ形で見せる
+    """
+
+    __slots__ = ("_table", "_position")
+    _KEYS = ("time", "type", "destination", "train_number", "end_time", "note")
+
+    def __init__(self, table, position):
+        self._table = table
+        self._position = position
+
+    def __getitem__(self, key):
+        table, position = self._table, self._position
+        if key == "time":
+            return format_service_seconds(table.minutes[position] * 60)
+        if key == "type":
+            return table.string(table.type_codes[position])
+        if key == "destination":
+            return table.string(table.destination_codes[position])
+        if key == "train_number":
+            code = table.train_codes[position]
+            if code == NO_TRAIN_NUMBER:
+                raise KeyError(key)
+            return table.string(code)
+        if key == "end_time":
+            minute = table.end_minutes[position]
+            if minute == NO_VALUE:
+                raise KeyError(key)
+            return format_service_seconds(minute * 60)
+        if key == "note":
+            code = table.note_codes[position]
+            if code == NO_VALUE:
+                raise KeyError(key)
+            return table.string(code)
+        raise KeyError(key)
+
+    def __iter__(self):
+        for key in self._KEYS:
+            if key in self:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, key):
+        if key == "train_number":
+            return self._table.train_codes[self._position] != NO_TRAIN_NUMBER
+        if key == "end_time":
+            return self._table.end_minutes[self._position] != NO_VALUE
+        if key == "note":
+            return self._table.note_codes[self._position] != NO_VALUE
+        return key in self._KEYS
+
+    def __repr__(self):
+        return repr(self.copy())
+
+    def copy(self):
+        """
+        通常の辞書にして返す
+        """
+        return dict(self.items())
+
+
+def open_store(path):
+    """
+    コンパイル済み時刻表ファイルを mmap して CompiledTimetable を返す
+    """
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return CompiledTimetable(buffer)
+
+
+def load_timetable(store_path=DEFAULT_STORE, source_path=DEFAULT_SOURCE, load_source=None):
+    """
+    コンパイル済み時刻表を開く
+
+    ファイルが無いか、ソースより古いか、壊れている場合は load_source() が返す時刻表から
+    コンパイルし直す。書き込めない場所ではメモリ上のバイト列をそのまま使う
+    """
+    try:
+        if os.path.getmtime(store_path) >= os.path.getmtime(source_path):
+            return open_store(store_path)
+    except (OSError, ValueError, TypeError):
+        # ValueError: 空のファイル (mmap できない)・形式の違い・途中で切れたファイル
+        pass
+
+    if load_source is None:
+        from hachioji_timetable import HACHIOJI_TIMETABLE_UP_WEEKDAY
+
+        def load_source():
+            return HACHIOJI_TIMETABLE_UP_WEEKDAY
+
+    timetable = load_source()
+    try:
+        write_store(timetable, store_path)
+        return open_store(store_path)
+    except OSError:
+        return CompiledTimetable(compile_store(timetable))
+
+
+def main():
+    from hachioji_timetable import HACHIOJI_TIMETABLE_UP_WEEKDAY
+
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_STORE
+    data = write_store(HACHIOJI_TIMETABLE_UP_WEEKDAY, path)
+    print(f"{path} に {len(HACHIOJI_TIMETABLE_UP_WEEKDAY)} 件 ({len(data)} バイト) を書き出しました")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+次の電車・バスをメモリ上の状態から返す常駐 HTTP サーバー
+
+時刻表は起動時に一度だけ読み込み、遅延情報と運行情報は裏のスレッドで
+定期的に更新する。各リクエストはメモリ上の状態だけで応答する
+
+    python train_server.py --port 8080
+
+エンドポイント (全て GET, JSON):
+    /trains?k=3&at=2025-01-27T08:00   次の電車 (at 省略時は現在時刻)
+    /buses?k=3&at=...                  次のバス
+    /status                            運行情報
+    /healthz                           各情報の更新時刻
+    /metrics                           計測結果 (Prometheus 形式, ?format=json で JSON Lines)
+                                       METRICS=1 のときだけ記録される
+"""
+import argparse
+import json
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import metrics
+from bus_timetable import get_bus_index
+from departure_board import DepartureBoards
+from find_next_trains_hachioji import get_hachioji_timetable, get_realtime_snapshot
+from service_status import get_service_status
+from train_state import AffectedEntries, TrainStateStore
+
+# -----------------------------------------------------------------------------
+# 設定
+# -----------------------------------------------------------------------------
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+# 遅延情報・運行情報の更新間隔 (秒)
+DELAY_REFRESH_INTERVAL = 30
+STATUS_REFRESH_INTERVAL = 60
+MAX_K = 20
+# 分ごとの発車標としてあらかじめ計算しておく本数 (これ以下の k はそこから返す)
+BOARD_K = 3
+
+
+# ----------------------------------------------------------------------------
+# メモリ上の状態
+# ----------------------------------------------------------------------------
+def fetch_service_status():
+    """
+    運行情報を共有セッションで取得する (接続の使い回しと、上流の応答の記録・再生のため)
+    """
+    from fetch_pipeline import get_session
+
+    return get_service_status(session=get_session())
+
+
+class BoardState:
+    """
+    時刻表・遅延情報・運行情報をメモリ上に保持し、裏のスレッドで更新する
+
+    更新は新しいオブジェクトへの参照の差し替えだけで行うため、
+    問い合わせ側はロックを取らずに読める
+
+    列車情報は TrainStateStore に差分として適用し、遅延が変わったときだけ
+    delays を差し替えて、分ごとの発車標の影響を受ける範囲を計算し直す
+    発車標も計算し直した複製をまとめて差し替える (DepartureBoards.update) ので、
+    問い合わせが古い分と新しい分の混ざった結果を見ることはない
+    変更は subscribe() で購読できる
+    """
+
+    def __init__(self, fetch_delays=get_realtime_snapshot, fetch_status=fetch_service_status,
+                 delay_interval=DELAY_REFRESH_INTERVAL, status_interval=STATUS_REFRESH_INTERVAL,
+                 index=None, bus_index=None):
+        if index is None:
+            index = get_hachioji_timetable().index
+        self.index = index
+        self.bus_index = get_bus_index() if bus_index is None else bus_index
+        self.trains = TrainStateStore()
+        self.delays = self.trains.delays
+        self.boards = DepartureBoards(index, self.delays, BOARD_K)
+        self._affected = AffectedEntries(index)
+        self.status = None
+        self.updated_at = {"delays": None, "status": None}
+        self._sources = {
+            "delays": (fetch_delays, delay_interval),
+            "status": (fetch_status, status_interval),
+        }
+        self._stop = threading.Event()
+        self._threads = []
+
+    def refresh(self, name):
+        """
+        name ("delays" / "status") の情報を取得し直す。失敗した場合は前回の値を使い続ける
+        """
+        fetch, _ = self._sources[name]
+        try:
+            value = fetch()
+        except Exception as e:
+            print(f"{name} の更新に失敗しました: {e}")
+            return
+        if name == "delays":
+            if getattr(value, "stale", False):
+                # 取得に失敗して前回の値 (または空) で代用している。前回の値を使い続ける
+                print("delays の更新に失敗しました: 前回の値を使い続けます")
+                return
+            changes = self.trains.apply(value)
+            value = self.trains.delays
+            if value is not self.delays:
+                self.boards.update(value, self._affected.positions(changes))
+        setattr(self, name, value)
+        self.updated_at[name] = time.time()
+
+    def _refresh_loop(self, name):
+        _, interval = self._sources[name]
+        while not self._stop.is_set():
+            self.refresh(name)
+            self._stop.wait(interval)
+
+    def start(self):
+        """
+        定期更新のスレッドを開始する
+        """
+        for name in self._sources:
+            thread = threading.Thread(target=self._refresh_loop, args=(name,),
+                                      name=f"refresh-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self.trains.close()
+
+    def subscribe(self, since=None, timeout=None):
+        """
+        列車の状態の変更を1件ずつ返すイテレーターを返す (TrainStateStore.changes)
+        """
+        return self.trains.changes(since, timeout)
+
+    def next_trains(self, now, k=3):
+        if k <= self.boards.k:
+            return self.boards.lookup(now)[:k]
+        return self.index.next_k(now, k, self.delays)
+
+    def next_buses(self, now, k=3):
+        return self.bus_index.next_buses(now, k)
+
+
+# ----------------------------------------------------------------------------
+# リクエスト処理
+# ----------------------------------------------------------------------------
+def _parse_query(query):
+    params = parse_qs(query)
+    k = min(max(int(params.get("k", ["3"])[0]), 0), MAX_K)
+    at = params.get("at")
+    now = datetime.fromisoformat(at[0]) if at else datetime.now()
+    return now, k
+
+
+def handle_query(state, path, query=""):
+    """
+    パスとクエリ文字列から (HTTPステータス, JSONの辞書) を返す
+    """
+    try:
+        now, k = _parse_query(query)
+    except ValueError as e:
+        return 400, {"error": str(e)}
+
+    if path == "/trains":
+        return 200, {
+            "now": now.isoformat(timespec="seconds"),
+            "trains": state.next_trains(now, k),
+            "delays_updated_at": state.updated_at["delays"],
+        }
+    if path == "/buses":
+        return 200, {"now": now.isoformat(timespec="seconds"), "buses": state.next_buses(now, k)}
+    if path == "/status":
+        return 200, {"status": state.status, "updated_at": state.updated_at["status"]}
+    if path == "/healthz":
+        return 200, {"updated_at": state.updated_at, "trains_version": state.trains.version}
+    return 404, {"error": f"not found: {path}"}
+
+
+class BoardRequestHandler(BaseHTTPRequestHandler):
+    # Keep-Alive で同じ接続を使い回せるようにする
+    protocol_version = "HTTP/1.1"
+    # ヘッダーと本文を別々に送るため、Nagle アルゴリズムで応答が遅れないようにする
+    disable_nagle_algorithm = True
+    state = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/metrics":
+            self._send_metrics(url.query)
+            return
+        with metrics.span("http_request"):
+            status, payload = handle_query(self.state, url.path, url.query)
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self._send(status, body, "application/json; charset=utf-8")
+
+    def _send_metrics(self, query):
+        if parse_qs(query).get("format") == ["json"]:
+            body = metrics.render_json_lines()
+            content_type = "application/x-ndjson; charset=utf-8"
+        else:
+            body = metrics.render_prometheus()
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        self._send(200, body.encode("utf-8"), content_type)
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # リクエストごとのログ出力は遅いので行わない
+        pass
+
+
+def make_server(state, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """
+    state を返す HTTP サーバーを作る (serve_forever は呼び出し側で行う)
+    """
+    handler = type("BoundBoardRequestHandler", (BoardRequestHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="次の電車・バスを返す常駐HTTPサーバー")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    state = BoardState()
+    state.start()
+    server = make_server(state, args.host, args.port)
+    print(f"http://{args.host}:{server.server_port}/trains で待ち受け中")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        state.stop()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+列車ごとの状態を保持し、取得のたびのスナップショットを差分として適用するストア
+
+30秒ごとの取得で実際に変わる列車はわずかなので、前回の状態と比べて
+追加・変更・削除された列車だけを変更として記録する。遅延秒数と在線位置が
+どちらも同じ列車は変更に含めない
+
+変更は TrainStateStore.changes() のイテレーターで購読できる (ポーリング不要)
+
+    store = TrainStateStore()
+    for change in store.changes():      # 別スレッドで
+        print(change["kind"], change["train_number"])
+    ...
+    store.apply(get_realtime_snapshot())
+"""
+import threading
+from collections import deque
+from collections.abc import Mapping
+
+from delay_index import DelayIndex, normalize_train_number
+
+# -----------------------------------------------------------------------------
+# 設定
+# -----------------------------------------------------------------------------
+ADDED = "added"
+CHANGED = "changed"
+REMOVED = "removed"
+# 購読側が遅れすぎて履歴から消えた変更を読めなかったことを表す
+RESET = "reset"
+
+# 購読用に保持する変更履歴 (スナップショットの適用回数)
+DEFAULT_HISTORY = 256
+
+
+def _as_record(value):
+    """
+    スナップショットの1件を {"delay", "from_station", "to_station"} にそろえる
+    ({列車番号: 遅延秒数} の形のスナップショットも受け付ける)
+    """
+    if isinstance(value, Mapping):
+        return {"delay": value.get("delay") or 0,
+                "from_station": value.get("from_station"),
+                "to_station": value.get("to_station")}
+    return {"delay": value or 0, "from_station": None, "to_station": None}
+
+
+def diff_snapshots(old, new):
+    """
+    2つのスナップショット ({列車番号: 状態}) の差分を変更のリストで返す
+    各変更は {"kind", "train_number", "old", "new"} の辞書 (列車番号順)
+    """
+    changes = []
+    for train_number in sorted(old.keys() | new.keys()):
+        before = old.get(train_number)
+        after = new.get(train_number)
+        if before == after:
+            continue
+        if before is None:
+            kind = ADDED
+        elif after is None:
+            kind = REMOVED
+        else:
+            kind = CHANGED
+        changes.append({"kind": kind, "train_number": train_number, "old": before, "new": after})
+    return changes
+
+
+# ----------------------------------------------------------------------------
+# 状態ストア
+# ----------------------------------------------------------------------------
+class TrainStateStore:
+    """
+    列車番号ごとの最新の状態 (遅延秒数・在線位置) を保持する
+
+    apply() はスナップショットを前回の状態との差分として適用し、実際に
+    変わった列車の変更だけを返す。変更があるたびに version が1つ増える
+    遅延秒数が変わったときだけ DelayIndex を作り直す (在線位置だけの変更では作らない)
+    """
+
+    def __init__(self, history=DEFAULT_HISTORY):
+        self._trains = {}
+        self._delays = DelayIndex()
+        self._condition = threading.Condition()
+        self._history = deque(maxlen=history)
+        self.version = 0
+        self.closed = False
+        self.stats = {"snapshots": 0, "unchanged": 0, ADDED: 0, CHANGED: 0, REMOVED: 0}
+
+    def apply(self, snapshot):
+        """
+        スナップショット ({列車番号: 状態} または {列車番号: 遅延秒数}) を適用し、
+        変更のリストを返す (変更がなければ空のリスト)
+        """
+        new = {train_number: _as_record(value) for train_number, value in snapshot.items()
+               if train_number}
+        with self._condition:
+            self.stats["snapshots"] += 1
+            changes = diff_snapshots(self._trains, new)
+            if not changes:
+                self.stats["unchanged"] += 1
+                return changes
+
+            self.version += 1
+            for change in changes:
+                change["version"] = self.version
+                self.stats[change["kind"]] += 1
+            if any(change["kind"] != CHANGED or
+                   change["old"]["delay"] != change["new"]["delay"] for change in changes):
+                self._delays = DelayIndex({train_number: record["delay"]
+                                           for train_number, record in new.items()})
+            self._trains = new
+            self._history.append((self.version, changes))
+            self._condition.notify_all()
+        return changes
+
+    @property
+    def delays(self):
+        """
+        現在の {列車番号: 遅延秒数} の DelayIndex (遅延が変わらない限り同じオブジェクト)
+        """
+        return self._delays
+
+    def get(self, train_number):
+        record = self._trains.get(train_number)
+        return dict(record) if record is not None else None
+
+    def snapshot(self):
+        """
+        現在の全列車の状態のコピーを返す
+        """
+        with self._condition:
+            return {train_number: dict(record) for train_number, record in self._trains.items()}
+
+    def __len__(self):
+        return len(self._trains)
+
+    def changes(self, since=None, timeout=None):
+        """
+        変更を1件ずつ返すイテレーター (ChangeStream) を返す
+        since 以降の version の変更から始める (省略時はこれから起きる変更だけ)
+        """
+        return ChangeStream(self, self.version if since is None else since, timeout)
+
+    def close(self):
+        """
+        購読中の全てのイテレーターを終了させる
+        """
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    def _wait_changes(self, after, timeout):
+        """
+        version が after より新しい変更を返す。timeout 秒待っても無ければ None
+        """
+        with self._condition:
+            if not self._condition.wait_for(
+                    lambda: self.closed or self.version > after, timeout=timeout):
+                return None
+            if self.version <= after:
+                return None
+            oldest = self._history[0][0]
+            if after < oldest - 1:
+                # 読めなかった変更がある。購読側は snapshot() から読み直すこと
+                return self.version, [{"kind": RESET, "train_number": None,
+                                       "old": None, "new": None, "version": self.version}]
+            changes = [change for version, batch in self._history if version > after
+                       for change in batch]
+            return self.version, changes
+
+
+class ChangeStream:
+    """
+    TrainStateStore の変更を1件ずつ返すイテレーター
+
+    次の変更が起きるまでブロックする。ストアが閉じられるか close() を呼ぶか、
+    timeout 秒変更がなければ終わる
+    """
+
+    def __init__(self, store, version, timeout=None):
+        self.store = store
+        self.version = version
+        self.timeout = timeout
+        self._pending = deque()
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while not self._pending:
+            if self._closed:
+                raise StopIteration
+            result = self.store._wait_changes(self.version, self.timeout)
+            if result is None:
+                raise StopIteration
+            self.version, changes = result
+            self._pending.extend(changes)
+        return self._pending.popleft()
+
+    def close(self):
+        self._closed = True
+
+
+# ----------------------------------------------------------------------------
+# 変更の影響を受ける時刻表の位置
+# ----------------------------------------------------------------------------
+class AffectedEntries:
+    """
+    変更された列車番号から、遅延の変わる可能性がある時刻表の位置を求める
+
+    DelayIndex は基本番号でも照合するため、同じ基本番号の列車は全て対象にする
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self._positions = {}
+        for position, entry in enumerate(index.entries):
+            base_number = normalize_train_number(entry.get("train_number"))
+            if base_number:
+                self._positions.setdefault(base_number, []).append(position)
+
+    def positions(self, changes):
+        """
+        変更のリスト (または列車番号のイテラブル) に対応する時刻表の位置の集合を返す
+        RESET が含まれる場合は全ての位置を返す
+        """
+        affected = set()
+        for change in changes:
+            if isinstance(change, Mapping):
+                if change["kind"] == RESET:
+                    return set(range(len(self.index)))
+                change = change["train_number"]
+            affected.update(self._positions.get(normalize_train_number(change), ()))
+        return affected
@@ -0,0 +1,374 @@
+"""
+上流 (ODPT API・運行情報ページ) の応答の記録と再生
+
+記録: 環境変数 UPSTREAM_RECORD にファイル名 (例: upstream.jsonl.gz) を設定すると、
+共有セッション (fetch_pipeline.get_session) が受け取った応答を生のまま時刻付きで
+gzip 圧縮の JSON Lines に追記する。1件ずつ独立した gzip のメンバーにして
+ファイルをロックしてから書き込むので、途中で止まっても書き終えた分は読め、
+複数のプロセスが同じファイルに記録しても混ざらない (API キーは記録しない)
+
+再生: 記録を配信する代役サーバーを立て、環境変数 UPSTREAM_REPLAY にそのURLを設定して
+起動すると、上流へのリクエストが代役サーバーに向く。代役サーバーは記録の時刻を
+speed 倍で進め、その時点で最新の応答を返す
+
+    UPSTREAM_RECORD=upstream.jsonl.gz python find_next_trains_hachioji.py
+    python upstream_log.py replay upstream.jsonl.gz --speed 10 --port 8765
+    UPSTREAM_REPLAY=http://127.0.0.1:8765 python find_next_trains_hachioji.py
+    python upstream_log.py info upstream.jsonl.gz
+"""
+import argparse
+import base64
+import gzip
+import json
+import os
+import threading
+import time
+import warnings
+import zlib
+from bisect import bisect_right
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlencode, urlsplit, urlunsplit
+
+try:
+    import fcntl
+except ImportError:  # Windows ではプロセス間ロックなしで動作する
+    fcntl = None
+
+# -----------------------------------------------------------------------------
+# 設定
+# -----------------------------------------------------------------------------
+RECORD_ENV = "UPSTREAM_RECORD"
+REPLAY_ENV = "UPSTREAM_REPLAY"
+DEFAULT_PORT = 8765
+# 記録しないクエリ (API キー)
+SECRET_PARAMS = ("acl:consumerKey",)
+# 記録・再生する応答ヘッダー
+RECORDED_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+
+def upstream_urls():
+    """
+    記録・再生の対象にする上流のURL
+    """
+    from odpt_client import ALTERNATIVE_API_URL, REALTIME_API_URL
+    from service_status import SERVICE_STATUS_URL
+
+    return (REALTIME_API_URL, ALTERNATIVE_API_URL, SERVICE_STATUS_URL)
+
+
+def _redact(url):
+    parts = urlsplit(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if key not in SECRET_PARAMS]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+# ----------------------------------------------------------------------------
+# 記録
+# ----------------------------------------------------------------------------
+class UpstreamRecorder:
+    """
+    応答を gzip 圧縮の JSON Lines に追記する
+
+    1行は {"time": 受信時刻 (time.time()), "url", "status", "headers", "body"} の辞書
+    本文が UTF-8 でなければ "body" の代わりに "body_base64" を持つ
+    1件ごとに完結した gzip のメンバーを作り、ファイルを排他ロック (flock) してから
+    まとめて追記する (同じファイルに記録する他のプロセスと書き込みが混ざらない)
+    """
+
+    def __init__(self, path, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self.count = 0
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._lock = threading.Lock()
+
+    def _append(self, data):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(self._fd, view):]
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def write(self, url, status, headers, body, recorded_at=None):
+        record = {"time": self.clock() if recorded_at is None else recorded_at,
+                  "url": _redact(url), "status": status,
+                  "headers": {name: headers[name] for name in RECORDED_HEADERS
+                              if headers.get(name) is not None}}
+        try:
+            record["body"] = body.decode("utf-8")
+        except UnicodeDecodeError:
+            record["body_base64"] = base64.b64encode(body).decode("ascii")
+        line = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+        member = gzip.compress(line)
+        with self._lock:
+            self._append(member)
+            self.count += 1
+
+    def hook(self, response, *args, **kwargs):
+        """
+        requests のレスポンスフック (session.hooks["response"] に追加する)
+        本文を先に読み切るので、記録中は逐次解析でもメモリを節約できない
+        """
+        if response.status_code == 304:
+            # 本文がないので再生には使えない
+            return response
+        self.write(response.url, response.status_code, response.headers, response.content)
+        return response
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+
+class TruncatedLogWarning(UserWarning):
+    """
+    記録の途中から読めなくなり、そこで読むのをやめた
+    """
+
+
+def read_log(path, strict=False):
+    """
+    記録を1件ずつ返す
+
+    途中から読めない (記録中に止まって最後の1件が書きかけ・ファイルの破損) 場合は
+    そこで終わり、TruncatedLogWarning で警告する。strict=True なら ValueError を送出する
+    """
+    count = 0
+
+    def stop(reason):
+        message = f"{path}: {count}件目より後を読めませんでした ({reason})"
+        if strict:
+            raise ValueError(message)
+        warnings.warn(message, TruncatedLogWarning, stacklevel=3)
+
+    with gzip.open(path, "rb") as f:
+        while True:
+            try:
+                line = f.readline()
+            except (EOFError, zlib.error, gzip.BadGzipFile) as e:
+                stop(str(e) or type(e).__name__)
+                return
+            if not line:
+                return
+            try:
+                record = json.loads(line)
+            except ValueError:
+                stop("JSON として読めない行")
+                return
+            if "body_base64" in record:
+                record["body"] = base64.b64decode(record.pop("body_base64"))
+            else:
+                record["body"] = record["body"].encode("utf-8")
+            count += 1
+            yield record
+
+
+# ----------------------------------------------------------------------------
+# 再生
+# ----------------------------------------------------------------------------
+def replay_path(url):
+    """
+    記録のURLから代役サーバー上のパス (/ホスト名/パス) を作る
+    """
+    parts = urlsplit(url)
+    return unquote(f"/{parts.netloc}{parts.path}")
+
+
+class ReplayLog:
+    """
+    記録をパスごとに時刻順に並べ、ある時刻に最新だった応答を引けるようにしたもの
+    """
+
+    def __init__(self, records):
+        self.routes = {}
+        for record in sorted(records, key=lambda record: record["time"]):
+            times, responses = self.routes.setdefault(replay_path(record["url"]), ([], []))
+            times.append(record["time"])
+            responses.append(record)
+        all_times = [times[0] for times, _ in self.routes.values()]
+        self.start = min(all_times, default=0.0)
+        self.end = max((times[-1] for times, _ in self.routes.values()), default=0.0)
+
+    @classmethod
+    def load(cls, path, strict=False):
+        return cls(read_log(path, strict))
+
+    def __len__(self):
+        return sum(len(times) for times, _ in self.routes.values())
+
+    def response_at(self, path, log_time):
+        """
+        path の log_time 時点で最新の応答 (それより前に記録がなければ最初の応答)
+        """
+        route = self.routes.get(path)
+        if route is None:
+            return None
+        times, responses = route
+        return responses[max(bisect_right(times, log_time) - 1, 0)]
+
+
+class ReplayClock:
+    """
+    再生を始めた時刻から speed 倍で進む記録上の時刻
+    loop=True なら記録の最後まで進んだら最初に戻る
+    """
+
+    def __init__(self, start, end, speed=1.0, loop=False, clock=time.monotonic):
+        self.start = start
+        self.end = end
+        self.speed = speed
+        self.loop = loop
+        self.clock = clock
+        self.started = clock()
+
+    def now(self):
+        elapsed = (self.clock() - self.started) * self.speed
+        duration = self.end - self.start
+        if self.loop and duration > 0:
+            elapsed %= duration
+        return self.start + elapsed
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        log, clock = self.server.log, self.server.clock
+        record = log.response_at(unquote(self.path.split("?", 1)[0]), clock.now())
+        if record is None:
+            self._send(404, {"Content-Type": "text/plain"}, b"not recorded")
+            return
+        etag = record["headers"].get("ETag")
+        if etag and self.headers.get("If-None-Match") == etag:
+            self._send(304, {"ETag": etag}, b"")
+            return
+        self._send(record["status"], record["headers"], record["body"])
+
+    def _send(self, status, headers, body):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    上流の代役をするサーバー (記録の再生やベンチマーク用)
+    """
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 運行情報の逐次解析は途中で接続を閉じるため、切断エラーは表示しない
+        pass
+
+
+def make_replay_server(log, host="127.0.0.1", port=DEFAULT_PORT, speed=1.0, loop=False):
+    """
+    記録 (ReplayLog) を配信する代役サーバーを作る (serve_forever() で動かす)
+    """
+    server = StandInServer((host, port), ReplayHandler)
+    server.log = log
+    server.clock = ReplayClock(log.start, log.end, speed, loop)
+    return server
+
+
+# ----------------------------------------------------------------------------
+# セッションへの組み込み
+# ----------------------------------------------------------------------------
+def _redirect_adapter_class():
+    from requests.adapters import HTTPAdapter
+
+    class RedirectAdapter(HTTPAdapter):
+        """
+        上流へのリクエストを代役サーバー (base_url/ホスト名/パス) に送り直す
+        応答の url は元のURLに戻すので、呼び出し側からは上流の応答に見える
+        """
+
+        def __init__(self, base_url, **kwargs):
+            super().__init__(**kwargs)
+            self.base_url = base_url.rstrip("/")
+
+        def send(self, request, **kwargs):
+            original = request.url
+            parts = urlsplit(original)
+            request.url = f"{self.base_url}/{parts.netloc}{parts.path}" + (
+                f"?{parts.query}" if parts.query else "")
+            response = super().send(request, **kwargs)
+            response.url = original
+            request.url = original
+            return response
+
+    return RedirectAdapter
+
+
+def configure_session(session, environ=os.environ, **adapter_options):
+    """
+    環境変数に従ってセッションに記録 (UPSTREAM_RECORD) と再生 (UPSTREAM_REPLAY) を組み込む
+    adapter_options は再生用の HTTPAdapter に渡す接続プールの設定
+    """
+    replay_url = environ.get(REPLAY_ENV)
+    if replay_url:
+        adapter = _redirect_adapter_class()(replay_url, **adapter_options)
+        for url in upstream_urls():
+            parts = urlsplit(url)
+            session.mount(f"{parts.scheme}://{parts.netloc}/", adapter)
+    record_path = environ.get(RECORD_ENV)
+    if record_path:
+        import atexit
+
+        recorder = UpstreamRecorder(record_path)
+        session.hooks["response"].append(recorder.hook)
+        atexit.register(recorder.close)
+        return recorder
+    return None
+
+
+# ----------------------------------------------------------------------------
+# コマンドライン
+# ----------------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="上流の応答の記録を再生・表示する")
+    commands = parser.add_subparsers(dest="command", required=True)
+    replay = commands.add_parser("replay", help="記録を配信する代役サーバーを立てる")
+    replay.add_argument("log")
+    replay.add_argument("--host", default="127.0.0.1")
+    replay.add_argument("--port", type=int, default=DEFAULT_PORT)
+    replay.add_argument("--speed", type=float, default=1.0, help="再生速度 (記録の何倍で進めるか)")
+    replay.add_argument("--loop", action="store_true", help="最後まで再生したら最初に戻る")
+    info = commands.add_parser("info", help="記録の件数と期間を表示する")
+    info.add_argument("log")
+    args = parser.parse_args()
+
+    log = ReplayLog.load(args.log)
+    if args.command == "info":
+        print(f"{len(log)}件, {log.end - log.start:.0f}秒")
+        for path, (times, _) in sorted(log.routes.items()):
+            print(f"  {path}: {len(times)}件")
+        return
+
+    server = make_replay_server(log, args.host, args.port, args.speed, args.loop)
+    print(f"http://{args.host}:{server.server_address[1]} で {len(log)}件の記録を "
+          f"{args.speed}倍で再生します (UPSTREAM_REPLAY に設定して起動)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
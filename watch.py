@@ -0,0 +1,283 @@
+"""
+常駐して表示を更新し続けるモード (--watch) と、機械可読な NDJSON 出力 (--ndjson)
+
+--watch は train_server.BoardState で遅延情報と運行情報をそれぞれの間隔で
+裏のスレッドから更新し、interval 秒ごとに表示を組み立て直して、前回から
+変わった行だけを書き換える (端末ではカーソル移動。それ以外では現在時刻の行と
+変わった行だけを追記し、現在時刻しか変わっていなければ何も出力しない)
+シャトルバスの見出しのような変わらない行は最初の1回しか書かない
+
+--ndjson は次の電車・バス・運行情報を1件1行の JSON で出力する。表示用の文字列は
+作らず、検索結果の辞書をそのまま書き出す。--watch と組み合わせると、
+内容が変わった区分 (delays / trains / buses / status) だけを出力する
+
+    python find_next_trains_hachioji.py --watch
+    python find_next_trains_hachioji.py --ndjson
+    python find_next_trains_hachioji.py --watch --ndjson | 集計処理
+
+取得処理が表示するメッセージ (エラーなど) は、端末の表示では最下行に、
+NDJSON では標準エラーに出す
+"""
+import contextlib
+import json
+import sys
+import threading
+import time
+from datetime import datetime
+
+from bus_timetable import bus_lines
+from find_next_trains_hachioji import train_lines
+from service_status import service_status_lines
+
+# -----------------------------------------------------------------------------
+# 設定
+# -----------------------------------------------------------------------------
+DEFAULT_INTERVAL = 1.0
+K = 3
+# 端末の制御シーケンス
+CLEAR_SCREEN = "\x1b[H\x1b[2J"
+CLEAR_LINE = "\x1b[K"
+
+
+def _move_to(row):
+    return f"\x1b[{row + 1};1H"
+
+
+# ----------------------------------------------------------------------------
+# NDJSON のレコード
+# ----------------------------------------------------------------------------
+def train_records(trains):
+    # 電車の "type" (快速など) はレコードの種類と重なるので train_type にする
+    return [{"type": "train", "rank": rank, "train_type": train["type"],
+             **{key: value for key, value in train.items() if key != "type"}}
+            for rank, train in enumerate(trains, 1)]
+
+
+def bus_records(buses):
+    return [{"type": "bus", "rank": rank, **bus} for rank, bus in enumerate(buses, 1)]
+
+
+def status_records(status, error=None):
+    if error is not None:
+        return [{"type": "service_status", "status": None, "detail": None, "error": str(error)}]
+    if status is None:
+        return [{"type": "service_status", "status": None, "detail": None}]
+    return [{"type": "service_status", **status}]
+
+
+def delay_records(delays, updated_at=None, error=None):
+    record = {"type": "delays", "trains": len(delays or {}),
+              "stale": bool(getattr(delays, "stale", False)),
+              "updated_at": updated_at if updated_at is not None
+              else getattr(delays, "fetched_at", None)}
+    if error is not None:
+        record["error"] = str(error)
+    return [record]
+
+
+class NdjsonWriter:
+    """
+    区分ごとのレコードのリストを1件1行の JSON で書き出す
+    only_changed=True なら前回書いたときから変わった区分だけを書く
+    """
+
+    def __init__(self, out):
+        self.out = out
+        self.last = {}
+        self.stats = {"records": 0}
+
+    def write(self, sections, now, only_changed=False):
+        stamp = now.isoformat(timespec="seconds")
+        lines = []
+        for name, records in sections.items():
+            if only_changed and self.last.get(name) == records:
+                continue
+            self.last[name] = records
+            lines.extend(json.dumps({**record, "now": stamp}, ensure_ascii=False)
+                         for record in records)
+        if lines:
+            self.out.write("\n".join(lines) + "\n")
+            self.out.flush()
+            self.stats["records"] += len(lines)
+        return len(lines)
+
+
+def print_ndjson(out=None, now=None):
+    """
+    遅延情報と運行情報を1回取得し、次の電車・バス・運行情報を NDJSON で出力する
+    """
+    from find_next_trains_hachioji import fetch_current_sources, next_k
+    from bus_timetable import next_buses
+
+    out = out or sys.stdout
+    # 取得処理のメッセージが JSON の行に混ざらないよう標準エラーに出す
+    with contextlib.redirect_stdout(sys.stderr):
+        sources, errors = fetch_current_sources()
+    now = now or datetime.now()
+    delays = sources.get("delays", {})
+    NdjsonWriter(out).write({
+        "delays": delay_records(delays, error=errors.get("delays")),
+        "trains": train_records(next_k(now, K, delays)),
+        "buses": bus_records(next_buses(now, K)),
+        "status": status_records(sources.get("status"), errors.get("status")),
+    }, now)
+
+
+# ----------------------------------------------------------------------------
+# 差分表示
+# ----------------------------------------------------------------------------
+class LineRenderer:
+    """
+    前回の表示と比べて変わった行だけを書き換える
+
+    ansi=True (端末) なら変わった行にカーソルを移して書き直し、余った行は消す
+    ansi=False (パイプ・ファイル) なら最初は全体を、それ以降は clock_rows の行
+    (現在時刻) と変わった行だけを空行で区切って追記する。clock_rows の行しか
+    変わっていなければ何も出力しない
+    """
+
+    def __init__(self, out, ansi=True, clock_rows=(0,)):
+        self.out = out
+        self.ansi = ansi
+        self.clock_rows = frozenset(clock_rows)
+        self.lines = None
+        self.stats = {"frames": 0, "lines_written": 0, "bytes": 0}
+
+    def _changed_rows(self, lines, old):
+        return [row for row, line in enumerate(lines) if row >= len(old) or old[row] != line]
+
+    def render(self, lines):
+        """
+        lines を表示し、書き直した行の数を返す
+        """
+        if lines == self.lines:
+            return 0
+        old = self.lines or []
+        if not self.ansi:
+            if self.lines is None:
+                rows = range(len(lines))
+            else:
+                rows = self._changed_rows(lines, old)
+                if len(lines) == len(old) and self.clock_rows.issuperset(rows):
+                    # 現在時刻しか変わっていない
+                    return 0
+                rows = sorted(self.clock_rows.intersection(range(len(lines))).union(rows))
+            changed = len(rows)
+            text = "".join(lines[row] + "\n" for row in rows) + "\n"
+        else:
+            parts = [CLEAR_SCREEN] if self.lines is None else []
+            changed = 0
+            for row in self._changed_rows(lines, old):
+                parts.append(f"{_move_to(row)}{lines[row]}{CLEAR_LINE}")
+                changed += 1
+            for row in range(len(lines), len(old)):
+                parts.append(f"{_move_to(row)}{CLEAR_LINE}")
+            # カーソルは表示の下に置いておく
+            parts.append(_move_to(len(lines)))
+            text = "".join(parts)
+        self.out.write(text)
+        self.out.flush()
+        self.lines = lines
+        self.stats["frames"] += 1
+        self.stats["lines_written"] += changed
+        self.stats["bytes"] += len(text)
+        return changed
+
+
+class MessageSink:
+    """
+    print() の出力を受け取り、最後の1行だけを覚えておく (sys.stdout の代わり)
+    """
+
+    def __init__(self):
+        self.last = ""
+        self._partial = ""
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        with self._lock:
+            text = self._partial + text
+            *lines, self._partial = text.split("\n")
+            for line in lines:
+                if line.strip():
+                    self.last = line.strip()
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def frame_lines(now, trains, buses, status, updated_at, message=""):
+    """
+    --watch の1画面ぶんの行のリスト
+    """
+    delays_at = updated_at.get("delays")
+    status_at = updated_at.get("status")
+    lines = [
+        f"現在時刻: {now:%Y-%m-%d %H:%M:%S}",
+        "八王子駅 (上り) の次の電車 " + (
+            f"(遅延情報 {datetime.fromtimestamp(delays_at):%H:%M:%S} 時点)" if delays_at
+            else "(遅延情報を取得中)"),
+        "-" * 50,
+    ]
+    lines += train_lines(trains)
+    lines += bus_lines(buses)
+    lines.append("-" * 50)
+    lines += service_status_lines(status) if status_at else ["運行情報を取得中..."]
+    if message:
+        lines += ["", message]
+    # 運行情報の詳細などに改行が含まれていても1行ずつ比べる
+    return [part for line in lines for part in line.split("\n")]
+
+
+# ----------------------------------------------------------------------------
+# 常駐モード
+# ----------------------------------------------------------------------------
+def run_watch(interval=DEFAULT_INTERVAL, ndjson=False, out=None, state=None,
+              clock=datetime.now, ticks=None, ansi=None, sleep=time.sleep):
+    """
+    表示を interval 秒ごとに見直し、変わった部分だけを出力し続ける (Ctrl-C で終了)
+
+    state は train_server.BoardState (省略時は作って更新スレッドを開始する)
+    ticks を指定するとその回数だけ表示して終わる
+    戻り値は使った LineRenderer / NdjsonWriter (stats に出力量を持つ)
+    """
+    out = out or sys.stdout
+    if state is None:
+        from train_server import BoardState
+
+        state = BoardState()
+    if ndjson:
+        writer = NdjsonWriter(out)
+        messages = sys.stderr
+    else:
+        writer = LineRenderer(out, out.isatty() if ansi is None else ansi)
+        messages = MessageSink()
+
+    # 更新スレッドの print() は表示を崩さないよう messages に送る
+    with contextlib.redirect_stdout(messages):
+        state.start()
+        try:
+            count = 0
+            while ticks is None or count < ticks:
+                now = clock()
+                trains = state.next_trains(now, K)
+                buses = state.next_buses(now, K)
+                if ndjson:
+                    writer.write({
+                        "delays": delay_records(state.delays, state.updated_at["delays"]),
+                        "trains": train_records(trains),
+                        "buses": bus_records(buses),
+                        "status": status_records(state.status),
+                    }, now, only_changed=True)
+                else:
+                    writer.render(frame_lines(now, trains, buses, state.status,
+                                              state.updated_at, messages.last))
+                count += 1
+                if ticks is None or count < ticks:
+                    sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            state.stop()
+    return writer